@@ -1,2 +1,4 @@
 from pdf_rag_chatbot.agents.parser_agent import ParserAgent
-from pdf_rag_chatbot.agents.response_agent import ResponseAgent
\ No newline at end of file
+from pdf_rag_chatbot.agents.response_agent import ResponseAgent
+from pdf_rag_chatbot.agents.llm import load_chat_model
+from pdf_rag_chatbot.agents.fake import FakeChatModel
@@ -0,0 +1,87 @@
+import re
+import time
+import asyncio
+from typing import Any, List, Optional
+
+import orjson
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeChatModel(BaseChatModel):
+	"""A deterministic offline stand-in for the agents' language model.
+
+	It answers the parser agent's prompt with search terms taken from the
+	question, and any other prompt with a synthetic answer of `answer_tokens`
+	words. Each reply takes `latency` seconds, plus a second per
+	`tokens_per_second` words when that is set, so load tests can model a real
+	model's timing without one.
+	"""
+
+	latency: float = 0.0
+	tokens_per_second: Optional[float] = None
+	answer_tokens: int = 50
+
+	@property
+	def _llm_type(self) -> str:
+		return "fake"
+
+	def _reply(self, messages: List[BaseMessage]) -> str:
+		system = " ".join(m.content for m in messages if isinstance(m, SystemMessage))
+		prompt = str(messages[-1].content)
+		words = _WORD.findall(prompt)
+
+		if "question parser" in system:
+			return orjson.dumps({
+				"keywords": [w.lower() for w in words if len(w) > 4][:3],
+				"phrases": [" ".join(words[:4])] if words else [],
+				"entities": [w for w in words[1:] if w[0].isupper()][:2],
+			}).decode()
+
+		return " ".join(words[i % len(words)] for i in range(self.answer_tokens)) if words else ""
+
+	def _delay(self, reply: str) -> float:
+		delay = self.latency
+		if self.tokens_per_second:
+			delay += len(reply.split()) / self.tokens_per_second
+		return delay
+
+	def _result(self, messages: List[BaseMessage], reply: str) -> ChatResult:
+		# Words stand in for tokens, so traces show token counts.
+		input_tokens = sum(len(str(m.content).split()) for m in messages)
+		output_tokens = len(reply.split())
+		message = AIMessage(
+			content=reply,
+			usage_metadata={
+				"input_tokens": input_tokens,
+				"output_tokens": output_tokens,
+				"total_tokens": input_tokens + output_tokens,
+			},
+		)
+		return ChatResult(generations=[ChatGeneration(message=message)])
+
+	def _generate(
+		self,
+		messages: List[BaseMessage],
+		stop: Optional[List[str]] = None,
+		run_manager: Any = None,
+		**kwargs: Any,
+	) -> ChatResult:
+		reply = self._reply(messages)
+		time.sleep(self._delay(reply))
+		return self._result(messages, reply)
+
+	async def _agenerate(
+		self,
+		messages: List[BaseMessage],
+		stop: Optional[List[str]] = None,
+		run_manager: Any = None,
+		**kwargs: Any,
+	) -> ChatResult:
+		reply = self._reply(messages)
+		await asyncio.sleep(self._delay(reply))
+		return self._result(messages, reply)
@@ -0,0 +1,19 @@
+from langchain_core.language_models import BaseChatModel
+
+
+def load_chat_model(model: str) -> BaseChatModel:
+	"""Load a chat model by name.
+
+	OpenAI models start with `gpt`, `fake` is an offline `FakeChatModel`, and
+	anything else is served by Ollama.
+	"""
+	if model == "fake":
+		from pdf_rag_chatbot.agents.fake import FakeChatModel
+		return FakeChatModel()
+
+	if model.startswith("gpt"):
+		from langchain_openai import ChatOpenAI
+		return ChatOpenAI(model=model)
+
+	from langchain_community.chat_models import ChatOllama
+	return ChatOllama(model=model)
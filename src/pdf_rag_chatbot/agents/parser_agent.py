@@ -5,6 +5,8 @@ from pydantic import BaseModel
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 
+from pdf_rag_chatbot.tracing import record_llm_usage
+
 
 class ParserAgent:
 	def __init__(self, llm: BaseChatModel):
@@ -27,7 +29,16 @@ class ParserAgent:
 
 	def __call__(self, question: str) -> Optional["SearchTerms"]:
 		response = self.chain.invoke({"input": question})
-		search_terms = SearchTerms(**orjson.loads(response.content))
+		record_llm_usage(response)
+		return self._parse(response.content)
+
+	async def acall(self, question: str) -> Optional["SearchTerms"]:
+		response = await self.chain.ainvoke({"input": question})
+		record_llm_usage(response)
+		return self._parse(response.content)
+
+	def _parse(self, content: str) -> Optional["SearchTerms"]:
+		search_terms = SearchTerms(**orjson.loads(content))
 		
 		if not search_terms.keywords and not search_terms.phrases and not search_terms.entities:
 			return None
@@ -1,6 +1,8 @@
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 
+from pdf_rag_chatbot.tracing import record_llm_usage
+
 
 class ResponseAgent:
 	def __init__(self, llm: BaseChatModel):
@@ -20,4 +22,10 @@ class ResponseAgent:
 
 	def __call__(self, question: str, search_results: str) -> str:
 		response = self.chain.invoke({"question": question, "search_results": search_results})
+		record_llm_usage(response)
+		return response.content
+
+	async def acall(self, question: str, search_results: str) -> str:
+		response = await self.chain.ainvoke({"question": question, "search_results": search_results})
+		record_llm_usage(response)
 		return response.content
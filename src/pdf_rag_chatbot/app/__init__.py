@@ -1 +1,4 @@
+from pdf_rag_chatbot.app.single_flight import SingleFlight
 from pdf_rag_chatbot.app.app import App
+from pdf_rag_chatbot.app.api import create_api
+from pdf_rag_chatbot.app.batch import BatchAnswerer
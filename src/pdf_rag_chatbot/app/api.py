@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from pdf_rag_chatbot.agents.parser_agent import SearchTerms
+from pdf_rag_chatbot.app.app import App
+
+
+class UploadResponse(BaseModel):
+    session_id: Optional[str]
+    files: List[str]
+
+
+class SearchRequest(BaseModel):
+    session_id: Optional[str] = None
+    queries: List[SearchTerms | str] = Field(min_length=1)
+    entity_importance: float = 0.6
+    context_size: int = 3
+
+
+class SearchResponse(BaseModel):
+    results: List[List[Dict[str, Any]]]
+
+
+class AnswerRequest(BaseModel):
+    session_id: Optional[str] = None
+    questions: List[str] = Field(min_length=1)
+
+
+class Answer(BaseModel):
+    question: str
+    answer: str
+    search_results: List[Dict[str, Any]]
+
+
+class AnswerResponse(BaseModel):
+    answers: List[Answer]
+
+
+def create_api(app: App, upload_dir: Optional[str] = None) -> FastAPI:
+    """Create a JSON HTTP API for an app.
+
+    `/api/search` and `/api/answer` take a batch of queries, whose terms are
+    encoded in a single model call and scored in a single pass over the
+    embeddings. Endpoints are synchronous, so FastAPI runs them in its thread pool.
+
+    Args:
+        app (App): The app to serve.
+        upload_dir (Optional[str], optional): Where uploaded files are kept. Defaults
+            to None, which uses a temporary directory.
+
+    Returns:
+        FastAPI: The API.
+    """
+    api = FastAPI(title="PDF RAG Chatbot")
+    upload_dir = upload_dir or tempfile.mkdtemp(prefix="pdf-rag-uploads-")
+
+    @api.post("/api/upload", response_model=UploadResponse)
+    def upload(files: List[UploadFile] = File(...), session_id: Optional[str] = Form(None)):
+        """Process uploaded files. Without a session, they are shared with every session."""
+        file_dir = tempfile.mkdtemp(dir=upload_dir)
+        paths = []
+        for file in files:
+            path = os.path.join(file_dir, os.path.basename(file.filename or "upload.pdf"))
+            with open(path, "wb") as f:
+                shutil.copyfileobj(file.file, f)
+            paths.append(path)
+
+        try:
+            for progress in app.process_files(session_id, paths):
+                logger.debug(progress)
+        except Exception as e:
+            logger.exception(e)
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return UploadResponse(session_id=session_id, files=[os.path.basename(p) for p in paths])
+
+    @api.post("/api/search", response_model=SearchResponse)
+    def search(request: SearchRequest):
+        """Search for a batch of queries. A plain string query is searched as a phrase."""
+        search_terms = [
+            SearchTerms(keywords=[], phrases=[query], entities=[]) if isinstance(query, str) else query
+            for query in request.queries
+        ]
+        results = app.search(
+            request.session_id,
+            search_terms,
+            entity_importance=request.entity_importance,
+            document_context_size=request.context_size,
+        )
+        return SearchResponse(results=[df.to_dicts() for df in results])
+
+    @api.post("/api/answer", response_model=AnswerResponse)
+    def answer(request: AnswerRequest):
+        """Answer a batch of questions."""
+        answers = app.answer(request.session_id, request.questions)
+        return AnswerResponse(answers=[
+            Answer(question=question, answer=text, search_results=search_results.to_dicts())
+            for question, (text, search_results) in zip(request.questions, answers)
+        ])
+
+    return api
@@ -1,39 +1,162 @@
+import time
 import uuid
-from typing import List, Dict, Tuple
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import timedelta
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Dict, Optional, Tuple
 
-import torch
 import duckdb
+import numpy as np
+from duckdb import DuckDBPyConnection
 import gradio as gr
 import polars as pl
-from  sentence_transformers.util import cos_sim
 from langchain_core.language_models import BaseLLM
 from loguru import logger
 
 from pdf_rag_chatbot.agents.parser_agent import SearchTerms
-from pdf_rag_chatbot.db import setup_database
+from pdf_rag_chatbot.db import (
+    setup_database,
+    warehouse,
+    touch_session,
+    expire_sessions,
+    collect_garbage,
+    EMBEDDING_MODEL,
+    get_setting,
+    text_key,
+)
+from pdf_rag_chatbot.app.single_flight import SingleFlight
 from pdf_rag_chatbot.data_pipeline import TextPipeline
+from pdf_rag_chatbot.data_pipeline.file_sync import file_content_hash
 from pdf_rag_chatbot.data_pipeline.messages import FileUploaded
+from pdf_rag_chatbot.data_pipeline.steps import (
+    Embed,
+    DEFAULT_MODEL_NAME,
+    known_document,
+    record_upload,
+)
+from pdf_rag_chatbot.jobs import JobQueue, JobStatus
+from pdf_rag_chatbot.search import ExactSearch, SQLSearch
+from pdf_rag_chatbot.tracing import NULL_SPAN, Span, Tracer, current_span, span
 from pdf_rag_chatbot.agents import (
     ParserAgent,
     ResponseAgent,
 )
 
 
+def merge_search_results(a: pl.DataFrame, b: pl.DataFrame, limit: int = 50) -> pl.DataFrame:
+    """Merge two sets of search results, keeping each result's best score."""
+    return (
+        pl.concat([a, b])
+        .group_by(["sentence_text", "surrounding_context"], maintain_order=True)
+        .agg(pl.col("relevancy_score").max())
+        .sort("relevancy_score", descending=True)
+        .head(limit)
+        .select(a.columns)
+    )
+
+
 class App:
-    def __init__(self, database: str, llm: BaseLLM):
+    def __init__(
+        self,
+        database: str,
+        llm: BaseLLM,
+        job_queue: Optional[JobQueue] = None,
+        job_timeout: float = 600.0,
+        session_ttl: Optional[timedelta] = None,
+        gc_interval: timedelta = timedelta(minutes=15),
+        embed_options: Optional[Dict[str, Any]] = None,
+        nlp_options: Optional[Dict[str, Any]] = None,
+        ingest_options: Optional[Dict[str, Any]] = None,
+        search_backend: str = "exact",
+        tracer: Optional[Tracer] = None,
+        speculative: bool = False,
+        parse_deadline: float = 10.0,
+    ):
         """Initialize the app.
 
 
         Args:
             database (str): The path to the DuckDB database file.
+            job_queue (Optional[JobQueue], optional): When given, uploaded files are
+                enqueued for `pdf-rag-worker` processes instead of being processed in
+                the app, and the warehouse is only opened for the duration of a search.
+                Defaults to None.
+            job_timeout (float, optional): Seconds to wait for queued uploads to be
+                processed. Defaults to 600.0.
+            session_ttl (Optional[timedelta], optional): How long files uploaded in a
+                session are kept after its last activity. Defaults to None, which keeps
+                them forever.
+            gc_interval (timedelta, optional): How often expired sessions are removed
+                and unreferenced data is collected. Defaults to 15 minutes.
+            embed_options (Optional[Dict[str, Any]], optional): Options passed to the
+                embedding model, such as its inference backend. Defaults to None.
+            nlp_options (Optional[Dict[str, Any]], optional): Options passed to the NLP
+                step for files uploaded in the app, such as its chunker. Defaults to None.
+            ingest_options (Optional[Dict[str, Any]], optional): Options passed to the
+                ingest step for files uploaded in the app, such as its PDF extractor.
+                Defaults to None.
+            search_backend (str, optional): `exact` scores embeddings in blocks in the
+                app, `sql` scores them inside DuckDB in a single query. Defaults to `exact`.
+            tracer (Optional[Tracer], optional): Records the stages of each chat turn.
+                Defaults to None, which doesn't trace.
+            speculative (bool, optional): Search for the question as typed while the
+                parser agent extracts search terms, then merge in the results for the
+                extracted terms. Defaults to False.
+            parse_deadline (float, optional): In speculative mode, seconds after which
+                the parser agent is no longer waited for. Defaults to 10.0.
 
         Raises:
             Exception: If the database connection fails.
         """
-        self.db = duckdb.connect(database)
-        setup_database(self.db)
+        self.database = database
+        self.job_queue = job_queue
+        self.job_timeout = job_timeout
+        self.session_ttl = session_ttl
+        self.gc_interval = gc_interval
+        self.gc_stop = threading.Event()
+        self.embed_options = embed_options or {}
+        self.search_backend = search_backend
+        self.tracer = tracer
+
+        # Identical uploads, questions and searches in flight share one computation.
+        self.upload_flight = SingleFlight()
+        self.parse_flight = SingleFlight()
+        self.search_flight = SingleFlight()
+        self.respond_flight = SingleFlight()
+
+        self.speculative = speculative
+        self.parse_deadline = parse_deadline
+        self.parse_executor = ThreadPoolExecutor(thread_name_prefix="parser") if speculative else None
+        self.exact_search = ExactSearch(k=100)
+        self.sql_search = SQLSearch(k=100, limit=50)
+
+        # The pipeline runs each file in a transaction on the app's connection,
+        # so uploads from concurrent turns and API calls take turns with it. The
+        # pipeline releases it while it waits to retry a file.
+        self.pipeline_lock = threading.Lock()
+
+        if job_queue is None:
+            self.db = duckdb.connect(database)
+            setup_database(self.db)
+
+            self.text_pipeline = TextPipeline(
+                self.db,
+                embed_options=self.embed_options,
+                nlp_options=nlp_options,
+                ingest_options=ingest_options,
+                lock=self.pipeline_lock,
+            )
+            self.embed = self.text_pipeline.embed
+        else:
+            with warehouse(database) as db:
+                setup_database(db)
+                embedding_model = get_setting(db, EMBEDDING_MODEL, DEFAULT_MODEL_NAME)
 
-        self.text_pipeline = TextPipeline(self.db)
+            self.db = None
+            self.text_pipeline = None
+            self.embed = Embed(None, model_name=embedding_model, **self.embed_options)
 
         self.llm = llm
         self.parser_agent =  ParserAgent(llm=llm)
@@ -42,8 +165,117 @@ class App:
 
     def __del__(self):
         """Close the database connection."""
-        logger.debug("Closing database connection.")
-        self.db.close()
+        self.gc_stop.set()
+        # Writes out embeddings buffered in the embedding cache.
+        self.embed.close()
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
+        if self.tracer is not None:
+            self.tracer.close()
+        if self.db is not None:
+            logger.debug("Closing database connection.")
+            self.db.close()
+
+    @contextmanager
+    def _warehouse(self) -> Iterator[DuckDBPyConnection]:
+        """Yield a connection to the warehouse for a single chat turn."""
+        if self.db is not None:
+            cursor = self.db.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        else:
+            with warehouse(self.database) as db:
+                yield db
+
+    def sync_embedding_model(self, db: DuckDBPyConnection):
+        """Switch to the warehouse's active embedding model if it has changed."""
+        model_name = get_setting(db, EMBEDDING_MODEL, DEFAULT_MODEL_NAME)
+        if model_name == self.embed.model_name:
+            return
+
+        logger.info(f"Switching embedding model from {self.embed.model_name} to {model_name}.")
+        if self.text_pipeline is not None:
+            with self.pipeline_lock:
+                self.text_pipeline.sync_embedding_model()
+            self.embed = self.text_pipeline.embed
+        else:
+            self.embed = Embed(None, model_name=model_name, **self.embed_options)
+
+    def collect_garbage(self):
+        """Expire inactive sessions and delete the data only they referred to."""
+        with self._warehouse() as db:
+            expire_sessions(db, self.session_ttl)
+            collect_garbage(db)
+
+    def _gc_loop(self):
+        while not self.gc_stop.wait(self.gc_interval.total_seconds()):
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                logger.exception(e)
+
+    def _record_shared_upload(self, req: FileUploaded):
+        # Outside of the pipeline, so a burst of identical uploads doesn't queue on its lock.
+        with self._warehouse() as db:
+            document_hash = known_document(db, req.content_hash)
+            if document_hash is not None:
+                record_upload(db, req, document_hash)
+                return
+
+        # The document is gone again, e.g. garbage collected since the first upload.
+        self.text_pipeline(req)
+
+    def process_files(self, session_id: Optional[str], files: List[str]) -> Iterator[str]:
+        """Process uploaded files, yielding progress updates.
+
+        Files are run through the pipeline in the app, or enqueued for ingest
+        workers and polled until they finish when the app has a job queue.
+        Files whose bytes were ingested before are only linked to the session.
+        """
+        # An upload is activity, so the session isn't expired while its files are processed.
+        if session_id is not None:
+            with self._warehouse() as db:
+                touch_session(db, session_id)
+
+        requests = [
+            FileUploaded(file_path=file, session_id=session_id, content_hash=file_content_hash(file))
+            for file in files
+        ]
+
+        if self.job_queue is None:
+            for req in requests:
+                # Concurrent uploads of the same bytes wait for the first to be
+                # processed, then only record their own upload.
+                _, shared = self.upload_flight.do(req.content_hash, lambda: self.text_pipeline(req))
+                if shared:
+                    self._record_shared_upload(req)
+            return
+
+        jobs = [self.job_queue.enqueue(req) for req in requests]
+        job_ids = [job.job_id for job in jobs]
+        deadline = time.monotonic() + self.job_timeout
+
+        while True:
+            jobs = self.job_queue.get_jobs(job_ids)
+            finished = [job for job in jobs if job.is_finished]
+
+            if len(finished) == len(jobs):
+                break
+
+            if time.monotonic() > deadline:
+                raise TimeoutError("Timed out waiting for uploaded files to be processed.")
+
+            yield f"📑 Processing uploaded files ({len(finished)}/{len(jobs)})..."
+            time.sleep(1.0)
+
+        failed = [job for job in jobs if job.status == JobStatus.FAILED]
+        if failed:
+            raise RuntimeError(
+                f"Failed to process {', '.join(job.file_path for job in failed)}: "
+                f"{'; '.join(job.error or '' for job in failed)}"
+            )
     
     def handle_message(
         self,
@@ -58,6 +290,9 @@ class App:
             history (List[str]): The history of messages from the user.
             files (Optional[str | List[str]], optional): The files uploaded by the user. Defaults to None.
         """
+        turn = self.tracer.start("chat_turn", session_id=session_id) if self.tracer else NULL_SPAN
+        upload = NULL_SPAN
+        error = None
         try:
             files = message.get("files", None)
             message_text = message["text"]
@@ -67,10 +302,12 @@ class App:
                 messages.append({ "role": "assistant", "text": "📑 Processing uploaded files..." })
                 yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
 
-                for file in files:
-                    self.text_pipeline(
-                        FileUploaded(file_path=file, session_id=session_id)
-                    )
+                # Uploads yield progress, so their span is ended by hand.
+                upload = turn.open("upload", files=len(files))
+                for progress in self.process_files(session_id, files):
+                    messages[-1] = { "role": "assistant", "text": progress }
+                    yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
+                upload.end()
                 messages = messages[:-1]
 
             messages.append({ "role": "user", "text": message_text })
@@ -80,29 +317,35 @@ class App:
                 yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
                 return
 
-            messages.append({"role": "assistant", "text": "🤖 Analyzing your question..."})
-            yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
-
-            search_terms = self.parser_agent(message_text)
-            logger.debug(f"Extracted search terms: {search_terms}")
+            if self.speculative:
+                messages.append({"role": "assistant", "text": "🔍 Searching through documents"})
+                yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
 
-            if search_terms is not None:
-                search_terms.phrases.append(message_text)
+                search_results = self._search_speculatively(session_id, message_text, turn).write_json()
             else:
-                search_terms = SearchTerms(keywords=[], phrases=[message_text], entities=[])
+                messages.append({"role": "assistant", "text": "🤖 Analyzing your question..."})
+                yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
 
+                with turn.child("parse"):
+                    search_terms = self.parse_question(message_text)
 
-            messages = messages[:-1]
-            messages.append({"role": "assistant", "text": "🔍 Searching through documents"})
-            yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
+                messages = messages[:-1]
+                messages.append({"role": "assistant", "text": "🔍 Searching through documents"})
+                yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
 
-            search_results = self.search_documents(session_id, search_terms)
+                with turn.child("search"):
+                    search_results = self._search(session_id, search_terms).write_json()
 
             messages = messages[:-1]
             messages.append({"role": "assistant", "text": "💬 Preparing response..."})
             yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
 
-            response = self.response_agent(message_text, search_results)
+            with turn.child("respond") as respond_span:
+                response, shared = self.respond_flight.do(
+                    (message_text, search_results),
+                    lambda: self.response_agent(message_text, search_results),
+                )
+                respond_span.set(shared=shared)
 
             messages = messages[:-1]
             messages.append({
@@ -113,11 +356,78 @@ class App:
             yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
         except Exception as e:
             logger.exception(e)
+            error = f"{type(e).__name__}: {e}"
+            upload.end(error=error)
             messages.append({
                 "role": "assistant",
                 "text": f"I seem to have encountered an error while attempting to answer your question. Please try again." 
             })
             yield {"text": "", "files": []}, messages, self.raw_history_to_chatbot(messages)
+        finally:
+            turn.end(error=error)
+
+    def _search(self, session_id: str, search_terms: SearchTerms) -> pl.DataFrame:
+        """Search for a chat turn, sharing the search with identical ones in flight."""
+        with self._warehouse() as db:
+            touch_session(db, session_id)
+            self.sync_embedding_model(db)
+            search_key = (
+                self.visible_documents_key(db, session_id),
+                self.embed.model_name,
+                search_terms.model_dump_json(),
+            )
+            search_results, shared = self.search_flight.do(
+                search_key,
+                lambda: self.search_documents_batch(session_id, [search_terms], db=db)[0],
+            )
+            current_span().set(shared=shared)
+
+        return search_results
+
+    def _search_speculatively(self, session_id: str, question: str, turn: Span) -> pl.DataFrame:
+        """Search for the question as typed while the parser agent runs.
+
+        The terms the parser extracts besides the question are searched once it
+        returns, and each result keeps its best score from either search. A parse
+        that misses the deadline, or fails, is abandoned and the question's own
+        results are used.
+        """
+        deadline = time.monotonic() + self.parse_deadline
+
+        def parse() -> SearchTerms:
+            with turn.child("parse"):
+                return self.parse_question(question)
+
+        parse_future = self.parse_executor.submit(contextvars.copy_context().run, parse)
+
+        with turn.child("search", speculative=True) as search_span:
+            search_results = self._search(
+                session_id,
+                SearchTerms(keywords=[], phrases=[question], entities=[]),
+            )
+
+            try:
+                search_terms = parse_future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logger.warning(f"Abandoned parsing a question after {self.parse_deadline}s.")
+                search_span.set(parse_abandoned=True)
+                return search_results
+            except Exception as e:
+                logger.warning(f"Parsing a question failed, using its own results: {e}")
+                search_span.set(parse_abandoned=True)
+                return search_results
+
+            extra_terms = SearchTerms(
+                keywords=search_terms.keywords,
+                phrases=[phrase for phrase in search_terms.phrases if phrase != question],
+                entities=search_terms.entities,
+            )
+            if not (extra_terms.keywords or extra_terms.phrases or extra_terms.entities):
+                return search_results
+
+            with span("merge_search"):
+                extra_results = self._search(session_id, extra_terms)
+                return merge_search_results(search_results, extra_results)
 
     def raw_history_to_chatbot(self, hist : List[Dict]) -> List[Tuple[str, str]]:
         disp_hist = []
@@ -149,7 +459,13 @@ class App:
         """
         return str(uuid.uuid4()), {"text": "", "files": []}, [], []
 
-    def launch(self, *args, **kwargs):
+    def start_gc(self):
+        """Start removing expired sessions in the background, if sessions expire."""
+        if self.session_ttl is not None:
+            threading.Thread(target=self._gc_loop, daemon=True).start()
+
+    def build_ui(self) -> gr.Blocks:
+        """Build the Gradio chat UI."""
         with gr.Blocks() as app:
             session_id = gr.State(str(uuid.uuid4()))
             raw_history = gr.State([])
@@ -168,140 +484,317 @@ class App:
             clear.click(self.clear_history, [], [session_id, msg, raw_history, chatbot])
             msg.submit(self.handle_message, [session_id, msg, raw_history], [msg, raw_history, chatbot])
 
-        app.launch(*args, **kwargs)
+        return app
+
+    def launch(self, *args, **kwargs):
+        self.start_gc()
+        self.build_ui().launch(*args, **kwargs)
+
+    def parse_question(self, question: str) -> SearchTerms:
+        """Extract the search terms of a question, which always include the question itself."""
+        search_terms, shared = self.parse_flight.do(question, lambda: self.parser_agent(question))
+        current_span().set(shared=shared)
+        logger.debug(f"Extracted search terms: {search_terms}")
+
+        if search_terms is None:
+            return SearchTerms(keywords=[], phrases=[question], entities=[])
+
+        # Parses may be shared, so the result is copied rather than changed.
+        return SearchTerms(
+            keywords=list(search_terms.keywords),
+            phrases=[*search_terms.phrases, question],
+            entities=list(search_terms.entities),
+        )
+
+    def visible_documents_key(self, db: DuckDBPyConnection, session_id: Optional[str]) -> str:
+        """A digest of the set of documents a session can search.
+
+        Sessions with the same key get the same search results for the same terms.
+        """
+        return db.execute(
+            """--sql
+                SELECT md5(COALESCE(STRING_AGG(hex(document_hash), ',' ORDER BY document_hash), ''))
+                FROM (
+                    SELECT DISTINCT document_hash FROM uploaded_file
+                    WHERE
+                        session_id = ?
+                        OR session_id IS NULL
+                )
+            """,
+            (session_id,),
+        ).fetchone()[0]
+
+    def search(
+        self,
+        session_id: Optional[str],
+        search_terms: List[SearchTerms],
+        entity_importance: float = 0.6,
+        document_context_size: int = 3,
+    ) -> List[pl.DataFrame]:
+        """Search the documents visible to a session for a batch of questions.
+
+        Args:
+            session_id (Optional[str]): The session, or None to only search files
+                that are shared with every session.
+            search_terms (List[SearchTerms]): The search terms of each question.
+            entity_importance (float, optional): The weight of entity matches against
+                keyword and phrase matches. Defaults to 0.6.
+            document_context_size (int, optional): Sentences of context around each
+                result. Defaults to 3.
+
+        Returns:
+            List[pl.DataFrame]: The results of each question.
+        """
+        with self._warehouse() as db:
+            if session_id is not None:
+                touch_session(db, session_id)
+            self.sync_embedding_model(db)
+            return self.search_documents_batch(
+                session_id,
+                search_terms,
+                entity_importance,
+                document_context_size,
+                db=db,
+            )
+
+    def answer(self, session_id: Optional[str], questions: List[str]) -> List[Tuple[str, pl.DataFrame]]:
+        """Answer a batch of questions, searching for all of them at once.
+
+        Returns:
+            List[Tuple[str, pl.DataFrame]]: The answer to each question and the search
+                results it was based on.
+        """
+        search_terms = [self.parse_question(question) for question in questions]
+        results = self.search(session_id, search_terms)
+
+        return [
+            (self.response_agent(question, search_results.write_json()), search_results)
+            for question, search_results in zip(questions, results)
+        ]
 
     def search_documents(
             self,
             session_id: str,
             search_terms: SearchTerms,
             entity_importance: float = 0.6,
-            document_context_size: int = 3
+            document_context_size: int = 3,
+            db: Optional[DuckDBPyConnection] = None,
         ):
-        sentences_df = None
+        return self.search_documents_batch(
+            session_id,
+            [search_terms],
+            entity_importance,
+            document_context_size,
+            db=db,
+        )[0].write_json()
+
+    def search_documents_batch(
+            self,
+            session_id: Optional[str],
+            search_terms: List[SearchTerms],
+            entity_importance: float = 0.6,
+            document_context_size: int = 3,
+            db: Optional[DuckDBPyConnection] = None,
+        ) -> List[pl.DataFrame]:
+        """Score a batch of searches together.
 
-        if search_terms.keywords or search_terms.phrases:
-            term_embeddings = self.text_pipeline.embed.model.encode(
-                search_terms.keywords + search_terms.phrases,
-                convert_to_tensor=True
-            ).to(self.text_pipeline.embed.device)
+        The terms of every search are encoded in a single model call, and the
+        embeddings are scanned once for all of them.
+        """
+        if db is None:
+            db = self.db
+
+        # The model may be switched by another turn while this one searches.
+        embed = self.embed
+
+        texts = list(dict.fromkeys(
+            term
+            for terms in search_terms
+            for term in terms.keywords + terms.phrases + terms.entities
+        ))
+        dim = embed.model.get_sentence_embedding_dimension()
+        with span("encode", texts=len(texts)):
+            if texts:
+                encoded = embed.model.encode(texts, convert_to_numpy=True)
+            else:
+                encoded = np.empty((0, dim), dtype=np.float32)
+        row_of = {text: i for i, text in enumerate(texts)}
+
+        def embeddings_of(terms: List[str]) -> np.ndarray:
+            return encoded[[row_of[term] for term in terms]].reshape(len(terms), dim)
+
+        term_embeddings = [embeddings_of(terms.keywords + terms.phrases) for terms in search_terms]
+        entity_embeddings = [embeddings_of(terms.entities) for terms in search_terms]
+
+        if self.search_backend == "sql":
+            results = []
+            for terms, term_group, entity_group in zip(search_terms, term_embeddings, entity_embeddings):
+                with span("sql_search") as s:
+                    search_results = self.sql_search.search(
+                        db,
+                        session_id,
+                        embed.model_name,
+                        term_embeddings=term_group,
+                        entity_embeddings=entity_group,
+                        exact_entities=[text_key(term.lower()) for term in terms.entities],
+                        entity_importance=entity_importance,
+                        context_size=document_context_size,
+                    )
+                    s.set(rows=len(search_results))
+                logger.debug(f"Search results: {search_results}")
+                results.append(search_results)
+            return results
+
+        sentence_matches = [None] * len(search_terms)
+        entity_matches = [None] * len(search_terms)
+
+        if any(len(group) for group in term_embeddings):
+            with span("vector_scan"):
+                sentence_matches = self.exact_search.search_warehouse_many(
+                    db,
+                    term_embeddings,
+                    """--sql
+                        SELECT
+                            cased_text_hash,
+                            embedding
+                        FROM text_embedding
+                        WHERE
+                            cased_text_hash IN (
+                                SELECT DISTINCT
+                                    cased_text_hash
+                                FROM retrieval_unit ru
+                                JOIN uploaded_file uf USING(document_hash)
+                                WHERE
+                                    session_id = ?
+                                    OR session_id IS NULL
+                            )
+                            AND model_name = ?
+                    """,
+                    (session_id, embed.model_name),
+                )
 
-            sentences_df = self.db.execute(
-                """--sql
-                    SELECT
-                        cased_text_hash as cased_sentence_hash,
-                        embedding
-                    FROM text_embedding
-                    WHERE
-                        cased_text_hash IN (
-                            SELECT DISTINCT
-                                cased_sentence_hash
-                            FROM document_sentence ds
-                            JOIN uploaded_file uf USING(document_hash)
-                            WHERE
-                                session_id = ?
-                                OR session_id IS NULL
-                        )
-                        AND model_name = ?
-                """,
-                (session_id, self.text_pipeline.embed.model_name)
-            ).pl()
+        if any(len(group) for group in entity_embeddings):
+            with span("entity_scan"):
+                entity_matches = self.exact_search.search_warehouse_many(
+                    db,
+                    entity_embeddings,
+                    """--sql
+                        SELECT
+                            cased_text_hash as cased_entity_hash,
+                            embedding
+                        FROM text_embedding
+                        WHERE
+                            cased_text_hash IN (
+                                SELECT DISTINCT
+                                    cased_entity_hash
+                                FROM entity_index ei
+                                JOIN uploaded_file uf USING(document_hash)
+                                WHERE
+                                    session_id = ?
+                                    OR session_id IS NULL
+                            )
+                            AND model_name = ?
+                    """,
+                    (session_id, embed.model_name),
+                )
 
-            sentence_embeddings = (
-                torch.tensor(sentences_df["embedding"].to_list())
-                .to(self.text_pipeline.embed.device)
+        return [
+            self._rank_sentences(
+                db,
+                session_id,
+                terms,
+                sentence_match if terms.keywords or terms.phrases else None,
+                entity_match if terms.entities else None,
+                entity_importance,
+                document_context_size,
             )
-            sentences_df = sentences_df.drop("embedding")
-            cos_scores = cos_sim(term_embeddings, sentence_embeddings)
+            for terms, sentence_match, entity_match in zip(search_terms, sentence_matches, entity_matches)
+        ]
 
-            cos_scores = cos_scores.cpu().numpy()
-            sentences_df = (
-                sentences_df.with_columns(
-                    score=cos_scores.max(axis=0)
-                )
-                .sort(by="score", descending=True)
-                .slice(0, 100)
+    def _rank_sentences(
+            self,
+            db: DuckDBPyConnection,
+            session_id: Optional[str],
+            search_terms: SearchTerms,
+            sentence_match: Optional[Tuple[List[bytes], np.ndarray]],
+            entity_match: Optional[Tuple[List[bytes], np.ndarray]],
+            entity_importance: float,
+            document_context_size: int,
+        ) -> pl.DataFrame:
+        sentences_df = pl.DataFrame(
+            schema={"cased_text_hash": pl.Binary, "score": pl.Float32},
+        )
+
+        if sentence_match is not None:
+            keys, scores = sentence_match
+            sentences_df = pl.DataFrame(
+                {"cased_text_hash": keys, "score": scores},
+                schema={"cased_text_hash": pl.Binary, "score": pl.Float32},
             )
 
             logger.debug(f"Sentences: {sentences_df}")
 
-            del term_embeddings
-            del sentence_embeddings
-            del cos_scores
+        if entity_match is not None:
+            keys, scores = entity_match
+            entities_df = pl.DataFrame(
+                {"cased_entity_hash": keys, "entity_score": scores},
+                schema={"cased_entity_hash": pl.Binary, "entity_score": pl.Float32},
+            )
+            logger.debug(f"Entities: {entities_df}")
+
+            # Entities that match a term exactly, ignoring case, score as highly as they can.
+            exact_df = pl.DataFrame(
+                {"uncased_entity_hash": [text_key(term.lower()) for term in search_terms.entities]},
+                schema={"uncased_entity_hash": pl.Binary},
+            )
 
-        if search_terms.entities:
-            term_embeddings = self.text_pipeline.embed.model.encode(
-                search_terms.entities,
-                convert_to_tensor=True
-            ).to(self.text_pipeline.embed.device)
-            entities_df = self.db.execute(
-                """--sql
-                    SELECT
-                        cased_text_hash as cased_entity_hash,
-                        embedding
-                    FROM text_embedding
-                    WHERE
-                        cased_text_hash IN (
-                            SELECT DISTINCT
-                                cased_entity_hash
-                            FROM document_entity de
-                            JOIN uploaded_file uf USING(document_hash)
+            with span("entity_fusion") as s:
+                # Only units of documents the session can see compete for the top results.
+                entity_sentence_df = db.execute(
+                    """--sql
+                        WITH visible_document AS (
+                            SELECT DISTINCT document_hash
+                            FROM uploaded_file
                             WHERE
-                                session_id = ?
+                                session_id = $session_id
                                 OR session_id IS NULL
                         )
-                        AND model_name = ?
-                """,
-                (session_id, self.text_pipeline.embed.model_name)
-            ).pl()
-            entity_embeddings = (
-                torch.tensor(entities_df["embedding"].to_list())
-                .to(self.text_pipeline.embed.device)
-            )
-            entities_df = entities_df.drop("embedding")
-            cos_scores = cos_sim(term_embeddings, entity_embeddings)
-            cos_scores = cos_scores.cpu().numpy()
-            entities_df = (
-                entities_df.with_columns(
-                    entity_score=cos_scores.max(axis=0)
-                )
-                .sort(by="entity_score", descending=True)
-                .slice(0, 100)
-            )
-            logger.debug(f"Entities: {entities_df}")
-            del term_embeddings
-            del entity_embeddings
-            del cos_scores
-
-            entity_sentence_df = self.db.execute(
-                """--sql
-                    SELECT
-                        cased_sentence_hash,
-                        MAX(entity_score) AS score
-                    FROM entities_df
-                    JOIN document_entity de USING(cased_entity_hash)
-                    JOIN document_sentence ds
-                        ON de.document_hash = ds.document_hash
-                        AND de.sentence_index = ds.index
-                    GROUP BY cased_sentence_hash
-                """,
-            ).pl()
+                        SELECT
+                            cased_text_hash,
+                            MAX(score) AS score
+                        FROM (
+                            SELECT ei.cased_text_hash, e.entity_score AS score
+                            FROM entities_df e
+                            JOIN entity_index ei USING(cased_entity_hash)
+                            WHERE ei.document_hash IN (FROM visible_document)
+                            UNION ALL
+                            SELECT ei.cased_text_hash, 1.0 AS score
+                            FROM exact_df
+                            JOIN entity_index ei USING(uncased_entity_hash)
+                            WHERE ei.document_hash IN (FROM visible_document)
+                        )
+                        GROUP BY cased_text_hash
+                    """,
+                    {"session_id": session_id},
+                ).pl()
+                s.set(rows=len(entity_sentence_df))
 
-            if sentences_df is None:
+            if sentence_match is None:
                 sentences_df = entity_sentence_df
             else:
                 # merge sentence scores
                 sentences_df = (
                     sentences_df.select(
-                        "cased_sentence_hash",
+                        "cased_text_hash",
                         pl.col("score").alias("score_a")
                     )
                     .join(
                         entity_sentence_df.select(
-                            "cased_sentence_hash",
+                            "cased_text_hash",
                             pl.col("score").alias("score_b")
                         )
                         .unique(),
-                        on="cased_sentence_hash",
+                        on="cased_text_hash",
                         how="outer"
                     )
                     .fill_null(strategy="zero")
@@ -318,38 +811,39 @@ class App:
         sentences_df = sentences_df.sort(by="score", descending=True).slice(0, 50)
 
 
-        search_results = self.db.execute(
-            """--sql
-                SELECT DISTINCT
-                    -- document_hash,
-                    -- cased_sentence_hash,
-                    text AS sentence_text,
-                    score AS relevancy_score,
-                    -- "index" AS sentence_index,
-                    (
-                        SELECT
-                            STRING_AGG(text, ' ' ORDER BY "index") AS text
-                        FROM document_sentence ds_inner
-                        WHERE
-                            ds_inner.document_hash = ds.document_hash
-                            AND ds_inner."index" BETWEEN ds."index" - $ctx_size AND ds."index" + $ctx_size
-                    ) AS surrounding_context
-                FROM document_sentence ds
-                JOIN sentences_df USING(cased_sentence_hash)
-                JOIN uploaded_file uf USING(document_hash)
-                WHERE
-                    session_id = $session_id
-                    OR session_id IS NULL
-                ORDER BY score DESC
-            """,
-            {
-                "session_id": session_id,
-                "ctx_size": document_context_size
-            }
-        ).pl()
+        with span("context_query", candidates=len(sentences_df)) as s:
+            search_results = db.execute(
+                """--sql
+                    SELECT DISTINCT
+                        -- document_hash,
+                        -- cased_sentence_hash,
+                        text AS sentence_text,
+                        score AS relevancy_score,
+                        -- "index" AS sentence_index,
+                        (
+                            SELECT
+                                STRING_AGG(s.text, ' ' ORDER BY ds_inner."index") AS text
+                            FROM document_sentence ds_inner
+                            JOIN sentence s USING (cased_sentence_hash)
+                            WHERE
+                                ds_inner.document_hash = ru.document_hash
+                                AND ds_inner."index" BETWEEN ru.start_sentence_index - $ctx_size AND ru.end_sentence_index + $ctx_size
+                        ) AS surrounding_context
+                    FROM retrieval_unit ru
+                    JOIN sentences_df USING(cased_text_hash)
+                    JOIN uploaded_file uf USING(document_hash)
+                    WHERE
+                        session_id = $session_id
+                        OR session_id IS NULL
+                    ORDER BY score DESC
+                """,
+                {
+                    "session_id": session_id,
+                    "ctx_size": document_context_size
+                }
+            ).pl()
+            s.set(rows=len(search_results))
 
         logger.debug(f"Search results: {search_results}")
 
-        return search_results.write_json()
-
-
+        return search_results
@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+import orjson
+from loguru import logger
+
+from pdf_rag_chatbot.agents.parser_agent import SearchTerms
+from pdf_rag_chatbot.app.app import App
+
+
+T = TypeVar("T")
+
+
+class BatchAnswerer:
+    def __init__(
+        self,
+        app: App,
+        batch_size: int = 256,
+        max_concurrency: int = 16,
+        session_id: Optional[str] = None,
+    ):
+        """Answer a file of questions with bounded concurrency.
+
+        Questions are handled in batches. The parser and response agents are
+        called concurrently within a batch, and the whole batch is searched in a
+        single pass over the embeddings.
+
+        Args:
+            app (App): The app whose warehouse and agents answer the questions.
+            batch_size (int, optional): Questions searched together. Defaults to 256.
+            max_concurrency (int, optional): LLM calls in flight at once. Defaults to 16.
+            session_id (Optional[str], optional): The session whose files are searched,
+                besides shared ones. Defaults to None, which only searches shared files.
+        """
+        self.app = app
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.session_id = session_id
+
+    def run(self, input_path: str, output_path: str, resume: bool = False) -> int:
+        """Answer the questions of a JSONL file, appending a record per question to another.
+
+        Each input line holds a `question` and optionally an `id`, which defaults
+        to the line number. Each output record holds the answer, the search terms,
+        the retrieved context and the seconds spent in each stage. Records are
+        written a batch at a time, so an interrupted run keeps its finished batches.
+
+        Args:
+            input_path (str): The questions.
+            output_path (str): Where answers are written.
+            resume (bool, optional): Skip questions whose ids are already in the output.
+                Defaults to False, which overwrites the output.
+
+        Returns:
+            int: The number of questions answered.
+        """
+        with open(input_path, "rb") as f:
+            questions = [
+                {"id": i, **orjson.loads(line)}
+                for i, line in enumerate(f)
+                if line.strip()
+            ]
+
+        done: Set[Any] = set()
+        if resume and os.path.exists(output_path):
+            with open(output_path, "rb") as f:
+                done = {orjson.loads(line)["id"] for line in f if line.strip()}
+            questions = [q for q in questions if q["id"] not in done]
+
+        logger.info(f"Answering {len(questions)} questions, {len(done)} already answered.")
+
+        return asyncio.run(self._run(questions, output_path, "ab" if resume else "wb"))
+
+    async def _run(self, questions: List[Dict[str, Any]], output_path: str, mode: str) -> int:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        answered = 0
+
+        with open(output_path, mode) as f:
+            for start in range(0, len(questions), self.batch_size):
+                batch = questions[start:start + self.batch_size]
+                records = await self.answer_batch(batch, semaphore)
+
+                f.write(b"".join(orjson.dumps(record) + b"\n" for record in records))
+                f.flush()
+
+                answered += len(records)
+                logger.info(f"Answered {answered}/{len(questions)} questions.")
+
+        return answered
+
+    async def answer_batch(
+        self,
+        questions: List[Dict[str, Any]],
+        semaphore: asyncio.Semaphore,
+    ) -> List[Dict[str, Any]]:
+        """Answer a batch of questions, returning a record per question."""
+        texts = [q["question"] for q in questions]
+
+        parsed = await asyncio.gather(*(
+            self._timed(semaphore, self.app.parser_agent.acall, text) for text in texts
+        ))
+        search_terms = []
+        for text, (terms, _, error) in zip(texts, parsed):
+            if terms is None:
+                if error is not None:
+                    logger.warning(f"Failed to parse {text!r}, searching for it as is: {error}")
+                terms = SearchTerms(keywords=[], phrases=[], entities=[])
+            terms.phrases.append(text)
+            search_terms.append(terms)
+
+        search_start = time.perf_counter()
+        results = await asyncio.to_thread(self.app.search, self.session_id, search_terms)
+        search_seconds = time.perf_counter() - search_start
+
+        responses = await asyncio.gather(*(
+            self._timed(semaphore, self.app.response_agent.acall, text, df.write_json())
+            for text, df in zip(texts, results)
+        ))
+
+        records = []
+        for question, terms, df, (_, parse_seconds, parse_error), (answer, respond_seconds, respond_error) in zip(
+            questions, search_terms, results, parsed, responses
+        ):
+            records.append({
+                **question,
+                "answer": answer,
+                "error": respond_error or parse_error,
+                "search_terms": terms.model_dump(),
+                "context": df.to_dicts(),
+                "timings": {
+                    "parse": parse_seconds,
+                    # Searches are batched, so each question reports its batch's time.
+                    "search_batch": search_seconds,
+                    "respond": respond_seconds,
+                },
+            })
+
+        return records
+
+    async def _timed(
+        self,
+        semaphore: asyncio.Semaphore,
+        call: Callable[..., Awaitable[T]],
+        *args: Any,
+    ) -> Tuple[Optional[T], float, Optional[str]]:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return await call(*args), time.perf_counter() - start, None
+            except Exception as e:
+                return None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
@@ -0,0 +1,5 @@
+from pdf_rag_chatbot.benchmarks.embedding import benchmark_embedding
+from pdf_rag_chatbot.benchmarks.chunking import benchmark_chunking
+from pdf_rag_chatbot.benchmarks.extraction import benchmark_extraction
+from pdf_rag_chatbot.benchmarks.search import benchmark_search
+from pdf_rag_chatbot.benchmarks.loadtest import run_load_test
@@ -0,0 +1,112 @@
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from pdf_rag_chatbot.data_pipeline.steps import Embed, DEFAULT_MODEL_NAME
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def benchmark_embedding(
+    texts: List[str],
+    backends: List[str],
+    model_name: str = DEFAULT_MODEL_NAME,
+    num_threads: Optional[int] = None,
+    batch_size: int = 64,
+    num_queries: int = 20,
+    top_k: int = 10,
+    worker_counts: Optional[List[int]] = None,
+) -> List[Dict]:
+    """Measure embedding throughput and score parity for each backend.
+
+    The baseline is the pipeline's original path: the PyTorch model embedding
+    one text per call. Every backend is then run on the same texts in
+    length-sorted batches. Parity compares each backend's vectors, and the
+    similarity scores of the first `num_queries` texts against all texts, with
+    the baseline's.
+
+    Args:
+        texts (List[str]): The texts to embed.
+        backends (List[str]): The backends to compare, see `Embed`.
+        model_name (str, optional): The embedding model.
+        num_threads (Optional[int], optional): Threads used for CPU inference. Defaults to None.
+        batch_size (int, optional): The batch size for the model. Defaults to 64.
+        num_queries (int, optional): The number of texts used as search queries. Defaults to 20.
+        top_k (int, optional): The number of results compared for search parity. Defaults to 10.
+        worker_counts (Optional[List[int]], optional): Also run each backend with a pool
+            of this many worker processes, with `num_threads` threads each. Defaults to None.
+
+    Returns:
+        List[Dict]: One row of results per run.
+    """
+    baseline_embed = Embed(None, model_name=model_name, num_threads=num_threads)
+    baseline_embed.encode(texts[:batch_size])
+
+    started_at = time.perf_counter()
+    baseline = np.vstack([baseline_embed.model.encode([text]) for text in texts])
+    baseline_seconds = time.perf_counter() - started_at
+    del baseline_embed
+
+    baseline = _normalize(baseline)
+    queries = baseline[:num_queries]
+    baseline_scores = queries @ baseline.T
+    baseline_top_k = np.argsort(-baseline_scores, axis=1)[:, :top_k]
+
+    results = [{
+        "backend": "torch (one text per call)",
+        "seconds": baseline_seconds,
+        "texts_per_second": len(texts) / baseline_seconds,
+        "speedup": 1.0,
+        "min_vector_similarity": 1.0,
+        "max_score_difference": 0.0,
+        "top_k_overlap": 1.0,
+    }]
+
+    runs = [(backend, 0) for backend in backends]
+    runs += [(backend, n) for backend in backends for n in worker_counts or []]
+
+    for backend, num_workers in runs:
+        name = f"{backend} (batched)" if num_workers == 0 else f"{backend} ({num_workers} workers)"
+        logger.info(f"Benchmarking {name}.")
+
+        embed = Embed(
+            None,
+            model_name=model_name,
+            backend=backend,
+            num_threads=num_threads,
+            batch_size=batch_size,
+            num_workers=num_workers,
+        )
+        # Warm up every worker before timing.
+        embed.encode(texts[:batch_size * max(1, num_workers)])
+
+        started_at = time.perf_counter()
+        embeddings = embed.encode(texts)
+        seconds = time.perf_counter() - started_at
+        embed.close()
+        del embed
+
+        embeddings = _normalize(embeddings)
+        scores = embeddings[:num_queries] @ embeddings.T
+        top_k_indices = np.argsort(-scores, axis=1)[:, :top_k]
+        overlap = np.mean([
+            len(set(a) & set(b)) / top_k
+            for a, b in zip(top_k_indices, baseline_top_k)
+        ])
+
+        results.append({
+            "backend": name,
+            "seconds": seconds,
+            "texts_per_second": len(texts) / seconds,
+            "speedup": baseline_seconds / seconds,
+            "min_vector_similarity": float(np.min(np.sum(embeddings * baseline, axis=1))),
+            "max_score_difference": float(np.max(np.abs(scores - baseline_scores))),
+            "top_k_overlap": float(overlap),
+        })
+
+    return results
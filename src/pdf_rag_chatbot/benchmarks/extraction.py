@@ -0,0 +1,69 @@
+import time
+from typing import Dict, List
+
+from loguru import logger
+
+from pdf_rag_chatbot.data_pipeline.extractors import get_extractor, looks_garbled
+
+
+def _word_overlap(text: str, reference: str) -> float:
+    words, reference_words = set(text.split()), set(reference.split())
+    return len(words & reference_words) / max(1, len(words | reference_words))
+
+
+def benchmark_extraction(files: List[str], extractors: List[str]) -> List[Dict]:
+    """Measure PDF extraction speed, and how close each extractor's text is to pdfminer's.
+
+    The baseline is pdfminer with full layout analysis, the ingest step's
+    default. Word overlap is the Jaccard similarity of each file's set of words
+    with the baseline's, averaged over files.
+
+    Args:
+        files (List[str]): The PDF files.
+        extractors (List[str]): The extractors to compare, see `get_extractor`.
+
+    Returns:
+        List[Dict]: One row of results per extractor.
+    """
+    def run(name: str):
+        extractor = get_extractor(name)
+        texts, num_pages, garbled = [], 0, 0
+
+        started_at = time.perf_counter()
+        for file in files:
+            text, pages = extractor.extract(file)
+            texts.append(text)
+            num_pages += pages
+            garbled += looks_garbled(text, pages)
+
+        return texts, num_pages, garbled, time.perf_counter() - started_at
+
+    logger.info("Benchmarking layout.")
+    baseline, num_pages, garbled, baseline_seconds = run("layout")
+
+    results = [{
+        "extractor": "layout",
+        "seconds": baseline_seconds,
+        "pages_per_second": num_pages / baseline_seconds,
+        "speedup": 1.0,
+        "garbled_files": garbled,
+        "word_overlap": 1.0,
+    }]
+
+    for name in extractors:
+        if name == "layout":
+            continue
+
+        logger.info(f"Benchmarking {name}.")
+        texts, num_pages, garbled, seconds = run(name)
+
+        results.append({
+            "extractor": name,
+            "seconds": seconds,
+            "pages_per_second": num_pages / seconds,
+            "speedup": baseline_seconds / seconds,
+            "garbled_files": garbled,
+            "word_overlap": sum(map(_word_overlap, texts, baseline)) / max(1, len(files)),
+        })
+
+    return results
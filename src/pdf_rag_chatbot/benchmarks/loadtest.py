@@ -0,0 +1,132 @@
+import time
+import uuid
+import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+if TYPE_CHECKING:
+    from pdf_rag_chatbot.app import App
+
+
+# The stage a chat turn is in, by the first character of its status message.
+_STAGES = {
+    "📑": "upload",
+    "🤖": "parse",
+    "🔍": "search",
+    "💬": "respond",
+}
+
+_ERROR_REPLY = "I seem to have encountered an error"
+
+
+def _run_turn(
+    app: "App",
+    session_id: str,
+    question: str,
+    files: List[str],
+    history: List[Dict],
+) -> Tuple[Dict[str, float], bool, List[Dict]]:
+    """Run one chat turn, timing each stage by the status messages it yields."""
+    timings: Dict[str, float] = defaultdict(float)
+    stage: Optional[str] = None
+
+    started_at = last = time.perf_counter()
+    for _, history, _ in app.handle_message(session_id, {"text": question, "files": files}, history):
+        now = time.perf_counter()
+        if stage is not None:
+            timings[stage] += now - last
+
+        status = history[-1]["text"] if history and history[-1]["role"] == "assistant" else ""
+        stage = _STAGES.get(status[:1])
+        last = now
+
+    timings["overall"] = time.perf_counter() - started_at
+    failed = bool(history) and history[-1]["text"].startswith(_ERROR_REPLY)
+
+    return timings, failed, history
+
+
+def run_load_test(
+    app: "App",
+    questions: List[str],
+    sessions: int = 8,
+    turns: int = 5,
+    files: Optional[List[str]] = None,
+    think_time: float = 0.0,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Simulate concurrent chat sessions against an app.
+
+    Each session runs in its own thread, as Gradio runs handlers, and sends
+    `turns` questions one after another through `App.handle_message`. Its first
+    turn also uploads `files`. With a `FakeChatModel`, the test needs no network
+    and the LLM's share of each turn is known.
+
+    Args:
+        app (App): The app under test.
+        questions (List[str]): Questions are drawn from these.
+        sessions (int, optional): Concurrent sessions. Defaults to 8.
+        turns (int, optional): Questions per session. Defaults to 5.
+        files (Optional[List[str]], optional): Files each session uploads. Defaults to None.
+        think_time (float, optional): Seconds a session waits between turns. Defaults to 0.0.
+        seed (int, optional): Seeds the choice of questions. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: Latency percentiles per stage under `stages`, the number of
+            `turns` and failed turns under `errors`, and `turns_per_second`.
+    """
+    def run_session(i: int):
+        rng = random.Random(seed + i)
+        session_id = str(uuid.uuid4())
+        history: List[Dict] = []
+        results = []
+
+        for turn in range(turns):
+            if turn and think_time:
+                time.sleep(think_time)
+            timings, failed, history = _run_turn(
+                app,
+                session_id,
+                rng.choice(questions),
+                list(files or []) if turn == 0 else [],
+                history,
+            )
+            results.append((timings, failed))
+
+        return results
+
+    logger.info(f"Running {sessions} sessions of {turns} turns.")
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = [r for session in pool.map(run_session, range(sessions)) for r in session]
+    seconds = time.perf_counter() - started_at
+
+    samples: Dict[str, List[float]] = defaultdict(list)
+    for timings, _ in results:
+        for stage, value in timings.items():
+            samples[stage].append(value)
+
+    stages = []
+    for stage in [*_STAGES.values(), "overall"]:
+        if not samples[stage]:
+            continue
+        p50, p95, p99 = np.percentile(samples[stage], [50, 95, 99])
+        stages.append({
+            "stage": stage,
+            "count": len(samples[stage]),
+            "p50_ms": 1000 * p50,
+            "p95_ms": 1000 * p95,
+            "p99_ms": 1000 * p99,
+            "max_ms": 1000 * max(samples[stage]),
+        })
+
+    return {
+        "stages": stages,
+        "turns": len(results),
+        "errors": sum(failed for _, failed in results),
+        "turns_per_second": len(results) / seconds,
+    }
@@ -0,0 +1,113 @@
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from duckdb import DuckDBPyConnection
+
+from pdf_rag_chatbot.search import ExactSearch, SQLSearch, normalize
+
+
+def _full_sort_search(queries: np.ndarray, embeddings: np.ndarray, k: int) -> np.ndarray:
+    # The original path: the whole terms × corpus matrix, then a full sort.
+    scores = (normalize(embeddings) @ normalize(queries).T).max(axis=1)
+    return np.argsort(-scores, kind="stable")[:k]
+
+
+def benchmark_search(
+    embeddings: np.ndarray,
+    num_queries: int = 20,
+    terms_per_query: int = 3,
+    k: int = 100,
+    block_sizes: List[int] = [4096, 16384, 65536],
+    seed: int = 0,
+    keys: Optional[List[Any]] = None,
+    db: Optional[DuckDBPyConnection] = None,
+    model_name: Optional[str] = None,
+) -> List[Dict]:
+    """Measure exact search time and peak memory, scoring the corpus at once or in blocks.
+
+    Queries are corpus vectors with noise added, a few per query like the
+    search terms of a question. Peak memory is what the search allocates on
+    top of the corpus itself.
+
+    Args:
+        embeddings (np.ndarray): The corpus, one row per text.
+        num_queries (int, optional): The number of searches. Defaults to 20.
+        terms_per_query (int, optional): Query vectors per search. Defaults to 3.
+        k (int, optional): The number of results per search. Defaults to 100.
+        block_sizes (List[int], optional): The block sizes to compare.
+        seed (int, optional): Seeds the choice of queries. Defaults to 0.
+        keys (Optional[List[Any]], optional): The text hash of each row of `embeddings`,
+            when they come from a warehouse. Defaults to None.
+        db (Optional[DuckDBPyConnection], optional): The warehouse, to also score the
+            embeddings of `model_name` inside DuckDB. Its peak memory isn't measured.
+            Defaults to None.
+        model_name (Optional[str], optional): The embedding model of `embeddings`.
+
+    Returns:
+        List[Dict]: One row of results per run.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = [
+        embeddings[rng.integers(0, len(embeddings), terms_per_query)]
+        + rng.normal(scale=0.05, size=(terms_per_query, embeddings.shape[1])).astype(np.float32)
+        for _ in range(num_queries)
+    ]
+
+    def run(search):
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        results = [search(q) for q in queries]
+        seconds = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return results, seconds, peak
+
+    logger.info("Benchmarking full sort.")
+    baseline, baseline_seconds, baseline_peak = run(lambda q: _full_sort_search(q, embeddings, k))
+
+    results = [{
+        "search": "full matrix, full sort",
+        "ms_per_query": 1000 * baseline_seconds / num_queries,
+        "speedup": 1.0,
+        "peak_mib": baseline_peak / 2**20,
+        "top_k_overlap": 1.0,
+    }]
+
+    for block_size in block_sizes:
+        logger.info(f"Benchmarking blocks of {block_size}.")
+        engine = ExactSearch(k=k, block_size=block_size)
+        found, seconds, peak = run(lambda q: engine.search_array(q, embeddings)[0])
+
+        results.append({
+            "search": f"blocks of {block_size}, top-k",
+            "ms_per_query": 1000 * seconds / num_queries,
+            "speedup": baseline_seconds / seconds,
+            "peak_mib": peak / 2**20,
+            "top_k_overlap": float(np.mean([
+                len(np.intersect1d(a, b)) / max(1, len(b)) for a, b in zip(found, baseline)
+            ])),
+        })
+
+    if db is not None:
+        logger.info("Benchmarking DuckDB.")
+        engine = SQLSearch(k=k)
+        row_of = {key: i for i, key in enumerate(keys)}
+        found, seconds, _ = run(lambda q: engine.search_embeddings(db, model_name, q)[0])
+
+        results.append({
+            "search": "duckdb array_cosine_similarity",
+            "ms_per_query": 1000 * seconds / num_queries,
+            "speedup": baseline_seconds / seconds,
+            "peak_mib": float("nan"),
+            "top_k_overlap": float(np.mean([
+                len(np.intersect1d([row_of[key] for key in a], b)) / max(1, len(b))
+                for a, b in zip(found, baseline)
+            ])),
+        })
+
+    return results
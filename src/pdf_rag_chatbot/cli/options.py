@@ -0,0 +1,151 @@
+import functools
+
+import click
+
+
+def embed_options(pool: bool = False):
+    """Add options for the embedding model, passed to the command as an `embed_options` dict.
+
+    Args:
+        pool (bool, optional): Also add an option to embed with a pool of worker
+            processes, for commands that embed in bulk. Defaults to False.
+    """
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(
+            *args,
+            embed_backend: str,
+            embed_threads: int,
+            embedding_cache: str,
+            embed_workers: int = 0,
+            **kwargs,
+        ):
+            return f(
+                *args,
+                embed_options={
+                    "backend": embed_backend,
+                    "num_threads": embed_threads,
+                    "num_workers": embed_workers,
+                    "cache_path": embedding_cache,
+                },
+                **kwargs,
+            )
+
+        if pool:
+            wrapper = click.option(
+                "--embed-workers",
+                default=0,
+                help="Embed with this many worker processes, each using --embed-threads threads.",
+            )(wrapper)
+        wrapper = click.option(
+            "--embedding-cache",
+            default=None,
+            envvar="PDF_RAG_EMBEDDING_CACHE",
+            help="Directory of an embedding cache shared by warehouses, looked up before embedding any text.",
+        )(wrapper)
+        wrapper = click.option(
+            "--embed-threads",
+            default=None,
+            type=int,
+            help="Number of threads used for CPU inference of the embedding model.",
+        )(wrapper)
+        wrapper = click.option(
+            "--embed-backend",
+            type=click.Choice(["torch", "int8", "onnx"]),
+            default="torch",
+            help="Run the embedding model with PyTorch, int8-quantized PyTorch or ONNX Runtime.",
+        )(wrapper)
+
+        return wrapper
+
+    return decorator
+
+
+def nlp_options(f):
+    """Add options for how documents are split up, passed to the command as an `nlp_options` dict."""
+
+    @functools.wraps(f)
+    def wrapper(*args, chunker: str, chunk_tokens: int, skip_boilerplate: bool, **kwargs):
+        from pdf_rag_chatbot.data_pipeline.chunkers import get_chunker
+        from pdf_rag_chatbot.data_pipeline.dedup import BoilerplateDetector
+
+        options = {} if chunker == "sentence" else {"max_tokens": chunk_tokens}
+        return f(
+            *args,
+            nlp_options={
+                "chunker": get_chunker(chunker, **options),
+                "boilerplate": BoilerplateDetector() if skip_boilerplate else None,
+            },
+            **kwargs,
+        )
+
+    wrapper = click.option(
+        "--skip-boilerplate",
+        is_flag=True,
+        help="Don't embed or search repeated headers, footers and disclaimers.",
+    )(wrapper)
+    wrapper = click.option(
+        "--chunk-tokens",
+        default=256,
+        help="The maximum number of tokens in a window or paragraph chunk.",
+    )(wrapper)
+    wrapper = click.option(
+        "--chunker",
+        type=click.Choice(["sentence", "window", "paragraph"]),
+        default="sentence",
+        help="Search and embed documents by sentence, by overlapping token windows, or by paragraph.",
+    )(wrapper)
+
+    return wrapper
+
+
+def ingest_options(f):
+    """Add options for how files are read, passed to the command as an `ingest_options` dict."""
+
+    @functools.wraps(f)
+    def wrapper(*args, extractor: str, document_store: str, **kwargs):
+        from pdf_rag_chatbot.data_pipeline.extractors import get_extractor
+
+        return f(
+            *args,
+            ingest_options={
+                "extractor": get_extractor(extractor),
+                "document_store": document_store,
+            },
+            **kwargs,
+        )
+
+    wrapper = click.option(
+        "--document-store",
+        default=None,
+        envvar="PDF_RAG_DOCUMENT_STORE",
+        help="Keep document bodies compressed in this directory rather than in the warehouse. "
+        "The warehouse remembers it for later runs.",
+    )(wrapper)
+    wrapper = click.option(
+        "--extractor",
+        type=click.Choice(["layout", "pdfminer", "pypdf", "auto"]),
+        default="layout",
+        help="Extract PDF text with pdfminer with or without layout analysis, with pypdf, "
+        "or with the fastest of them that gives clean text.",
+    )(wrapper)
+
+    return wrapper
+
+
+class DefaultGroup(click.Group):
+    """A command group that runs `default_command` when no subcommand is given.
+
+    This keeps `pdf-rag-preprocessor [OPTIONS] FILE_PATH` working alongside its
+    subcommands.
+    """
+
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx: click.Context, args: list) -> list:
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
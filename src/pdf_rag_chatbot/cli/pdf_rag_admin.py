@@ -0,0 +1,281 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from loguru import logger
+
+import click
+
+from pdf_rag_chatbot.cli.options import embed_options
+
+
+logger.remove()
+logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"))
+
+@click.group(context_settings={'show_default': True})
+@click.option("--db", "db_path", default="warehouse.duckdb", help="Path to the duckdb database file.")
+@click.pass_context
+def main(ctx: click.Context, db_path: str):
+    """Warehouse administration commands."""
+    ctx.obj = {"db_path": db_path}
+
+
+def _connect(ctx: click.Context):
+    from pdf_rag_chatbot.db import connect, setup_database
+
+    db = connect(ctx.obj["db_path"])
+    setup_database(db)
+    return db
+
+
+@main.group()
+def deadletter():
+    """Inspect, replay or purge requests that failed every retry."""
+
+
+@deadletter.command("list")
+@click.option("--step", default=None, help="Only list failures of this pipeline step.")
+@click.option("--status", type=click.Choice(["pending", "replayed", "all"]), default="pending")
+@click.option("--limit", default=50, help="The maximum number of dead letters to list.")
+@click.pass_context
+def deadletter_list(ctx: click.Context, step: Optional[str], status: str, limit: int):
+    from pdf_rag_chatbot.data_pipeline.dead_letters import DeadLetterStore
+
+    store = DeadLetterStore(_connect(ctx))
+
+    for msg in store.list(step=step, status=None if status == "all" else status, limit=limit):
+        click.echo(
+            f"{msg.message_id}  {msg.step:<8} {type(msg.request).__name__:<16} "
+            f"attempts={msg.attempts}  {msg.error.splitlines()[0] if msg.error else ''}"
+        )
+
+
+@deadletter.command("show")
+@click.argument("dead_letter_id")
+@click.pass_context
+def deadletter_show(ctx: click.Context, dead_letter_id: str):
+    from pdf_rag_chatbot.data_pipeline.dead_letters import DeadLetterStore
+
+    msg = DeadLetterStore(_connect(ctx)).get(dead_letter_id)
+    if msg is None:
+        raise click.ClickException(f"No dead letter with id {dead_letter_id}.")
+
+    click.echo(f"Step:     {msg.step}")
+    click.echo(f"Attempts: {msg.attempts}")
+    click.echo(f"Request:  {type(msg.request).__name__} {msg.request.model_dump_json()}")
+    click.echo(f"Error:    {msg.error}")
+    click.echo("")
+    click.echo(msg.traceback)
+
+
+@deadletter.command("replay")
+@click.argument("dead_letter_ids", nargs=-1)
+@click.option("--all", "replay_all", is_flag=True, help="Replay every pending dead letter.")
+@click.option("--step", default=None, help="Only replay failures of this pipeline step.")
+@click.option(
+    "--retry-policy",
+    "retry_policies",
+    multiple=True,
+    help="Retry policy for a step, as STEP=MAX_ATTEMPTS[:INITIAL_BACKOFF[:MAX_BACKOFF]].",
+)
+@click.pass_context
+def deadletter_replay(
+    ctx: click.Context,
+    dead_letter_ids: Tuple[str],
+    replay_all: bool,
+    step: Optional[str],
+    retry_policies: Tuple[str],
+):
+    from pdf_rag_chatbot.data_pipeline import TextPipeline
+    from pdf_rag_chatbot.data_pipeline.retry import parse_retry_policies
+
+    if not dead_letter_ids and not replay_all:
+        raise click.UsageError("Give dead letter ids to replay, or --all.")
+
+    db = _connect(ctx)
+    pipeline = TextPipeline(db, retry_policies=parse_retry_policies(retry_policies))
+
+    if replay_all:
+        messages = pipeline.dead_letters.list(step=step)
+    else:
+        messages = [pipeline.dead_letters.get(i) for i in dead_letter_ids]
+        messages = [m for m in messages if m is not None]
+
+    replayed = 0
+    for msg in messages:
+        try:
+            pipeline.replay(msg)
+            replayed += 1
+        except Exception as e:
+            logger.error(f"Replay of {msg.message_id} failed: {e}")
+
+    click.echo(f"Replayed {replayed} of {len(messages)} dead letters.")
+
+
+@deadletter.command("purge")
+@click.argument("dead_letter_ids", nargs=-1)
+@click.option("--all", "purge_all", is_flag=True, help="Purge every dead letter.")
+@click.option("--replayed", is_flag=True, help="Only purge dead letters that were replayed.")
+@click.option("--older-than", default=None, type=float, help="Only purge dead letters older than this many days.")
+@click.pass_context
+def deadletter_purge(
+    ctx: click.Context,
+    dead_letter_ids: Tuple[str],
+    purge_all: bool,
+    replayed: bool,
+    older_than: Optional[float],
+):
+    from pdf_rag_chatbot.data_pipeline.dead_letters import DeadLetterStore
+
+    if not (dead_letter_ids or purge_all or replayed or older_than is not None):
+        raise click.UsageError("Give dead letter ids to purge, or --all, --replayed or --older-than.")
+
+    count = DeadLetterStore(_connect(ctx)).purge(
+        dead_letter_ids=list(dead_letter_ids),
+        status="replayed" if replayed else None,
+        older_than=datetime.now() - timedelta(days=older_than) if older_than is not None else None,
+    )
+    click.echo(f"Purged {count} dead letters.")
+
+
+@main.command("trace-report")
+@click.option("--jsonl", "jsonl_path", default=None, type=click.Path(exists=True), help="Report on a JSONL trace file instead of the warehouse.")
+@click.option("--since", default=None, type=float, help="Only include turns from the last this many hours.")
+@click.option("--limit", default=10, help="The number of slowest turns to list.")
+@click.pass_context
+def trace_report(ctx: click.Context, jsonl_path: Optional[str], since: Optional[float], limit: int):
+    """Show the latency of each stage of chat turns, and the slowest turns."""
+    import duckdb
+    import polars as pl
+    from pdf_rag_chatbot.tracing.report import load_jsonl_traces, slowest_turns, stage_breakdown
+
+    pl.Config(tbl_rows=-1, tbl_width_chars=200, fmt_str_lengths=40)
+
+    if jsonl_path is not None:
+        db = duckdb.connect()
+        load_jsonl_traces(db, jsonl_path)
+    else:
+        db = _connect(ctx)
+
+    since_time = datetime.now() - timedelta(hours=since) if since is not None else None
+    try:
+        click.echo("Stages:")
+        click.echo(stage_breakdown(db, since_time))
+        click.echo("")
+        click.echo("Slowest turns:")
+        click.echo(slowest_turns(db, limit, since_time))
+    finally:
+        db.close()
+
+
+@main.command("trace-purge")
+@click.option("--older-than", required=True, type=float, help="Delete traces of turns older than this many days.")
+@click.pass_context
+def trace_purge(ctx: click.Context, older_than: float):
+    """Delete old traces from the warehouse."""
+    from pdf_rag_chatbot.tracing.report import purge_traces
+
+    db = _connect(ctx)
+    try:
+        count = purge_traces(db, datetime.now() - timedelta(days=older_than))
+    finally:
+        db.close()
+    click.echo(f"Deleted {count} trace spans.")
+
+
+@main.command()
+@click.option("--session-ttl", default=None, type=float, help="Also expire sessions inactive for this many hours.")
+@click.option("--compact", is_flag=True, help="Rewrite the warehouse afterwards to reclaim disk space.")
+@click.pass_context
+def gc(ctx: click.Context, session_ttl: Optional[float], compact: bool):
+    """Delete documents, sentences, entities and embeddings no longer referenced."""
+    from pdf_rag_chatbot.db import expire_sessions, collect_garbage
+
+    db = _connect(ctx)
+    try:
+        if session_ttl is not None:
+            count = expire_sessions(db, timedelta(hours=session_ttl))
+            click.echo(f"Expired {count} sessions.")
+
+        for table, count in collect_garbage(db).items():
+            click.echo(f"Deleted {count} rows from {table}.")
+    finally:
+        db.close()
+
+    if compact:
+        ctx.invoke(compact_command)
+
+
+@main.command("compact")
+@click.pass_context
+def compact_command(ctx: click.Context):
+    """Rewrite the warehouse to reclaim space from deleted rows.
+
+    Needs exclusive access, so stop the chat server and workers first.
+    """
+    from pdf_rag_chatbot.db import compact_database
+
+    size_before, size_after = compact_database(ctx.obj["db_path"])
+    click.echo(f"Compacted warehouse from {size_before / 2**20:.1f} MiB to {size_after / 2**20:.1f} MiB.")
+
+
+@main.command()
+@click.option("--model", "model_name", required=True, help="The embedding model to migrate to.")
+@click.option("--batch-size", default=1024, help="Number of texts embedded and written at a time.")
+@click.option("--max-rate", default=None, type=float, help="Maximum number of texts embedded per second.")
+@click.option("--no-switch", is_flag=True, help="Backfill without making the model the active embedding model.")
+@embed_options(pool=True)
+@click.pass_context
+def reembed(
+    ctx: click.Context,
+    model_name: str,
+    batch_size: int,
+    max_rate: Optional[float],
+    no_switch: bool,
+    embed_options: Dict[str, Any],
+):
+    """Embed every searchable text with a new model, then switch search to it.
+
+    The job can be interrupted and resumed. Searches keep using the current model
+    until every text has been embedded with the new one. A chat server has to run
+    with `--ingest-mode worker` meanwhile, or be stopped, as it otherwise holds
+    the warehouse.
+    """
+    from pdf_rag_chatbot.db import warehouse, setup_database
+    from pdf_rag_chatbot.data_pipeline.steps import Embed
+    from pdf_rag_chatbot.data_pipeline.reembed import Reembed
+
+    db_path = ctx.obj["db_path"]
+    with warehouse(db_path) as db:
+        setup_database(db)
+
+    embed = Embed(None, model_name=model_name, **embed_options)
+    job = Reembed(
+        connect=lambda: warehouse(db_path, timeout=600.0),
+        embed=embed,
+        batch_size=batch_size,
+        max_rate=max_rate,
+    )
+    try:
+        count = job.run(switch=not no_switch)
+    finally:
+        embed.close()
+    click.echo(f"Embedded {count} texts with {model_name}.")
+
+
+@main.command("embedding-model")
+@click.pass_context
+def embedding_model(ctx: click.Context):
+    """Show the active embedding model and how many texts each model covers."""
+    from pdf_rag_chatbot.db import EMBEDDING_MODEL, get_setting
+    from pdf_rag_chatbot.data_pipeline.steps import DEFAULT_MODEL_NAME
+    from pdf_rag_chatbot.data_pipeline.reembed import embedding_coverage
+
+    db = _connect(ctx)
+    click.echo(f"Active model: {get_setting(db, EMBEDDING_MODEL, DEFAULT_MODEL_NAME)}")
+    for model_name, count in embedding_coverage(db).items():
+        click.echo(f"  {model_name}: {count} texts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+from typing import Any, Dict, Optional
+from loguru import logger
+
+import click
+
+from pdf_rag_chatbot.cli.options import embed_options
+
+
+logger.remove()
+logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"))
+
+@click.command(context_settings={'show_default': True})
+@click.argument("input_path", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output_path", type=click.Path(dir_okay=False))
+@click.option("--db", default="warehouse.duckdb", help="Path to the duckdb database file.")
+@click.option("--model", default="llama3", help="The language model to use for agents.")
+@click.option("--session-id", default=None, help="Also search the files uploaded in this session.")
+@click.option("--batch-size", default=256, help="Questions searched together in one pass over the embeddings.")
+@click.option("--concurrency", default=16, help="LLM calls in flight at once.")
+@click.option("--resume", is_flag=True, help="Skip questions already answered in the output file.")
+@click.option(
+    "--search-backend",
+    type=click.Choice(["exact", "sql"]),
+    default="exact",
+    help="Score embeddings in blocks in the app, or inside DuckDB in a single query.",
+)
+@embed_options()
+def main(
+    input_path: str,
+    output_path: str,
+    db: str,
+    model: str,
+    session_id: Optional[str],
+    batch_size: int,
+    concurrency: int,
+    resume: bool,
+    search_backend: str,
+    embed_options: Dict[str, Any],
+):
+    """Answer the questions of a JSONL file, writing answers, context and timings to another.
+
+    Each input line is an object with a `question` and an optional `id`.
+    """
+    from pdf_rag_chatbot.agents import load_chat_model
+    from pdf_rag_chatbot.app import App, BatchAnswerer
+
+    app = App(
+        database=db,
+        llm=load_chat_model(model),
+        search_backend=search_backend,
+        embed_options=embed_options,
+    )
+
+    answerer = BatchAnswerer(
+        app,
+        batch_size=batch_size,
+        max_concurrency=concurrency,
+        session_id=session_id,
+    )
+    answerer.run(input_path, output_path, resume=resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import os
+import sys
+import glob
+from typing import List, Optional, Tuple
+from loguru import logger
+
+import click
+
+
+logger.remove()
+logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"))
+
+@click.group(context_settings={'show_default': True})
+def main():
+    """Benchmarks for the ingest and search paths."""
+
+
+def _print_table(rows: List[dict]):
+    columns = list(rows[0].keys())
+    formatted = [
+        [f"{v:.4f}" if isinstance(v, float) else str(v) for v in row.values()]
+        for row in rows
+    ]
+    widths = [max(len(c), *(len(r[i]) for r in formatted)) for i, c in enumerate(columns)]
+
+    click.echo("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in formatted:
+        click.echo("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def _load_texts(db_path: Optional[str], files: Tuple[str], limit: int) -> List[str]:
+    if db_path is not None:
+        import duckdb
+
+        db = duckdb.connect(db_path, read_only=True)
+        rows = db.execute("SELECT text FROM sentence LIMIT ?", (limit,)).fetchall()
+        db.close()
+        return [text for text, in rows]
+
+    from pdf_rag_chatbot.data_pipeline.extractors import PDFMinerExtractor
+
+    extractor = PDFMinerExtractor()
+    texts = []
+    for file in files or sorted(glob.glob("data/*.pdf")):
+        text = extractor(file)
+        texts.extend(line.strip() for line in text.splitlines() if len(line.strip()) > 20)
+
+    return texts[:limit]
+
+
+@main.command()
+@click.option("--db", "db_path", default=None, help="Take sentences from this warehouse instead of PDF files.")
+@click.option("--model", "model_name", default=None, help="The embedding model.  [default: all-MiniLM-L6-v2]")
+@click.option(
+    "--backend",
+    "backends",
+    multiple=True,
+    type=click.Choice(["torch", "int8", "onnx"]),
+    default=["torch", "int8"],
+    help="Backends to compare against the current one-text-per-call path.",
+)
+@click.option("--threads", default=None, type=int, help="Threads used for CPU inference, per worker when using --workers.")
+@click.option("--workers", "worker_counts", multiple=True, type=int, help="Also run each backend with a pool of this many worker processes.")
+@click.option("--batch-size", default=64, help="Batch size for the model.")
+@click.option("--limit", default=2000, help="Maximum number of texts to embed.")
+@click.argument("files", nargs=-1, type=click.Path(exists=True))
+def embed(
+    db_path: Optional[str],
+    model_name: Optional[str],
+    backends: Tuple[str],
+    threads: Optional[int],
+    worker_counts: Tuple[int],
+    batch_size: int,
+    limit: int,
+    files: Tuple[str],
+):
+    """Compare embedding throughput and score parity across inference backends.
+
+    Texts are lines from FILES, or from data/*.pdf when no files are given.
+    """
+    from pdf_rag_chatbot.data_pipeline.steps import DEFAULT_MODEL_NAME
+    from pdf_rag_chatbot.benchmarks.embedding import benchmark_embedding
+
+    texts = _load_texts(db_path, files, limit)
+    click.echo(f"Embedding {len(texts)} texts.")
+
+    _print_table(benchmark_embedding(
+        texts,
+        backends=list(backends),
+        model_name=model_name or DEFAULT_MODEL_NAME,
+        num_threads=threads,
+        batch_size=batch_size,
+        worker_counts=list(worker_counts),
+    ))
+
+
+@main.command()
+@click.option(
+    "--chunker",
+    "chunkers",
+    multiple=True,
+    type=click.Choice(["sentence", "window", "paragraph"]),
+    default=["sentence", "window", "paragraph"],
+    help="Chunkers to compare.",
+)
+@click.option("--chunk-tokens", default=256, help="The maximum number of tokens in a chunk.")
+@click.option("--spacy-model", default="en_core_web_trf", help="The spaCy pipeline used to split sentences.")
+@click.argument("files", nargs=-1, type=click.Path(exists=True))
+def chunk(chunkers: Tuple[str], chunk_tokens: int, spacy_model: str, files: Tuple[str]):
+    """Compare the number of vectors each chunker produces for FILES, or data/*.pdf."""
+    from pdf_rag_chatbot.data_pipeline.extractors import PDFMinerExtractor
+    from pdf_rag_chatbot.benchmarks.chunking import benchmark_chunking
+
+    extractor = PDFMinerExtractor()
+    documents = [
+        extractor(file) if file.endswith(".pdf") else open(file).read()
+        for file in files or sorted(glob.glob("data/*.pdf"))
+    ]
+    click.echo(f"Chunking {len(documents)} documents.")
+
+    _print_table(benchmark_chunking(
+        documents,
+        chunkers=list(chunkers),
+        max_tokens=chunk_tokens,
+        spacy_model=spacy_model,
+    ))
+
+
+@main.command()
+@click.option(
+    "--extractor",
+    "extractors",
+    multiple=True,
+    type=click.Choice(["layout", "pdfminer", "pypdf", "auto"]),
+    default=["pdfminer", "pypdf", "auto"],
+    help="Extractors to compare against pdfminer with layout analysis.",
+)
+@click.argument("files", nargs=-1, type=click.Path(exists=True))
+def extract(extractors: Tuple[str], files: Tuple[str]):
+    """Compare PDF text extraction speed across extractors for FILES, or data/*.pdf."""
+    from pdf_rag_chatbot.benchmarks.extraction import benchmark_extraction
+
+    files = list(files) or sorted(glob.glob("data/*.pdf"))
+    click.echo(f"Extracting {len(files)} files.")
+
+    _print_table(benchmark_extraction(files, extractors=list(extractors)))
+
+
+@main.command()
+@click.option("--db", "db_path", default=None, help="Search the embeddings in this warehouse instead of random vectors.")
+@click.option("--model", "model_name", default=None, help="With --db, the embedding model.  [default: the active model]")
+@click.option("--size", default=1_000_000, help="Without --db, the number of random vectors.")
+@click.option("--dim", default=384, help="Without --db, the dimension of the random vectors.")
+@click.option("--queries", "num_queries", default=20, help="Number of searches.")
+@click.option("--top-k", default=100, help="Results per search.")
+@click.option("--block-size", "block_sizes", multiple=True, type=int, default=[4096, 16384, 65536], help="Block sizes to compare.")
+def search(
+    db_path: Optional[str],
+    model_name: Optional[str],
+    size: int,
+    dim: int,
+    num_queries: int,
+    top_k: int,
+    block_sizes: Tuple[int],
+):
+    """Compare exact search over the whole corpus at once against blockwise top-k search.
+
+    With --db, search inside DuckDB is compared as well.
+    """
+    import numpy as np
+    from pdf_rag_chatbot.benchmarks.search import benchmark_search
+
+    if db_path is not None:
+        import duckdb
+        from pdf_rag_chatbot.db import EMBEDDING_MODEL, get_setting
+        from pdf_rag_chatbot.data_pipeline.steps import DEFAULT_MODEL_NAME
+        from pdf_rag_chatbot.search import embedding_blocks
+
+        db = duckdb.connect(db_path, read_only=True)
+        model_name = model_name or get_setting(db, EMBEDDING_MODEL, DEFAULT_MODEL_NAME)
+        keys, blocks = [], []
+        for block_keys, block in embedding_blocks(
+            db,
+            "SELECT cased_text_hash, embedding FROM text_embedding WHERE model_name = ?",
+            (model_name,),
+        ):
+            keys.extend(block_keys)
+            blocks.append(block)
+        embeddings = np.vstack(blocks)
+    else:
+        db = keys = None
+        embeddings = np.random.default_rng(0).normal(size=(size, dim)).astype(np.float32)
+
+    click.echo(f"Searching {len(embeddings)} vectors.")
+
+    _print_table(benchmark_search(
+        embeddings,
+        num_queries=num_queries,
+        k=top_k,
+        block_sizes=list(block_sizes),
+        keys=keys,
+        db=db,
+        model_name=model_name,
+    ))
+
+
+_DEFAULT_QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main findings of the report.",
+    "What are the obligations of each party under the Agreement?",
+    "When does the contract terminate and what notice is required?",
+    "Which organizations are mentioned in the document?",
+    "What risks does the author identify?",
+]
+
+
+@main.command()
+@click.option("--db", "db_path", default="loadtest.duckdb", help="Path to the duckdb database file.")
+@click.option("--sessions", default=8, help="Concurrent chat sessions.")
+@click.option("--turns", default=5, help="Questions asked by each session.")
+@click.option("--questions", "questions_path", default=None, type=click.Path(exists=True), help="A file of questions, one per line.  [default: a few generic questions]")
+@click.option("--think-time", default=0.0, help="Seconds a session waits between questions.")
+@click.option("--llm-latency", default=0.5, help="Seconds the fake language model takes per reply.")
+@click.option("--llm-tps", default=50.0, help="Tokens per second the fake language model generates.")
+@click.option(
+    "--search-backend",
+    type=click.Choice(["exact", "sql"]),
+    default="exact",
+    help="Score embeddings in blocks in the app, or inside DuckDB in a single query.",
+)
+@click.argument("files", nargs=-1, type=click.Path(exists=True))
+def loadtest(
+    db_path: str,
+    sessions: int,
+    turns: int,
+    questions_path: Optional[str],
+    think_time: float,
+    llm_latency: float,
+    llm_tps: float,
+    search_backend: str,
+    files: Tuple[str],
+):
+    """Simulate concurrent chat sessions, each uploading FILES and asking questions.
+
+    A fake language model stands in for Ollama or OpenAI, so the test runs offline.
+    """
+    from pdf_rag_chatbot.agents import FakeChatModel
+    from pdf_rag_chatbot.app import App
+    from pdf_rag_chatbot.benchmarks.loadtest import run_load_test
+
+    questions = _DEFAULT_QUESTIONS
+    if questions_path is not None:
+        with open(questions_path) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    app = App(
+        database=db_path,
+        llm=FakeChatModel(latency=llm_latency, tokens_per_second=llm_tps or None),
+        search_backend=search_backend,
+    )
+
+    results = run_load_test(
+        app,
+        questions,
+        sessions=sessions,
+        turns=turns,
+        files=list(files),
+        think_time=think_time,
+    )
+
+    _print_table(results["stages"])
+    click.echo(
+        f"{results['turns']} turns, {results['errors']} failed, "
+        f"{results['turns_per_second']:.2f} turns per second."
+    )
+
+
+if __name__ == "__main__":
+    main()
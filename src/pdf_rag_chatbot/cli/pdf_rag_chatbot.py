@@ -1,19 +1,75 @@
 import os
 import sys
+from typing import Any, Dict, Optional
 from loguru import logger
 
 import click
 
+from pdf_rag_chatbot.cli.options import embed_options, ingest_options, nlp_options
+
 
 logger.remove()
 logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"))
 
 @click.command(context_settings={'show_default': True})
 @click.option("--port", default=5000, help="Port to run the server on.")
+@click.option(
+    "--serve",
+    type=click.Choice(["ui", "api", "both"]),
+    default="ui",
+    help="Serve the chat UI, the JSON API under /api, or both.",
+)
 @click.option("--db", default="warehouse.duckdb", help="Path to the duckdb database file.")
 @click.option("--model", default="llama3", help="The language model to use for agents.")
-def main(port: int, db: str, model: str):
+@click.option(
+    "--ingest-mode",
+    type=click.Choice(["inline", "worker"]),
+    default="inline",
+    help="Process uploads in the app, or enqueue them for pdf-rag-worker processes.",
+)
+@click.option("--jobs", "jobs_path", default=None, help="Path to the job queue file.  [default: <db>.jobs.sqlite]")
+@click.option("--session-ttl", default=None, type=float, help="Hours to keep files uploaded in an inactive session. Kept forever by default.")
+@click.option("--gc-interval", default=15.0, help="Minutes between removals of expired session data.")
+@click.option(
+    "--search-backend",
+    type=click.Choice(["exact", "sql"]),
+    default="exact",
+    help="Score embeddings in blocks in the app, or inside DuckDB in a single query.",
+)
+@click.option("--speculative-search", is_flag=True, help="Search for the question as typed while the parser agent runs.")
+@click.option("--parse-deadline", default=10.0, help="With --speculative-search, seconds to wait for the parser agent.")
+@click.option(
+    "--trace",
+    type=click.Choice(["off", "db", "jsonl"]),
+    default="off",
+    help="Record the stages of each chat turn to the warehouse's trace_span table or a JSONL file.",
+)
+@click.option("--trace-path", default=None, help="With --trace jsonl, the trace file.  [default: <db>.traces.jsonl]")
+@embed_options()
+@nlp_options
+@ingest_options
+def main(
+    port: int,
+    serve: str,
+    db: str,
+    model: str,
+    ingest_mode: str,
+    jobs_path: Optional[str],
+    session_ttl: Optional[float],
+    gc_interval: float,
+    search_backend: str,
+    speculative_search: bool,
+    parse_deadline: float,
+    trace: str,
+    trace_path: Optional[str],
+    embed_options: Dict[str, Any],
+    nlp_options: Dict[str, Any],
+    ingest_options: Dict[str, Any],
+):
+    from datetime import timedelta
+    from pdf_rag_chatbot.agents import load_chat_model
     from pdf_rag_chatbot.app import App
+    from pdf_rag_chatbot.jobs import JobQueue, default_job_queue_path
     import polars as pl
 
     pl.Config(
@@ -21,20 +77,52 @@ def main(port: int, db: str, model: str):
         tbl_width_chars = 500
     )
 
-    if model.startswith("gpt"):
-        from langchain_openai import ChatOpenAI
-        llm = ChatOpenAI(model=model)
-    else:
-        from langchain_community.chat_models import ChatOllama
-        llm = ChatOllama(model=model)
+    llm = load_chat_model(model)
+
+    tracer = None
+    if trace != "off":
+        from pdf_rag_chatbot.tracing import DuckDBTraceSink, JSONLTraceSink, Tracer, default_trace_path
+
+        if trace == "db":
+            tracer = Tracer(DuckDBTraceSink(db))
+        else:
+            tracer = Tracer(JSONLTraceSink(trace_path or default_trace_path(db)))
+
+    job_queue = None
+    if ingest_mode == "worker":
+        job_queue = JobQueue(jobs_path or default_job_queue_path(db))
 
     app = App(
         database=db,
         llm=llm,
+        job_queue=job_queue,
+        session_ttl=timedelta(hours=session_ttl) if session_ttl is not None else None,
+        gc_interval=timedelta(minutes=gc_interval),
+        search_backend=search_backend,
+        tracer=tracer,
+        speculative=speculative_search,
+        parse_deadline=parse_deadline,
+        embed_options=embed_options,
+        nlp_options=nlp_options,
+        ingest_options=ingest_options,
     )
-    app.launch(
-        server_port=port,
-    )
+
+    if serve == "ui":
+        app.launch(
+            server_port=port,
+        )
+        return
+
+    import uvicorn
+    import gradio as gr
+    from pdf_rag_chatbot.app import create_api
+
+    api = create_api(app)
+    if serve == "both":
+        api = gr.mount_gradio_app(api, app.build_ui(), path="/")
+
+    app.start_gc()
+    uvicorn.run(api, host="127.0.0.1", port=port)
 
 
 if __name__ == "__main__":
@@ -1,37 +1,214 @@
 import os
 import sys
 import asyncio
+from typing import Any, Dict, Optional, Tuple
 from loguru import logger
 
 import click
 
+from pdf_rag_chatbot.cli.options import DefaultGroup, embed_options, ingest_options, nlp_options
+
 logger.remove()
 logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"))
 
-@click.command(context_settings={'show_default': True})
+@click.group(
+    cls=DefaultGroup,
+    default_command="ingest",
+    context_settings={'show_default': True},
+)
+def main():
+    """Preprocess files into the warehouse, or move preprocessed documents between warehouses.
+
+    Without a subcommand, runs `ingest`.
+    """
+
+
+@main.command()
 @click.option("--db", "db_path", default="warehouse.duckdb", help="Path to the duckdb database file.")
+@click.option("--enqueue", is_flag=True, help="Enqueue files for pdf-rag-worker processes instead of processing them.")
+@click.option("--jobs", "jobs_path", default=None, help="Path to the job queue file.  [default: <db>.jobs.sqlite]")
+@click.option(
+    "--retry-policy",
+    "retry_policies",
+    multiple=True,
+    help="Retry policy for a step, as STEP=MAX_ATTEMPTS[:INITIAL_BACKOFF[:MAX_BACKOFF]].",
+)
+@click.option("--incremental", is_flag=True, help="Only process files that are new or changed since they were last processed.")
+@click.option("--prune", is_flag=True, help="With --incremental, remove documents whose files are gone from FILE_PATH.")
+@click.option("--watch", is_flag=True, help="Keep running and incrementally process files as they change in FILE_PATH.")
+@click.option("--debounce", default=2.0, help="With --watch, seconds a file must go without writes before it is processed.")
+@click.option("--poll-interval", default=5.0, help="With --watch, seconds between scans where file events aren't available.")
 @click.argument("file_path", type=click.Path(exists=True))
-def main(db_path: str, file_path: str):
+@embed_options(pool=True)
+@nlp_options
+@ingest_options
+def ingest(
+    db_path: str,
+    enqueue: bool,
+    jobs_path: Optional[str],
+    retry_policies: Tuple[str],
+    incremental: bool,
+    prune: bool,
+    watch: bool,
+    debounce: float,
+    poll_interval: float,
+    file_path: str,
+    embed_options: Dict[str, Any],
+    nlp_options: Dict[str, Any],
+    ingest_options: Dict[str, Any],
+):
+    """Preprocess FILE_PATH, a file or a directory of files, into the warehouse."""
     import duckdb
     from pdf_rag_chatbot.db import setup_database
-    from pdf_rag_chatbot.data_pipeline.text_pipeline import TextPipeline
     from pdf_rag_chatbot.data_pipeline.messages import FileUploaded
+    from pdf_rag_chatbot.data_pipeline.file_sync import FileSync, is_supported_file
 
+    if watch:
+        if not os.path.isdir(file_path):
+            raise click.UsageError("--watch needs FILE_PATH to be a directory.")
+        incremental = True
+
+    if prune and not incremental:
+        raise click.UsageError("--prune needs --incremental.")
+    if incremental and enqueue:
+        raise click.UsageError("--incremental and --watch can't be used with --enqueue.")
+
+    if enqueue:
+        from pdf_rag_chatbot.jobs import JobQueue, default_job_queue_path
+
+        job_queue = JobQueue(jobs_path or default_job_queue_path(db_path))
+        pipeline = job_queue.enqueue
+    else:
+        from pdf_rag_chatbot.data_pipeline.text_pipeline import TextPipeline
+        from pdf_rag_chatbot.data_pipeline.retry import parse_retry_policies
 
-    db = duckdb.connect(db_path)
-    setup_database(db)
+        db = duckdb.connect(db_path)
+        setup_database(db)
 
-    pipeline = TextPipeline(db)
+        pipeline = TextPipeline(
+            db,
+            retry_policies=parse_retry_policies(retry_policies),
+            embed_options=embed_options,
+            nlp_options=nlp_options,
+            ingest_options=ingest_options,
+        )
 
 
+    def process(file_path: str):
+        # Failed files are kept as dead letters, so one bad file doesn't stop the batch.
+        try:
+            pipeline(FileUploaded(file_path=file_path))
+        except Exception as e:
+            logger.error(f"Failed to process {file_path}: {e}")
+
+    if incremental:
+        file_sync = FileSync(db, pipeline)
+        if os.path.isdir(file_path):
+            counts = file_sync.sync(file_path, prune=prune)
+            click.echo(", ".join(f"{count} {status}" for status, count in counts.items()))
+        else:
+            click.echo(file_sync.sync_file(file_path))
+
+        if watch:
+            _watch(file_sync, file_path, prune, debounce, poll_interval)
+
     # If we're given a single file, we can process it directly.
-    if not os.path.isdir(file_path):
-        pipeline(FileUploaded(file_path=file_path))
+    elif not os.path.isdir(file_path):
+        process(file_path)
     else:
         for root, dirs, files in os.walk(file_path):
             for file in files:
-                if file.split(".")[-1] not in ["pdf", "text", "txt"]:
+                if not is_supported_file(file):
                     continue
 
                 file_path = os.path.join(root, file)
-                pipeline(FileUploaded(file_path=file_path))
+                process(file_path)
+
+    if not enqueue:
+        pipeline.embed.close()
+
+
+def _watch(file_sync, root: str, prune: bool, debounce: float, poll_interval: float):
+    import signal
+    import threading
+    from pdf_rag_chatbot.data_pipeline.file_watcher import FileWatcher
+
+    watcher = FileWatcher(root, debounce=debounce, poll_interval=poll_interval)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    logger.info(f"Watching {root} for changes.")
+    try:
+        for changed, removed in watcher.watch(stop_event):
+            for path in changed:
+                try:
+                    if os.path.isdir(path):
+                        file_sync.sync(path, prune=prune)
+                    else:
+                        logger.info(f"{path}: {file_sync.sync_file(path)}")
+                except FileNotFoundError:
+                    # Gone again before we got to it.
+                    continue
+
+            if removed and prune:
+                file_sync.remove_missing(removed)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+@main.command("export")
+@click.option("--db", "db_path", default="warehouse.duckdb", help="Path to the duckdb database file.")
+@click.option(
+    "--document",
+    "document_hashes",
+    multiple=True,
+    help="Export only this document, by its hex document hash.  [default: every document]",
+)
+@click.option(
+    "--model",
+    "model_names",
+    multiple=True,
+    help="Export embeddings of only this model.  [default: every model]",
+)
+@click.argument("output", type=click.Path(file_okay=False))
+def export(
+    db_path: str,
+    document_hashes: Tuple[str],
+    model_names: Tuple[str],
+    output: str,
+):
+    """Export preprocessed documents to OUTPUT as a bundle of Parquet files."""
+    from pdf_rag_chatbot.db import warehouse, export_bundle
+    from pdf_rag_chatbot.db.keys import parse_key
+
+    with warehouse(db_path) as db:
+        counts = export_bundle(
+            db,
+            output,
+            document_hashes=[parse_key(h) for h in document_hashes] or None,
+            model_names=list(model_names) or None,
+        )
+
+    for table, count in counts.items():
+        click.echo(f"{table}: {count} rows")
+
+
+@main.command("import")
+@click.option("--db", "db_path", default="warehouse.duckdb", help="Path to the duckdb database file.")
+@click.argument("bundles", nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+def import_(db_path: str, bundles: Tuple[str]):
+    """Import bundles written by `export` into the warehouse."""
+    from pdf_rag_chatbot.db import warehouse, setup_database, import_bundle
+
+    with warehouse(db_path) as db:
+        setup_database(db)
+
+        for bundle in bundles:
+            counts = import_bundle(db, bundle)
+            click.echo(f"{bundle}: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
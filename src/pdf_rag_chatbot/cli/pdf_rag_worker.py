@@ -0,0 +1,82 @@
+import os
+import sys
+import signal
+from typing import Any, Dict, Optional, Tuple
+from loguru import logger
+
+import click
+
+from pdf_rag_chatbot.cli.options import embed_options, ingest_options, nlp_options
+
+
+logger.remove()
+logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"))
+
+@click.command(context_settings={'show_default': True})
+@click.option("--db", "db_path", default="warehouse.duckdb", help="Path to the duckdb database file.")
+@click.option("--jobs", "jobs_path", default=None, help="Path to the job queue file.  [default: <db>.jobs.sqlite]")
+@click.option("--worker-id", default=None, help="A unique name for this worker.")
+@click.option("--batch-size", default=1, help="Number of jobs to claim at a time.")
+@click.option("--poll-interval", default=1.0, help="Seconds to wait between polls of an empty queue.")
+@click.option("--lease", "lease_seconds", default=300.0, help="Seconds a claimed job is held before another worker may take it.")
+@click.option("--max-jobs", default=None, type=int, help="Exit after processing this many jobs.")
+@click.option("--exit-when-idle", is_flag=True, help="Exit once the queue is empty.")
+@click.option(
+    "--retry-policy",
+    "retry_policies",
+    multiple=True,
+    help="Retry policy for a step, as STEP=MAX_ATTEMPTS[:INITIAL_BACKOFF[:MAX_BACKOFF]].",
+)
+@embed_options(pool=True)
+@nlp_options
+@ingest_options
+def main(
+    db_path: str,
+    jobs_path: Optional[str],
+    worker_id: Optional[str],
+    batch_size: int,
+    poll_interval: float,
+    lease_seconds: float,
+    max_jobs: Optional[int],
+    exit_when_idle: bool,
+    retry_policies: Tuple[str],
+    embed_options: Dict[str, Any],
+    nlp_options: Dict[str, Any],
+    ingest_options: Dict[str, Any],
+):
+    from pdf_rag_chatbot.data_pipeline import TextPipeline
+    from pdf_rag_chatbot.data_pipeline.retry import parse_retry_policies
+    from pdf_rag_chatbot.jobs import JobQueue, Worker, default_job_queue_path
+
+    job_queue = JobQueue(
+        jobs_path or default_job_queue_path(db_path),
+        lease_seconds=lease_seconds,
+    )
+
+    worker = Worker(
+        database=db_path,
+        job_queue=job_queue,
+        worker_id=worker_id,
+        batch_size=batch_size,
+        poll_interval=poll_interval,
+        pipeline=TextPipeline(
+            None,
+            retry_policies=parse_retry_policies(retry_policies),
+            embed_options=embed_options,
+            nlp_options=nlp_options,
+            ingest_options=ingest_options,
+        ),
+    )
+
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+
+    try:
+        worker.run(max_jobs=max_jobs, exit_when_idle=exit_when_idle)
+    except KeyboardInterrupt:
+        worker.stop()
+    finally:
+        worker.pipeline.embed.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import re
+import bisect
+from typing import Dict, List, NamedTuple, Tuple, Type
+
+
+class SentenceSpan(NamedTuple):
+    """A sentence of a document, as seen by a chunker."""
+
+    start_char: int
+    end_char: int
+    num_tokens: int
+
+
+# A chunk is a contiguous, inclusive range of sentence indices.
+SentenceRange = Tuple[int, int]
+
+
+class Chunker:
+    """Groups a document's sentences into retrieval units.
+
+    Chunks always start and end on sentence boundaries, so every chunk maps
+    back to the range of sentences it covers.
+    """
+
+    name: str = ""
+
+    def __call__(self, text: str, sentences: List[SentenceSpan]) -> List[SentenceRange]:
+        raise NotImplementedError
+
+
+class SentenceChunker(Chunker):
+    """Every sentence is its own retrieval unit."""
+
+    name = "sentence"
+
+    def __call__(self, text: str, sentences: List[SentenceSpan]) -> List[SentenceRange]:
+        return [(i, i) for i in range(len(sentences))]
+
+
+class TokenWindowChunker(Chunker):
+    name = "window"
+
+    def __init__(self, max_tokens: int = 128, overlap_tokens: int = 32):
+        """Windows of consecutive sentences of up to `max_tokens` tokens.
+
+        Each window starts with the last sentences of the previous one, covering
+        at least `overlap_tokens` tokens, so text near a boundary is in both.
+
+        Args:
+            max_tokens (int, optional): The maximum number of tokens in a window, unless
+                a single sentence is longer. Defaults to 128.
+            overlap_tokens (int, optional): Tokens shared by consecutive windows.
+                Defaults to 32.
+        """
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def __call__(self, text: str, sentences: List[SentenceSpan]) -> List[SentenceRange]:
+        return self._windows(sentences, 0, len(sentences))
+
+    def _windows(self, sentences: List[SentenceSpan], start: int, stop: int) -> List[SentenceRange]:
+        chunks = []
+        while start < stop:
+            end = start
+            tokens = sentences[start].num_tokens
+            while end + 1 < stop and tokens + sentences[end + 1].num_tokens <= self.max_tokens:
+                end += 1
+                tokens += sentences[end].num_tokens
+
+            if chunks and end <= chunks[-1][1]:
+                # The overlap left no room for anything new.
+                start = chunks[-1][1] + 1
+                continue
+
+            chunks.append((start, end))
+            if end + 1 >= stop:
+                break
+
+            # Step back over the overlap, but always make progress.
+            next_start = end + 1
+            overlap = 0
+            while next_start - 1 > start and overlap < self.overlap_tokens:
+                next_start -= 1
+                overlap += sentences[next_start].num_tokens
+            start = next_start
+
+        return chunks
+
+
+class ParagraphChunker(TokenWindowChunker):
+    name = "paragraph"
+
+    # pdfminer separates text boxes with a blank line and pages with a form feed.
+    PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n|\f")
+
+    def __init__(self, max_tokens: int = 256, overlap_tokens: int = 32):
+        """Paragraphs, as laid out in the source document.
+
+        Consecutive short paragraphs, such as table rows, list items and headings,
+        are merged up to `max_tokens` tokens, and paragraphs longer than that are
+        split into overlapping windows.
+
+        Args:
+            max_tokens (int, optional): The maximum number of tokens in a chunk, unless
+                a single sentence is longer. Defaults to 256.
+            overlap_tokens (int, optional): Tokens shared by windows of a long paragraph.
+                Defaults to 32.
+        """
+        super().__init__(max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+
+    def __call__(self, text: str, sentences: List[SentenceSpan]) -> List[SentenceRange]:
+        if not sentences:
+            return []
+
+        breaks = [m.start() for m in self.PARAGRAPH_BREAK.finditer(text)]
+
+        # Group sentences by the paragraph they start in.
+        paragraphs: List[List[int]] = []
+        last_paragraph = None
+        for i, sentence in enumerate(sentences):
+            paragraph = bisect.bisect_right(breaks, sentence.start_char)
+            if paragraph != last_paragraph:
+                paragraphs.append([i, i, 0])
+                last_paragraph = paragraph
+            paragraphs[-1][1] = i
+            paragraphs[-1][2] += sentence.num_tokens
+
+        chunks = []
+        current = None
+        for start, end, tokens in paragraphs:
+            if tokens > self.max_tokens:
+                if current is not None:
+                    chunks.append((current[0], current[1]))
+                    current = None
+                chunks.extend(self._windows(sentences, start, end + 1))
+            elif current is not None and current[2] + tokens <= self.max_tokens:
+                current = [current[0], end, current[2] + tokens]
+            else:
+                if current is not None:
+                    chunks.append((current[0], current[1]))
+                current = [start, end, tokens]
+
+        if current is not None:
+            chunks.append((current[0], current[1]))
+
+        return chunks
+
+
+CHUNKERS: Dict[str, Type[Chunker]] = {
+    c.name: c
+    for c in (SentenceChunker, TokenWindowChunker, ParagraphChunker)
+}
+
+
+def get_chunker(name: str, **kwargs) -> Chunker:
+    """Create a chunker by name: `sentence`, `window` or `paragraph`."""
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker {name!r}, expected one of {list(CHUNKERS)}.")
+    return CHUNKERS[name](**kwargs)
@@ -0,0 +1,149 @@
+from datetime import datetime
+from typing import List, Optional
+
+from duckdb import DuckDBPyConnection
+
+from pdf_rag_chatbot.data_pipeline.messages import (
+    DeadLetterMessage,
+    parse_message,
+)
+
+
+class DeadLetterStore:
+    """Persists requests that failed every retry to the `dead_letter` table."""
+
+    def __init__(self, db: Optional[DuckDBPyConnection]):
+        self.db = db
+
+    def put(self, msg: DeadLetterMessage):
+        """Record a dead letter, replacing an earlier failure of the same request."""
+        self.db.execute(
+            """--sql
+                INSERT OR REPLACE INTO dead_letter (
+                    dead_letter_id,
+                    step,
+                    error,
+                    traceback,
+                    request_type,
+                    request,
+                    attempts,
+                    status,
+                    created_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+            """,
+            (
+                msg.message_id,
+                msg.step,
+                msg.error,
+                msg.traceback,
+                type(msg.request).__name__,
+                msg.request.model_dump_json(),
+                msg.attempts,
+                datetime.now(),
+            ),
+        )
+
+    def get(self, dead_letter_id: str) -> Optional[DeadLetterMessage]:
+        rows = self._select("WHERE dead_letter_id = ?", (dead_letter_id,))
+        return rows[0] if rows else None
+
+    def list(
+        self,
+        step: Optional[str] = None,
+        status: Optional[str] = "pending",
+        limit: Optional[int] = None,
+    ) -> List[DeadLetterMessage]:
+        """List dead letters, oldest first.
+
+        Args:
+            step (Optional[str], optional): Only list failures of this step. Defaults to None.
+            status (Optional[str], optional): Only list dead letters with this status,
+                `pending` or `replayed`. Defaults to "pending".
+            limit (Optional[int], optional): The maximum number to return. Defaults to None.
+        """
+        conditions = []
+        params = []
+
+        if step is not None:
+            conditions.append("step = ?")
+            params.append(step)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+
+        clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        clause += " ORDER BY created_at"
+        if limit is not None:
+            clause += f" LIMIT {int(limit)}"
+
+        return self._select(clause, params)
+
+    def mark_replayed(self, dead_letter_id: str):
+        self.db.execute(
+            """--sql
+                UPDATE dead_letter
+                SET status = 'replayed', replayed_at = ?
+                WHERE dead_letter_id = ?
+            """,
+            (datetime.now(), dead_letter_id),
+        )
+
+    def purge(
+        self,
+        dead_letter_ids: Optional[List[str]] = None,
+        status: Optional[str] = None,
+        older_than: Optional[datetime] = None,
+    ) -> int:
+        """Delete dead letters matching all of the given filters.
+
+        Returns:
+            int: The number of dead letters deleted.
+        """
+        conditions = []
+        params = []
+
+        if dead_letter_ids:
+            conditions.append(f"dead_letter_id IN ({', '.join('?' for _ in dead_letter_ids)})")
+            params.extend(dead_letter_ids)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if older_than is not None:
+            conditions.append("created_at < ?")
+            params.append(older_than)
+
+        clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        count = self.db.execute(f"SELECT COUNT(*) FROM dead_letter {clause}", params).fetchone()[0]
+        self.db.execute(f"DELETE FROM dead_letter {clause}", params)
+        return count
+
+    def _select(self, clause: str, params) -> List[DeadLetterMessage]:
+        rows = self.db.execute(
+            f"""--sql
+                SELECT
+                    dead_letter_id,
+                    step,
+                    error,
+                    traceback,
+                    request_type,
+                    request,
+                    attempts
+                FROM dead_letter
+                {clause}
+            """,
+            params,
+        ).fetchall()
+
+        return [
+            DeadLetterMessage(
+                message_id=dead_letter_id,
+                step=step,
+                error=error,
+                traceback=tb,
+                request=parse_message(request_type, request),
+                attempts=attempts,
+            )
+            for dead_letter_id, step, error, tb, request_type, request, attempts in rows
+        ]
@@ -0,0 +1,280 @@
+import re
+import zlib
+import hashlib
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from duckdb import DuckDBPyConnection
+
+
+# Universal hashing modulo a Mersenne prime keeps products within 64 bits.
+_PRIME = (1 << 31) - 1
+
+_WORD = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d+")
+
+# Looks up the `minhash_band` rows with any of the given band keys, as
+# (band_key, document_hash, sentence_index), e.g. in another warehouse.
+BandSource = Callable[[List[bytes]], List[Tuple[bytes, bytes, int]]]
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        """MinHash signatures of texts, split into LSH bands.
+
+        Texts are lowercased and their numbers masked before they are split into
+        word shingles, so running headers that differ only by page number
+        still match.
+
+        Args:
+            num_perm (int, optional): The length of a signature. Defaults to 64.
+            bands (int, optional): The number of LSH bands, which must divide `num_perm`.
+                Texts share a band with a probability that rises steeply around a
+                Jaccard similarity of `(1 / bands) ** (bands / num_perm)`. Defaults to 16.
+            shingle_size (int, optional): Words per shingle. Defaults to 3.
+            seed (int, optional): Seeds the hash functions, which must match across
+                processes sharing a warehouse. Defaults to 1.
+        """
+        if num_perm % bands != 0:
+            raise ValueError("The number of bands must divide the signature length.")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD.findall(_DIGITS.sub("0", text.lower()))
+        n = self.shingle_size
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+        hashes = np.array([zlib.crc32(s.encode()) % _PRIME for s in shingles], dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            hashlib.md5(bytes([band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes()).digest()
+            for band in range(self.bands)
+        ]
+
+
+class BoilerplateDetector:
+    def __init__(
+        self,
+        min_repeats: int = 3,
+        min_documents: int = 5,
+        min_similarity: float = 0.7,
+        max_tokens: int = 40,
+        min_band_hits: int = 2,
+        minhasher: Optional[MinHasher] = None,
+        band_source: Optional[BandSource] = None,
+    ):
+        """Flags repeated page furniture such as headers, footers and disclaimers.
+
+        A sentence is boilerplate if it has at least `min_repeats` near-duplicates
+        in its own document, or if near-duplicates of it appear in at least
+        `min_documents` documents of the corpus. Only short sentences are
+        considered, long ones are rarely boilerplate.
+
+        The LSH bands of every short sentence are kept in `minhash_band`, so a line
+        that becomes common across the corpus is also flagged in the documents
+        that were processed before it did.
+
+        Args:
+            min_repeats (int, optional): Near-duplicates within a document that make a
+                sentence boilerplate. Defaults to 3.
+            min_documents (int, optional): Documents with a near-duplicate that make a
+                sentence boilerplate. Defaults to 5.
+            min_similarity (float, optional): The estimated Jaccard similarity of
+                near-duplicates within a document. Defaults to 0.7.
+            max_tokens (int, optional): Longer sentences are never boilerplate. Defaults to 40.
+            min_band_hits (int, optional): LSH bands a sentence must share with another
+                document's sentence to count as a near-duplicate. Defaults to 2.
+            minhasher (Optional[MinHasher], optional): Computes signatures. Defaults to `MinHasher()`.
+            band_source (Optional[BandSource], optional): Where to look up the corpus'
+                bands when the database only holds some of it. Defaults to None.
+        """
+        self.min_repeats = min_repeats
+        self.min_documents = min_documents
+        self.min_similarity = min_similarity
+        self.max_tokens = max_tokens
+        self.min_band_hits = min_band_hits
+        self.minhasher = minhasher or MinHasher()
+        self.band_source = band_source
+
+    def __call__(self, db: DuckDBPyConnection, document_hash: bytes, sentences: List[str]) -> Set[int]:
+        """Find the boilerplate sentences of a document.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            document_hash (bytes): The document's hash.
+            sentences (List[str]): The document's sentences, in order.
+
+        Returns:
+            Set[int]: The indices of the boilerplate sentences.
+        """
+        candidates = [
+            i for i, text in enumerate(sentences)
+            if 0 < len(text.split()) <= self.max_tokens
+        ]
+        if not candidates:
+            return set()
+
+        signatures = {i: self.minhasher.signature(sentences[i]) for i in candidates}
+        band_keys = {i: self.minhasher.band_keys(signatures[i]) for i in candidates}
+
+        boilerplate = self._repeated_in_document(signatures, band_keys)
+        boilerplate |= self._repeated_in_corpus(db, document_hash, band_keys)
+
+        return boilerplate
+
+    def _repeated_in_document(
+        self,
+        signatures: Dict[int, np.ndarray],
+        band_keys: Dict[int, List[bytes]],
+    ) -> Set[int]:
+        buckets = defaultdict(list)
+        for i, keys in band_keys.items():
+            for key in keys:
+                buckets[key].append(i)
+
+        # Union-find over candidate pairs that are similar enough.
+        parent = {i: i for i in signatures}
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                if find(first) == find(other):
+                    continue
+                similarity = np.mean(signatures[first] == signatures[other])
+                if similarity >= self.min_similarity:
+                    parent[find(other)] = find(first)
+
+        clusters = defaultdict(list)
+        for i in signatures:
+            clusters[find(i)].append(i)
+
+        return {
+            i
+            for members in clusters.values()
+            if len(members) >= self.min_repeats
+            for i in members
+        }
+
+    def _repeated_in_corpus(
+        self,
+        db: DuckDBPyConnection,
+        document_hash: bytes,
+        band_keys: Dict[int, List[bytes]],
+    ) -> Set[int]:
+        rows = [
+            (key, document_hash, i)
+            for i, keys in band_keys.items()
+            for key in keys
+        ]
+        if self.band_source is not None:
+            # Only the corpus' rows that share a band with this document are copied.
+            rows += self.band_source(list({key for key, _, _ in rows}))
+
+        db.executemany(
+            """--sql
+                INSERT INTO minhash_band (band_key, document_hash, sentence_index)
+                VALUES (?, ?, ?)
+            """,
+            rows,
+        )
+
+        hot_bands = self.flag_earlier_documents(db, document_hash)
+
+        return {
+            i
+            for i, keys in band_keys.items()
+            if sum(key in hot_bands for key in keys) >= self.min_band_hits
+        }
+
+    def flag_earlier_documents(self, db: DuckDBPyConnection, document_hash: bytes) -> Set[bytes]:
+        """Flag lines of other documents that became common with a document.
+
+        The document's LSH bands must already be in `minhash_band`. Flagged lines
+        are removed from `entity_index`. Documents split into chunks are left as
+        they are.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            document_hash (bytes): The document's hash.
+
+        Returns:
+            Set[bytes]: The document's bands that appear in at least `min_documents` documents.
+        """
+        hot_bands = db.execute(
+            """--sql
+                SELECT band_key
+                FROM minhash_band
+                WHERE band_key IN (
+                    SELECT band_key FROM minhash_band WHERE document_hash = ?
+                )
+                GROUP BY band_key
+                HAVING COUNT(DISTINCT document_hash) >= ?
+            """,
+            (document_hash, self.min_documents),
+        ).fetchall()
+        hot_bands = {band_key for band_key, in hot_bands}
+
+        if not hot_bands:
+            return hot_bands
+
+        # Flag the same lines in documents processed before they became common.
+        # Documents split into chunks are skipped, their chunks would have to be
+        # split again around the flagged lines.
+        flagged = db.execute(
+            """--sql
+                UPDATE document_sentence ds
+                SET is_boilerplate = TRUE
+                FROM (
+                    SELECT document_hash, sentence_index
+                    FROM minhash_band
+                    WHERE
+                        band_key IN (SELECT UNNEST(?::BLOB[]))
+                        AND document_hash != ?
+                    GROUP BY document_hash, sentence_index
+                    HAVING COUNT(*) >= ?
+                ) hot
+                WHERE
+                    ds.document_hash = hot.document_hash
+                    AND ds."index" = hot.sentence_index
+                    AND NOT ds.is_boilerplate
+                    AND ds.document_hash NOT IN (SELECT document_hash FROM document_chunk)
+                RETURNING ds.document_hash
+            """,
+            (list(hot_bands), document_hash, self.min_band_hits),
+        ).fetchall()
+
+        # Flagged lines are no longer retrieval units, so their entities no longer point to them.
+        if flagged:
+            db.execute(
+                """--sql
+                    DELETE FROM entity_index ei
+                    WHERE
+                        ei.document_hash IN (SELECT UNNEST(?::BLOB[]))
+                        AND NOT EXISTS (
+                            SELECT 1 FROM retrieval_unit ru
+                            WHERE
+                                ru.document_hash = ei.document_hash
+                                AND ru.cased_text_hash = ei.cased_text_hash
+                        )
+                """,
+                (list({h for h, in flagged}),),
+            )
+
+        return hot_bands
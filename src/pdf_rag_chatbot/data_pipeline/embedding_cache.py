@@ -0,0 +1,232 @@
+import os
+import math
+import time
+import uuid
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+# Keys are the raw 16-byte md5 digests of the cased text.
+KEY_DTYPE = "S16"
+
+
+class _Segment:
+    def __init__(self, name: str, keys: np.ndarray, vectors: np.ndarray):
+        self.name = name
+        self.keys = keys
+        self.vectors = vectors
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        path: str,
+        model_name: str,
+        flush_size: int = 4096,
+        flush_interval: float = 30.0,
+        merge_factor: int = 8,
+    ):
+        """An on-disk embedding cache keyed by `(cased_text_hash, model_name)`.
+
+        The cache can be shared by every warehouse on a machine. Each model has
+        its own directory of immutable segments, a sorted array of keys and a
+        matching array of vectors, which are memory-mapped and searched with a
+        binary search. New embeddings are buffered and written as a new segment,
+        which is renamed into place, so readers in other processes never see a
+        partial write. Segments are merged by size tier: once `merge_factor`
+        segments are of about the same size they are merged into one, so each
+        vector is only rewritten a logarithmic number of times.
+
+        Args:
+            path (str): The cache directory.
+            model_name (str): The embedding model the vectors belong to.
+            flush_size (int, optional): Buffered embeddings that trigger writing a segment.
+                Defaults to 4096.
+            flush_interval (float, optional): Seconds after which buffered embeddings
+                are written by a timer, so other processes see them. Defaults to 30.0.
+            merge_factor (int, optional): Segments of a size tier that trigger a merge.
+                Defaults to 8.
+        """
+        self.model_name = model_name
+        self.path = os.path.join(path, model_name.replace("/", "--"))
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.merge_factor = merge_factor
+        self._segments: Dict[str, _Segment] = {}
+        self._pending: Dict[bytes, np.ndarray] = {}
+        # The flush timer writes segments from its own thread.
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_many(self, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up cached embeddings.
+
+        Args:
+            hashes (List[bytes]): The md5 digests of the cased texts.
+
+        Returns:
+            Dict[bytes, np.ndarray]: The embeddings found, by hash.
+        """
+        with self._lock:
+            return self._get_many(hashes)
+
+    def _get_many(self, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        self._refresh()
+
+        found = {h: self._pending[h] for h in hashes if h in self._pending}
+        if not hashes or not self._segments or len(found) == len(hashes):
+            return found
+
+        keys = np.array(hashes, dtype=KEY_DTYPE)
+        missing = np.array([i for i, h in enumerate(hashes) if h not in found], dtype=np.int64)
+
+        # Newest segments first, they are the most likely to hold recent texts.
+        for segment in sorted(self._segments.values(), key=lambda s: s.name, reverse=True):
+            positions = np.searchsorted(segment.keys, keys[missing])
+            positions = np.minimum(positions, len(segment.keys) - 1)
+            hits = segment.keys[positions] == keys[missing]
+
+            for i, position in zip(missing[hits], positions[hits]):
+                found[hashes[i]] = np.array(segment.vectors[position])
+
+            missing = missing[~hits]
+            if len(missing) == 0:
+                break
+
+        return found
+
+    def put_many(self, hashes: List[bytes], embeddings: np.ndarray):
+        """Add embeddings to the cache.
+
+        They are buffered until `flush_size` embeddings have accumulated or
+        `flush_interval` seconds have passed, then written as one segment.
+
+        Args:
+            hashes (List[bytes]): The md5 digests of the cased texts.
+            embeddings (np.ndarray): The embeddings, one row per hash.
+        """
+        if not hashes:
+            return
+
+        with self._lock:
+            for h, embedding in zip(hashes, np.asarray(embeddings, dtype=np.float32)):
+                self._pending[h] = embedding
+
+            if len(self._pending) >= self.flush_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write the buffered embeddings as a new segment, and merge segments of a full tier."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        keys = np.array(list(self._pending.keys()), dtype=KEY_DTYPE)
+        vectors = np.stack(list(self._pending.values()))
+        keys, unique = np.unique(keys, return_index=True)
+        self._write_segment(keys, vectors[unique])
+        self._pending = {}
+
+        self._merge_tiers()
+
+    def merge(self):
+        """Merge every segment of the model into one."""
+        with self._lock:
+            self._flush()
+            self._refresh()
+            self._merge_segments(list(self._segments.values()))
+
+    def _tier(self, segment: _Segment) -> int:
+        return int(math.log(max(len(segment.keys), 1), self.merge_factor))
+
+    def _merge_tiers(self):
+        # Merging a full tier makes a segment of the next tier, which may fill it in turn.
+        while True:
+            self._refresh()
+            tiers = defaultdict(list)
+            for segment in self._segments.values():
+                tiers[self._tier(segment)].append(segment)
+
+            full = [segments for _, segments in sorted(tiers.items()) if len(segments) >= self.merge_factor]
+            if not full:
+                return
+            self._merge_segments(full[0])
+
+    def _merge_segments(self, segments: List[_Segment]):
+        if len(segments) < 2:
+            return
+
+        keys = np.concatenate([s.keys for s in segments])
+        vectors = np.concatenate([s.vectors for s in segments])
+        keys, unique = np.unique(keys, return_index=True)
+
+        logger.debug(f"Merging {len(segments)} embedding cache segments into one of {len(keys)} vectors.")
+        self._write_segment(keys, vectors[unique])
+
+        for segment in segments:
+            # Another process may be merging the same segments.
+            for suffix in (".keys.npy", ".vectors.npy"):
+                try:
+                    os.remove(os.path.join(self.path, segment.name + suffix))
+                except FileNotFoundError:
+                    pass
+            del self._segments[segment.name]
+
+    def __len__(self) -> int:
+        # Buffered embeddings count too, but aren't written for it.
+        with self._lock:
+            self._refresh()
+            return sum(len(s.keys) for s in self._segments.values()) + len(self._pending)
+
+    def _list_segments(self) -> List[str]:
+        # The keys file is renamed into place last, so it marks a complete segment.
+        return [
+            name[:-len(".keys.npy")]
+            for name in os.listdir(self.path)
+            if name.endswith(".keys.npy")
+        ]
+
+    def _refresh(self):
+        names = set(self._list_segments())
+
+        for name in list(self._segments):
+            if name not in names:
+                del self._segments[name]
+
+        for name in names - self._segments.keys():
+            try:
+                keys = np.load(os.path.join(self.path, name + ".keys.npy"), mmap_mode="r")
+                vectors = np.load(os.path.join(self.path, name + ".vectors.npy"), mmap_mode="r")
+            except FileNotFoundError:
+                # Removed by a merge in another process since we listed the directory.
+                continue
+            self._segments[name] = _Segment(name, keys, vectors)
+
+    def _write_segment(self, keys: np.ndarray, vectors: np.ndarray):
+        # Names sort by creation time, which `get_many` relies on.
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+        for suffix, array in ((".vectors.npy", vectors), (".keys.npy", keys)):
+            path = os.path.join(self.path, name + suffix)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
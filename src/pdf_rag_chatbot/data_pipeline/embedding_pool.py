@@ -0,0 +1,102 @@
+import os
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+# The model held by each worker process.
+_worker_embed = None
+
+
+def _init_worker(model_name: str, backend: str, num_threads: int, batch_size: int):
+    global _worker_embed
+
+    # The pool is for CPU inference, where every worker gets its own cores.
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    from pdf_rag_chatbot.data_pipeline.steps.embed import Embed
+
+    _worker_embed = Embed(
+        None,
+        model_name=model_name,
+        backend=backend,
+        num_threads=num_threads,
+        batch_size=batch_size,
+    )
+
+
+def _encode_shard(texts: List[str]) -> np.ndarray:
+    return _worker_embed.encode(texts)
+
+
+class EmbeddingPool:
+    def __init__(
+        self,
+        model_name: str,
+        num_workers: int,
+        backend: str = "torch",
+        threads_per_worker: Optional[int] = None,
+        batch_size: int = 64,
+        shard_size: Optional[int] = None,
+    ):
+        """A pool of processes that each hold a copy of the embedding model.
+
+        Large batches are split into shards of similar length texts, which are
+        encoded by the workers in parallel and reassembled in order.
+
+        Args:
+            model_name (str): The sentence-transformers model to use.
+            num_workers (int): The number of worker processes.
+            backend (str, optional): The inference backend, see `Embed`. Defaults to "torch".
+            threads_per_worker (Optional[int], optional): Threads each worker uses for
+                inference. Defaults to the number of CPUs divided by `num_workers`.
+            batch_size (int, optional): The batch size for the model. Defaults to 64.
+            shard_size (Optional[int], optional): The number of texts sent to a worker
+                at a time. Defaults to four model batches.
+        """
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self.shard_size = shard_size or batch_size * 4
+
+        logger.info(
+            f"Starting {num_workers} embedding workers with "
+            f"{self.threads_per_worker} threads each."
+        )
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, self.threads_per_worker, batch_size),
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts across the worker processes.
+
+        Returns:
+            np.ndarray: The embeddings, one row per text, in the order given.
+        """
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        # Use smaller shards for small batches so every worker gets some.
+        shard_size = min(self.shard_size, max(1, math.ceil(len(texts) / self.num_workers)))
+        shards = [
+            sorted_texts[i:i + shard_size]
+            for i in range(0, len(sorted_texts), shard_size)
+        ]
+
+        embeddings = np.vstack(list(self.executor.map(_encode_shard, shards)))
+
+        result = np.empty_like(embeddings)
+        result[order] = embeddings
+        return result
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,174 @@
+import re
+from io import StringIO
+from typing import Dict, List, Optional, Tuple, Type
+
+from loguru import logger
+
+
+# pdfminer writes glyphs it can't map to unicode as `(cid:123)`.
+_UNMAPPED_GLYPH = re.compile(r"\(cid:\d+\)")
+
+
+def looks_garbled(text: str, num_pages: int, min_chars_per_page: int = 20) -> bool:
+    """Whether extracted text is too sparse or mangled to use.
+
+    Scanned pages have no text at all, fonts without a unicode map come out as
+    `(cid:N)` or replacement characters, and a fast extractor that misses word
+    gaps runs every word on a line together.
+
+    Args:
+        text (str): The extracted text.
+        num_pages (int): The number of pages it was extracted from.
+        min_chars_per_page (int, optional): Fewer non-blank characters per page means
+            the pages are mostly images. Defaults to 20.
+
+    Returns:
+        bool: True if another extractor should be tried.
+    """
+    visible = len(text) - sum(c.isspace() for c in text)
+    if visible < min_chars_per_page * max(1, num_pages):
+        return True
+
+    unmapped = sum(len(m) for m in _UNMAPPED_GLYPH.findall(text)) + text.count("�")
+    if unmapped > 0.05 * visible:
+        return True
+
+    words = text.split()
+    return sum(len(w) for w in words) / len(words) > 15
+
+
+class PDFExtractor:
+    """Extracts the text of a PDF file.
+
+    Pages end with a form feed, which the paragraph chunker treats as a break.
+    """
+
+    name: str = ""
+
+    def __call__(self, file_path: str) -> str:
+        return self.extract(file_path)[0]
+
+    def extract(self, file_path: str) -> Tuple[str, int]:
+        """Extract the text of a PDF file.
+
+        Args:
+            file_path (str): The path to the PDF file.
+
+        Returns:
+            Tuple[str, int]: The text and the number of pages.
+        """
+        raise NotImplementedError
+
+
+class PDFMinerExtractor(PDFExtractor):
+    name = "layout"
+
+    def __init__(self, layout: bool = True):
+        """Extract text with pdfminer.
+
+        Full layout analysis groups text boxes and orders them by reading order,
+        which handles multi-column pages but is the slowest part of extraction.
+        Without it, characters are still grouped into lines and text boxes, but the
+        boxes are kept in the order the page draws them.
+
+        Args:
+            layout (bool, optional): Order text boxes by layout. Defaults to True.
+        """
+        self.layout = layout
+
+    def extract(self, file_path: str) -> Tuple[str, int]:
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+
+        laparams = LAParams() if self.layout else LAParams(boxes_flow=None)
+
+        output_string = StringIO()
+        num_pages = 0
+        with open(file_path, "rb") as f:
+            doc = PDFDocument(PDFParser(f))
+            rsrcmgr = PDFResourceManager(caching=True)
+            device = TextConverter(rsrcmgr, output_string, laparams=laparams)
+            interpreter = PDFPageInterpreter(rsrcmgr, device)
+            for page in PDFPage.create_pages(doc):
+                interpreter.process_page(page)
+                num_pages += 1
+
+        return output_string.getvalue(), num_pages
+
+
+class PDFMinerFastExtractor(PDFMinerExtractor):
+    name = "pdfminer"
+
+    def __init__(self):
+        """Extract text with pdfminer, without ordering text boxes by layout."""
+        super().__init__(layout=False)
+
+
+class PyPDFExtractor(PDFExtractor):
+    """Extract text with pypdf, straight from the pages' content streams."""
+
+    name = "pypdf"
+
+    def extract(self, file_path: str) -> Tuple[str, int]:
+        from pypdf import PdfReader
+
+        reader = PdfReader(file_path)
+        pages = [page.extract_text() or "" for page in reader.pages]
+
+        return "".join(f"{page}\n\f" for page in pages), len(pages)
+
+
+class AutoExtractor(PDFExtractor):
+    name = "auto"
+
+    def __init__(self, extractors: Optional[List[PDFExtractor]] = None):
+        """Try extractors from fastest to most thorough, per file.
+
+        The first text that doesn't look garbled is used. If every extractor's does,
+        the last one's is used, and an extractor that fails moves on to the next.
+
+        Args:
+            extractors (Optional[List[PDFExtractor]], optional): The extractors to try,
+                in order. Defaults to pypdf, then pdfminer without and with layout analysis.
+        """
+        self.extractors = extractors or [
+            PyPDFExtractor(),
+            PDFMinerFastExtractor(),
+            PDFMinerExtractor(),
+        ]
+
+    def extract(self, file_path: str) -> Tuple[str, int]:
+        text, num_pages = "", 0
+        for extractor in self.extractors:
+            try:
+                text, num_pages = extractor.extract(file_path)
+            except Exception as e:
+                if extractor is self.extractors[-1] and not text:
+                    raise
+                logger.debug(f"{extractor.name} failed on {file_path}: {e}")
+                continue
+
+            if not looks_garbled(text, num_pages):
+                logger.debug(f"Extracted {file_path} with {extractor.name}.")
+                break
+
+            logger.debug(f"{extractor.name} text of {file_path} looks garbled, trying the next extractor.")
+
+        return text, num_pages
+
+
+EXTRACTORS: Dict[str, Type[PDFExtractor]] = {
+    e.name: e
+    for e in (PDFMinerExtractor, PDFMinerFastExtractor, PyPDFExtractor, AutoExtractor)
+}
+
+
+def get_extractor(name: str, **kwargs) -> PDFExtractor:
+    """Create a PDF extractor by name: `layout`, `pdfminer`, `pypdf` or `auto`."""
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor {name!r}, expected one of {list(EXTRACTORS)}.")
+    return EXTRACTORS[name](**kwargs)
@@ -0,0 +1,278 @@
+import os
+import uuid
+import hashlib
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from duckdb import DuckDBPyConnection
+from loguru import logger
+
+from pdf_rag_chatbot.db import collect_garbage
+from pdf_rag_chatbot.data_pipeline.messages import FileUploaded
+
+
+SUPPORTED_EXTENSIONS = ["pdf", "text", "txt"]
+
+
+def is_supported_file(file_path: str) -> bool:
+    return file_path.split(".")[-1] in SUPPORTED_EXTENSIONS
+
+
+def file_content_hash(file_path: str) -> str:
+    """The sha256 hash of a file's bytes."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_directory(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yield the path and stat of every supported file under `root`, without opening any."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and is_supported_file(entry.name):
+                    yield entry.path, entry.stat()
+
+
+class FileSync:
+    def __init__(self, db: DuckDBPyConnection, pipeline: Callable[[FileUploaded], None]):
+        """Keep the warehouse in sync with files on disk, ingesting only what changed.
+
+        Every synced file is recorded in `source_file` with its size, mtime and
+        content hash. A file whose size and mtime are unchanged is skipped without
+        being opened, and one whose content is unchanged is skipped without being
+        ingested. When a file changes, the upload of its previous version is
+        replaced by the new one.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            pipeline (Callable[[FileUploaded], None]): Processes a file, usually a `TextPipeline`
+                on the same connection.
+        """
+        self.db = db
+        self.pipeline = pipeline
+
+    def sync(self, root: str, prune: bool = False) -> Dict[str, int]:
+        """Ingest new and modified files under `root`.
+
+        Args:
+            root (str): The directory to sync.
+            prune (bool, optional): Also remove files that are no longer on disk, and
+                the documents only they referred to. Defaults to False.
+
+        Returns:
+            Dict[str, int]: The number of files that were added, modified, unchanged,
+                failed and removed.
+        """
+        root = os.path.abspath(root)
+        known = self._known_files(root)
+        counts = {"added": 0, "modified": 0, "unchanged": 0, "failed": 0, "removed": 0}
+
+        for file_path, stat in scan_directory(root):
+            counts[self.sync_file(file_path, stat, known.pop(file_path, None))] += 1
+
+        if prune and known:
+            counts["removed"] = self.remove(list(known))
+
+        logger.info(f"Synced {root}: {counts}")
+        return counts
+
+    def sync_file(
+        self,
+        file_path: str,
+        stat: Optional[os.stat_result] = None,
+        known: Optional[Tuple] = None,
+    ) -> str:
+        """Ingest a single file if it is new or has changed.
+
+        Args:
+            file_path (str): The path to the file.
+            stat (Optional[os.stat_result], optional): The file's stat, if already known.
+            known (Optional[Tuple], optional): The file's `source_file` row, if already
+                known. Defaults to None, which looks it up.
+
+        Returns:
+            str: `added`, `modified`, `unchanged` or `failed`.
+        """
+        file_path = os.path.abspath(file_path)
+        stat = stat or os.stat(file_path)
+
+        if known is None:
+            known = self._known_file(file_path)
+
+        if known is not None:
+            size, mtime_ns, content_hash, file_uuid = known
+            if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                return "unchanged"
+        else:
+            content_hash = file_uuid = None
+
+        new_content_hash = file_content_hash(file_path)
+
+        if new_content_hash == content_hash:
+            # Touched, but not changed.
+            self.db.execute(
+                "UPDATE source_file SET size = ?, mtime_ns = ?, synced_at = ? WHERE file_path = ?",
+                (stat.st_size, stat.st_mtime_ns, datetime.now(), file_path),
+            )
+            return "unchanged"
+
+        try:
+            new_file_uuid, document_hash = self._ingest(file_path, new_content_hash)
+        except Exception as e:
+            logger.error(f"Failed to process {file_path}: {e}")
+            return "failed"
+
+        self.db.begin()
+        try:
+            if file_uuid is not None and file_uuid != new_file_uuid:
+                self.db.execute("DELETE FROM uploaded_file WHERE file_uuid = ?", (file_uuid,))
+
+            self.db.execute(
+                """--sql
+                    INSERT OR REPLACE INTO source_file (
+                        file_path,
+                        size,
+                        mtime_ns,
+                        content_hash,
+                        file_uuid,
+                        document_hash,
+                        synced_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    file_path,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    new_content_hash,
+                    new_file_uuid,
+                    document_hash,
+                    datetime.now(),
+                ),
+            )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        return "added" if known is None else "modified"
+
+    def remove(self, file_paths: List[str]) -> int:
+        """Remove synced files, and the documents only they referred to.
+
+        Returns:
+            int: The number of files removed.
+        """
+        self.db.begin()
+        try:
+            self.db.execute(
+                """--sql
+                    DELETE FROM uploaded_file
+                    WHERE file_uuid IN (
+                        SELECT file_uuid FROM source_file
+                        WHERE file_path IN (SELECT UNNEST(?::STRING[]))
+                    )
+                """,
+                (file_paths,),
+            )
+            removed = self.db.execute(
+                "DELETE FROM source_file WHERE file_path IN (SELECT UNNEST(?::STRING[]))",
+                (file_paths,),
+            ).fetchone()[0]
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        collect_garbage(self.db)
+        return removed
+
+    def remove_missing(self, paths: List[str]) -> int:
+        """Remove synced files at or under `paths` that are no longer on disk.
+
+        Returns:
+            int: The number of files removed.
+        """
+        missing = []
+        for path in paths:
+            path = os.path.abspath(path)
+            rows = self.db.execute(
+                """--sql
+                    SELECT file_path FROM source_file
+                    WHERE file_path = ? OR starts_with(file_path, ?)
+                """,
+                (path, os.path.join(path, "")),
+            ).fetchall()
+            missing.extend(file_path for file_path, in rows if not os.path.exists(file_path))
+
+        return self.remove(missing) if missing else 0
+
+    def _ingest(self, file_path: str, content_hash: str) -> Tuple[str, bytes]:
+        # A file with the same bytes may have been ingested from another path.
+        row = self.db.execute(
+            """--sql
+                SELECT document_hash FROM uploaded_file
+                WHERE
+                    content_hash = ?
+                    AND document_hash IN (SELECT document_hash FROM document)
+                LIMIT 1
+            """,
+            (content_hash,),
+        ).fetchone()
+
+        if row is not None:
+            file_uuid = str(uuid.uuid4())
+            self.db.execute(
+                """--sql
+                    INSERT INTO uploaded_file (
+                        file_uuid,
+                        file_path,
+                        document_hash,
+                        session_id,
+                        uploaded_at,
+                        content_hash
+                    )
+                    VALUES (?, ?, ?, NULL, ?, ?)
+                """,
+                (file_uuid, file_path, row[0], datetime.now(), content_hash),
+            )
+            return file_uuid, row[0]
+
+        self.pipeline(FileUploaded(file_path=file_path, content_hash=content_hash))
+
+        return self.db.execute(
+            """--sql
+                SELECT file_uuid, document_hash FROM uploaded_file
+                WHERE
+                    file_path = ?
+                    AND content_hash = ?
+                    AND session_id IS NULL
+                ORDER BY uploaded_at DESC
+                LIMIT 1
+            """,
+            (file_path, content_hash),
+        ).fetchone()
+
+    def _known_file(self, file_path: str) -> Optional[Tuple]:
+        return self.db.execute(
+            "SELECT size, mtime_ns, content_hash, file_uuid FROM source_file WHERE file_path = ?",
+            (file_path,),
+        ).fetchone()
+
+    def _known_files(self, root: str) -> Dict[str, Tuple]:
+        rows = self.db.execute(
+            """--sql
+                SELECT file_path, size, mtime_ns, content_hash, file_uuid
+                FROM source_file
+                WHERE starts_with(file_path, ?)
+            """,
+            (os.path.join(root, ""),),
+        ).fetchall()
+
+        return {file_path: tuple(rest) for file_path, *rest in rows}
@@ -0,0 +1,243 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from pdf_rag_chatbot.data_pipeline.file_sync import is_supported_file, scan_directory
+
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """A minimal inotify binding: recursive watches and non-blocking reads."""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._inotify_add_watch = libc.inotify_add_watch
+        self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = self._get_errno()
+            raise OSError(e, os.strerror(e))
+
+        self.paths: Dict[int, str] = {}
+
+    def watch_tree(self, root: str):
+        for dirpath, _, _ in os.walk(root):
+            wd = self._inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                e = self._get_errno()
+                if e == errno.ENOENT:
+                    # Removed again before we got to it.
+                    continue
+                if e == errno.ENOSPC:
+                    raise OSError(e, "Out of inotify watches, raise fs.inotify.max_user_watches.")
+                raise OSError(e, os.strerror(e), dirpath)
+
+            self.paths[wd] = dirpath
+
+    def read(self, timeout: float) -> List[Tuple[str, int]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+
+            directory = self.paths.get(wd)
+            if directory is None and not mask & IN_Q_OVERFLOW:
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            events.append((path, mask))
+
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWatcher:
+    def __init__(
+        self,
+        root: str,
+        debounce: float = 2.0,
+        poll_interval: float = 5.0,
+        use_inotify: Optional[bool] = None,
+    ):
+        """Watch a directory tree for supported files that are added, changed or removed.
+
+        On Linux the watcher subscribes to inotify events, elsewhere, or when
+        inotify is unavailable, it polls the tree every `poll_interval` seconds.
+        A file is only reported once it has seen no writes for `debounce`
+        seconds, so files that are still being copied aren't picked up half
+        written.
+
+        Reported paths can be directories, when a directory is moved in or out
+        of the tree, or when inotify dropped events and the whole tree must be
+        checked again.
+
+        Args:
+            root (str): The directory to watch.
+            debounce (float, optional): Seconds without writes before a file is reported.
+                Defaults to 2.0.
+            poll_interval (float, optional): Seconds between scans when polling.
+                Defaults to 5.0.
+            use_inotify (Optional[bool], optional): Force or disable inotify. Defaults to
+                None, which uses inotify when available.
+        """
+        self.root = os.path.abspath(root)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._pending: Dict[str, float] = {}
+        self._removed: Set[str] = set()
+        self._inotify = None
+        self._snapshot = None
+        self._scanned_at = 0.0
+
+        if use_inotify is not False and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+                self._inotify.watch_tree(self.root)
+            except OSError as e:
+                if use_inotify:
+                    raise
+                logger.warning(f"Can't use inotify, polling {self.root} instead: {e}")
+                self._inotify = None
+
+        if self._inotify is None:
+            self._snapshot = self._scan()
+            self._scanned_at = time.monotonic()
+
+    def watch(self, stop_event: Optional[threading.Event] = None) -> Iterator[Tuple[List[str], List[str]]]:
+        """Yield `(changed, removed)` paths as they settle, until `stop_event` is set."""
+        while stop_event is None or not stop_event.is_set():
+            changed, removed = self.poll()
+            if changed or removed:
+                yield changed, removed
+
+    def poll(self, timeout: float = 1.0) -> Tuple[List[str], List[str]]:
+        """Wait up to `timeout` seconds for events, and return the paths that have settled."""
+        if self._inotify is not None:
+            self._read_events(timeout)
+        else:
+            time.sleep(timeout)
+            if time.monotonic() - self._scanned_at >= self.poll_interval:
+                self._rescan()
+
+        now = time.monotonic()
+        changed = [
+            path for path, changed_at in self._pending.items()
+            if now - changed_at >= self.debounce and self._settled(changed_at)
+        ]
+        for path in changed:
+            del self._pending[path]
+
+        removed = sorted(self._removed)
+        self._removed.clear()
+
+        return changed, removed
+
+    def _settled(self, changed_at: float) -> bool:
+        # When polling, a file has only stopped changing once a later scan agrees.
+        return self._inotify is not None or self._scanned_at > changed_at
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _read_events(self, timeout: float):
+        events = self._inotify.read(timeout)
+        now = time.monotonic()
+
+        for path, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                logger.warning(f"Missed file events, checking all of {self.root} again.")
+                self._pending[self.root] = now
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if path == self.root:
+                    logger.warning(f"{self.root} was removed.")
+                    self._removed.add(path)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have landed before the directory was watched.
+                    self._inotify.watch_tree(path)
+                    self._pending[path] = now
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._removed.add(path)
+            elif is_supported_file(path):
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._pending.pop(path, None)
+                    self._removed.add(path)
+                else:
+                    self._pending[path] = now
+                    self._removed.discard(path)
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        return {
+            path: (stat.st_size, stat.st_mtime_ns)
+            for path, stat in scan_directory(self.root)
+        }
+
+    def _rescan(self):
+        now = time.monotonic()
+        snapshot = self._scan()
+
+        for path, state in snapshot.items():
+            if self._snapshot.get(path) != state:
+                self._pending[path] = now
+
+        for path in self._snapshot.keys() - snapshot.keys():
+            self._pending.pop(path, None)
+            self._removed.add(path)
+
+        self._snapshot = snapshot
+        self._scanned_at = now
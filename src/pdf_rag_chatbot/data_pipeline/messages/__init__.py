@@ -5,4 +5,7 @@ from pdf_rag_chatbot.data_pipeline.messages.messages import (
 	DocumentCreated,
 	SentenceCreated,
 	EntityCreated,
+	ChunkCreated,
+	MESSAGE_TYPES,
+	parse_message,
 )
\ No newline at end of file
@@ -1,12 +1,13 @@
 import uuid
-from typing import Optional, Union
+from typing import Dict, Optional, Type, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, SerializeAsAny
 
 from pdf_rag_chatbot.db.models import (
 	Document,
 	Sentence,
 	Entity,
+	Chunk,
 )
 
 class Message(BaseModel):
@@ -16,11 +17,13 @@ class DeadLetterMessage(Message):
 	step: str
 	error: str
 	traceback: str
-	request: Message
+	request: SerializeAsAny[Message]
+	attempts: int = 1
 
 class FileUploaded(Message):
 	file_path: str
 	session_id: Optional[str] = None
+	content_hash: Optional[str] = None
 
 class DocumentCreated(Message):
 	document: Document
@@ -29,4 +32,16 @@ class SentenceCreated(Message):
 	sentence: Sentence
 
 class EntityCreated(Message):
-	entity: Entity
\ No newline at end of file
+	entity: Entity
+
+class ChunkCreated(Message):
+	chunk: Chunk
+
+MESSAGE_TYPES: Dict[str, Type[Message]] = {
+	t.__name__: t
+	for t in (FileUploaded, DocumentCreated, SentenceCreated, EntityCreated, ChunkCreated)
+}
+
+def parse_message(message_type: str, data: str) -> Message:
+	"""Deserialize a message from its type name and JSON."""
+	return MESSAGE_TYPES[message_type].model_validate_json(data)
@@ -0,0 +1,236 @@
+import os
+import time
+import tempfile
+from typing import Callable, ContextManager, Dict, List, Optional, Tuple
+
+import duckdb
+from duckdb import DuckDBPyConnection
+from loguru import logger
+
+from pdf_rag_chatbot.db.settings import EMBEDDING_MODEL, set_setting
+from pdf_rag_chatbot.data_pipeline.steps import Embed
+
+
+Connect = Callable[[], ContextManager[DuckDBPyConnection]]
+
+# Every distinct retrieval unit and entity text in the warehouse.
+TEXTS_QUERY = """--sql
+    SELECT
+        cased_text_hash,
+        ANY_VALUE(uncased_text_hash) AS uncased_text_hash,
+        ANY_VALUE(text) AS text
+    FROM (
+        SELECT
+            cased_text_hash,
+            uncased_text_hash,
+            text
+        FROM retrieval_unit
+        UNION ALL
+        SELECT
+            cased_entity_hash AS cased_text_hash,
+            uncased_entity_hash AS uncased_text_hash,
+            text
+        FROM entity
+    )
+    GROUP BY cased_text_hash
+"""
+
+
+class Reembed:
+    def __init__(
+        self,
+        connect: Connect,
+        embed: Embed,
+        batch_size: int = 1024,
+        max_rate: Optional[float] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        """Backfill embeddings for a new model alongside the existing ones.
+
+        Each pass copies the distinct retrieval unit and entity texts that have no
+        embedding for the new model yet to a local file in a single query, then
+        embeds them from there a batch at a time, so it can be stopped and resumed
+        at any time. The warehouse is only held while the pass starts and while a
+        batch is written, never while the model runs, so processes that open it
+        briefly, such as ingest workers and a chat server in worker mode, carry on
+        meanwhile. A chat server that ingests files itself keeps the warehouse open
+        for as long as it runs, so it has to be stopped first.
+
+        Args:
+            connect (Connect): Opens a short-lived connection to the warehouse.
+            embed (Embed): The embedding step, loaded with the new model.
+            batch_size (int, optional): Texts embedded and written at a time. Defaults to 1024.
+            max_rate (Optional[float], optional): The maximum number of texts embedded
+                per second. Defaults to None, which is unlimited.
+            progress (Optional[Callable[[int, int], None]], optional): Called after every
+                batch with the number of texts done and the total. Defaults to None.
+        """
+        self.connect = connect
+        self.embed = embed
+        self.batch_size = batch_size
+        self.max_rate = max_rate
+        self.progress = progress
+
+    @property
+    def model_name(self) -> str:
+        return self.embed.model_name
+
+    def coverage(self) -> Tuple[int, int]:
+        """Return the number of texts embedded with the new model, and the total."""
+        with self.connect() as db:
+            return self._coverage(db)
+
+    def run(self, switch: bool = True) -> int:
+        """Embed every text that has no embedding for the new model.
+
+        Args:
+            switch (bool, optional): Make the new model the warehouse's active
+                embedding model once every text is covered. Defaults to True.
+
+        Returns:
+            int: The number of texts embedded.
+        """
+        done, total = self.coverage()
+        logger.info(f"{done}/{total} texts are embedded with {self.model_name}.")
+
+        embedded = self._backfill(done, total)
+
+        if switch:
+            # Text ingested while the backfill ran was embedded with the old
+            # model, so keep going until a pass finds nothing left to do.
+            while True:
+                with self.connect() as db:
+                    db.begin()
+                    done, total = self._coverage(db)
+                    if done == total:
+                        set_setting(db, EMBEDDING_MODEL, self.model_name)
+                        db.commit()
+                        break
+                    db.rollback()
+
+                embedded += self._backfill(done, total)
+
+            logger.info(f"Switched the active embedding model to {self.model_name}.")
+
+            # Files that were mid-ingest during the switch may still have
+            # committed text embedded with the old model.
+            embedded += self._backfill(*self.coverage())
+
+        return embedded
+
+    def _coverage(self, db: DuckDBPyConnection) -> Tuple[int, int]:
+        return db.execute(
+            f"""--sql
+                SELECT
+                    COUNT(te.cased_text_hash),
+                    COUNT(*)
+                FROM ({TEXTS_QUERY}) t
+                LEFT JOIN text_embedding te
+                    ON te.cased_text_hash = t.cased_text_hash
+                    AND te.model_name = ?
+            """,
+            (self.model_name,),
+        ).fetchone()
+
+    def _backfill(self, done: int, total: int) -> int:
+        embedded = 0
+        started_at = time.monotonic()
+
+        with tempfile.TemporaryDirectory(prefix="pdf-rag-reembed-") as tmp_dir:
+            path = os.path.join(tmp_dir, "pending.parquet").replace("'", "''")
+            model_name = self.model_name.replace("'", "''")
+
+            # One scan of the warehouse finds every pending text, rather than one
+            # per batch. Text ingested meanwhile is left to the next pass.
+            with self.connect() as db:
+                db.execute(
+                    f"""--sql
+                        COPY (
+                            SELECT
+                                cased_text_hash,
+                                uncased_text_hash,
+                                text
+                            FROM ({TEXTS_QUERY}) t
+                            WHERE NOT EXISTS (
+                                SELECT 1
+                                FROM text_embedding te
+                                WHERE
+                                    te.cased_text_hash = t.cased_text_hash
+                                    AND te.model_name = '{model_name}'
+                            )
+                            ORDER BY cased_text_hash
+                        ) TO '{path}' (FORMAT PARQUET)
+                    """
+                )
+
+            pending = duckdb.connect()
+            try:
+                result = pending.execute(f"SELECT * FROM read_parquet('{path}')")
+
+                while True:
+                    batch = result.fetchmany(self.batch_size)
+                    if not batch:
+                        break
+
+                    batch_started_at = time.monotonic()
+
+                    embeddings = self.embed.encode_cached(
+                        [cased_text_hash for cased_text_hash, _, _ in batch],
+                        [text for _, _, text in batch],
+                    )
+                    self._write(batch, embeddings.tolist())
+
+                    embedded += len(batch)
+                    done += len(batch)
+
+                    if self.progress is not None:
+                        self.progress(done, total)
+
+                    elapsed = time.monotonic() - started_at
+                    logger.info(
+                        f"Embedded {done}/{total} texts with {self.model_name} "
+                        f"({embedded / elapsed:.0f} texts/s)."
+                    )
+
+                    if self.max_rate is not None:
+                        min_duration = len(batch) / self.max_rate
+                        time.sleep(max(0.0, min_duration - (time.monotonic() - batch_started_at)))
+            finally:
+                pending.close()
+
+        return embedded
+
+    def _write(self, batch: List[Tuple[bytes, bytes, str]], embeddings: List[List[float]]):
+        with self.connect() as db:
+            db.executemany(
+                """--sql
+                    INSERT INTO text_embedding (
+                        cased_text_hash,
+                        uncased_text_hash,
+                        model_name,
+                        embedding
+                    )
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                """,
+                [
+                    (cased_text_hash, uncased_text_hash, self.model_name, embedding)
+                    for (cased_text_hash, uncased_text_hash, _), embedding in zip(batch, embeddings)
+                ],
+            )
+
+
+def embedding_coverage(db: DuckDBPyConnection) -> Dict[str, int]:
+    """Return the number of distinct texts embedded with each model."""
+    rows = db.execute(
+        f"""--sql
+            SELECT
+                model_name,
+                COUNT(*)
+            FROM text_embedding
+            WHERE cased_text_hash IN (SELECT cased_text_hash FROM ({TEXTS_QUERY}))
+            GROUP BY model_name
+        """
+    ).fetchall()
+
+    return dict(rows)
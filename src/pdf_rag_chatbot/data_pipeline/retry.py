@@ -0,0 +1,65 @@
+import random
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+
+# Errors that will fail the same way no matter how often they are retried.
+PERMANENT_ERRORS = (
+    AssertionError,
+    FileNotFoundError,
+    IsADirectoryError,
+    UnicodeDecodeError,
+)
+
+
+class RetryPolicy(BaseModel):
+    max_attempts: int = 3
+    initial_backoff: float = 1.0
+    backoff_multiplier: float = 2.0
+    max_backoff: float = 60.0
+    jitter: float = 0.1
+
+    def should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Return True if a request that failed with `error` on `attempt` should be retried."""
+        return attempt < self.max_attempts and not isinstance(error, PERMANENT_ERRORS)
+
+    def backoff(self, attempt: int) -> float:
+        """Return the number of seconds to wait before retrying after `attempt` failed."""
+        delay = min(
+            self.initial_backoff * (self.backoff_multiplier ** (attempt - 1)),
+            self.max_backoff,
+        )
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+def parse_retry_policies(specs: List[str]) -> Dict[str, RetryPolicy]:
+    """Parse retry policies given on the command line.
+
+    Each spec has the form `STEP=MAX_ATTEMPTS[:INITIAL_BACKOFF[:MAX_BACKOFF]]`,
+    e.g. `embed=5:2:120`.
+
+    Args:
+        specs (List[str]): The specs to parse.
+
+    Returns:
+        Dict[str, RetryPolicy]: Retry policies keyed by step name.
+
+    Raises:
+        ValueError: If a spec is malformed.
+    """
+    policies = {}
+
+    for spec in specs:
+        step, sep, values = spec.partition("=")
+        if not sep or not step:
+            raise ValueError(f"Invalid retry policy: {spec!r}")
+
+        fields = ["max_attempts", "initial_backoff", "max_backoff"]
+        parts = values.split(":")
+        if len(parts) > len(fields):
+            raise ValueError(f"Invalid retry policy: {spec!r}")
+
+        policies[step] = RetryPolicy(**dict(zip(fields, parts)))
+
+    return policies
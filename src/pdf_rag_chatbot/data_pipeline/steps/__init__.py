@@ -1,3 +1,3 @@
-from pdf_rag_chatbot.data_pipeline.steps.ingest import Ingest
+from pdf_rag_chatbot.data_pipeline.steps.ingest import Ingest, known_document, record_upload
 from pdf_rag_chatbot.data_pipeline.steps.nlp import NLP
-from pdf_rag_chatbot.data_pipeline.steps.embed import Embed
\ No newline at end of file
+from pdf_rag_chatbot.data_pipeline.steps.embed import Embed, DEFAULT_MODEL_NAME
\ No newline at end of file
@@ -1,42 +1,287 @@
-import hashlib
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
 import torch
 
 from duckdb import DuckDBPyConnection
 from sentence_transformers import SentenceTransformer
 
+from pdf_rag_chatbot.db.keys import text_key
 from pdf_rag_chatbot.data_pipeline.steps.pipeline_step import PipelineStep
 from pdf_rag_chatbot.data_pipeline.messages import (
+    Message,
     SentenceCreated,
     EntityCreated,
+    ChunkCreated,
 )
 
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# `torch` runs the model as is, `int8` dynamically quantizes its linear layers
+# for CPU inference, and `onnx` runs it with ONNX Runtime.
+BACKENDS = ["torch", "int8", "onnx"]
+
+# Looks up the stored embeddings of text hashes for a model, e.g. in a warehouse
+# other than the one the step writes to.
+EmbeddingSource = Callable[[List[bytes], str], Dict[bytes, List[float]]]
+
 class Embed(PipelineStep):
     def __init__(
         self,
         db: DuckDBPyConnection,
-        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        model_name: str = DEFAULT_MODEL_NAME,
+        backend: str = "torch",
+        num_threads: Optional[int] = None,
+        batch_size: int = 64,
+        num_workers: int = 0,
+        cache_path: Optional[str] = None,
+        embedding_source: Optional[EmbeddingSource] = None,
     ):
+        """Initialize the embedding step.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            model_name (str, optional): The sentence-transformers model to use.
+            backend (str, optional): One of `torch`, `int8` or `onnx`. The `int8` and
+                `onnx` backends only run on CPU. Defaults to "torch".
+            num_threads (Optional[int], optional): The number of threads used for CPU
+                inference. Defaults to None, which leaves the library default.
+            batch_size (int, optional): The batch size for the model. Defaults to 64.
+            num_workers (int, optional): Embed batches in this many worker processes,
+                each with its own copy of the model and `num_threads` threads. Defaults
+                to 0, which embeds in this process.
+            cache_path (Optional[str], optional): A directory for an embedding cache
+                shared with other warehouses, see `EmbeddingCache`. Defaults to None.
+            embedding_source (Optional[EmbeddingSource], optional): Where to look up texts
+                the database has no embedding for, before they are embedded. Embeddings
+                found there are copied. Defaults to None.
+        """
         super().__init__(
             "embed",
-            request_type=[SentenceCreated, EntityCreated],
+            request_type=[SentenceCreated, EntityCreated, ChunkCreated],
             db=db
         )
 
-        if torch.cuda.is_available():
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}.")
+
+        if backend != "torch":
+            self.device = torch.device("cpu")
+        elif torch.cuda.is_available():
             self.device = torch.device("cuda")
         elif torch.backends.mps.is_available() and torch.backends.mps.is_built():
             self.device = torch.device("mps")
+        else:
+            self.device = torch.device("cpu")
 
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name, device=self.device)
+        self.backend = backend
+        self.num_threads = num_threads
+        self.batch_size = batch_size
+        self.pool = None
+        self.cache = None
+        self.embedding_source = embedding_source
+        self._model = None
+
+        if cache_path is not None:
+            from pdf_rag_chatbot.data_pipeline.embedding_cache import EmbeddingCache
+
+            self.cache = EmbeddingCache(cache_path, model_name)
+
+        if num_workers > 0:
+            from pdf_rag_chatbot.data_pipeline.embedding_pool import EmbeddingPool
+
+            self.pool = EmbeddingPool(
+                model_name,
+                num_workers=num_workers,
+                backend=backend,
+                threads_per_worker=num_threads,
+                batch_size=batch_size,
+            )
+        else:
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+
+            self._model = self._load_model()
+
+    @property
+    def model(self) -> SentenceTransformer:
+        # With a worker pool the model is only loaded here if it's used directly,
+        # e.g. to embed search queries.
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
+
+    def close(self):
+        """Write out buffered cache entries and shut down the worker pool, if any."""
+        if self.cache is not None:
+            self.cache.flush()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def _load_model(self) -> SentenceTransformer:
+        if self.backend == "onnx":
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+
+            if self.num_threads is not None:
+                import onnxruntime
+
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = self.num_threads
+                model_kwargs["session_options"] = session_options
+
+            try:
+                return SentenceTransformer(
+                    self.model_name,
+                    device="cpu",
+                    backend="onnx",
+                    model_kwargs=model_kwargs,
+                )
+            except TypeError as e:
+                raise ValueError(
+                    "The onnx backend needs sentence-transformers>=3.2, "
+                    "install it with `pdm install -G onnx`."
+                ) from e
+
+        model = SentenceTransformer(self.model_name, device=self.device)
+
+        if self.backend == "int8":
+            model = torch.quantization.quantize_dynamic(
+                model,
+                {torch.nn.Linear},
+                dtype=torch.qint8,
+            )
+
+        return model
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Embed a batch of texts.
+
+        Texts are sorted by length before they are split into model batches, so
+        each batch pads to a similar length, and returned in their original order.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            batch_size (Optional[int], optional): The batch size for the model.
+                Defaults to the step's batch size.
+
+        Returns:
+            np.ndarray: The embeddings, one row per text.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        if self.pool is not None:
+            return self.pool.encode(texts)
+
+        order = np.argsort([len(text) for text in texts], kind="stable")
+
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                [texts[i] for i in order],
+                batch_size=batch_size or self.batch_size,
+                convert_to_numpy=True,
+            )
+
+        result = np.empty_like(embeddings)
+        result[order] = embeddings
+        return result
+
+    def encode_cached(self, hashes: List[bytes], texts: List[str]) -> np.ndarray:
+        """Embed texts, taking the ones already in the embedding cache from there.
 
-    def __call__(self, req: SentenceCreated | EntityCreated) -> None:
+        Args:
+            hashes (List[bytes]): The cased text hash of each text.
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: The embeddings, one row per text.
+        """
+        if self.cache is None:
+            return self.encode(texts)
+
+        cached = self.cache.get_many(hashes)
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+
+        if missing:
+            embeddings = self.encode([texts[i] for i in missing])
+            self.cache.put_many([hashes[i] for i in missing], embeddings)
+            cached.update(zip((hashes[i] for i in missing), embeddings))
+
+        return np.vstack([cached[h] for h in hashes])
+
+    def call_many(self, reqs: List[Message]) -> List[Message]:
+        """Embed a batch of sentences, entities and chunks with as few model calls as possible."""
+        texts = {}
+        for req in reqs:
+            text = self._text(req)
+            texts.setdefault(text_key(text), text)
+
+        if not texts:
+            return []
+
+        existing = self.db.execute(
+            """--sql
+                SELECT cased_text_hash
+                FROM text_embedding
+                WHERE
+                    cased_text_hash IN (SELECT UNNEST(?::BLOB[]))
+                    AND model_name = ?
+            """,
+            (list(texts.keys()), self.model_name),
+        ).fetchall()
+
+        for cased_text_hash, in existing:
+            del texts[cased_text_hash]
+
+        if not texts:
+            return []
+
+        embeddings = {}
+        if self.embedding_source is not None:
+            embeddings = self.embedding_source(list(texts.keys()), self.model_name)
+
+        missing = [h for h in texts if h not in embeddings]
+        if missing:
+            encoded = self.encode_cached(missing, [texts[h] for h in missing])
+            embeddings.update(zip(missing, encoded.tolist()))
+
+        self.db.executemany(
+            """--sql
+                INSERT INTO text_embedding (
+                    cased_text_hash,
+                    uncased_text_hash,
+                    model_name,
+                    embedding
+                )
+                VALUES (?, ?, ?, ?)
+            """,
+            [
+                (
+                    cased_text_hash,
+                    text_key(text.lower()),
+                    self.model_name,
+                    embeddings[cased_text_hash],
+                )
+                for cased_text_hash, text in texts.items()
+            ],
+        )
+
+        return []
+
+    def _text(self, req: SentenceCreated | EntityCreated | ChunkCreated) -> str:
         if isinstance(req, SentenceCreated):
-            text = req.sentence.text
+            return req.sentence.text
+        elif isinstance(req, ChunkCreated):
+            return req.chunk.text
         else:
-            text = req.entity.text
+            return req.entity.text
+
+    def __call__(self, req: SentenceCreated | EntityCreated | ChunkCreated) -> None:
+        text = self._text(req)
 
-        cased_text_hash = hashlib.md5(text.encode()).hexdigest()
+        cased_text_hash = text_key(text)
 
         r = self.db.execute(
             """--sql
@@ -53,9 +298,9 @@ class Embed(PipelineStep):
         if r[0] == True:
             return
 
-        uncased_text_hash = hashlib.md5(text.lower().encode()).hexdigest()
+        uncased_text_hash = text_key(text.lower())
 
-        embedding = self.model.encode([text])[0].tolist()
+        embedding = self.encode_cached([cased_text_hash], [text])[0].tolist()
 
         self.db.execute(
             """--sql
@@ -63,12 +308,11 @@ class Embed(PipelineStep):
                     cased_text_hash,
                     uncased_text_hash,
                     model_name,
-                    text,
                     embedding
                 )
-                VALUES (?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?)
             """,
-            (cased_text_hash, uncased_text_hash, self.model_name, text, embedding)
+            (cased_text_hash, uncased_text_hash, self.model_name, embedding)
         )
 
         return
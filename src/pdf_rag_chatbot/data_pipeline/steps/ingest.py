@@ -1,25 +1,15 @@
 import uuid
-import hashlib
-from io import StringIO
 from typing import Optional
 
 from duckdb import DuckDBPyConnection
 
-from pdfminer.converter import TextConverter as PDFMinerTextConverter
-from pdfminer.layout import LAParams as PDFMinerLAParams
-from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import (
-    PDFResourceManager,
-    PDFPageInterpreter
-)
-from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfparser import PDFParser
-
-
+from pdf_rag_chatbot.db.document_store import insert_documents, open_document_store
+from pdf_rag_chatbot.db.keys import document_key
 from pdf_rag_chatbot.db.models import (
     UploadedFile,
     Document,
 )
+from pdf_rag_chatbot.data_pipeline.extractors import PDFExtractor, PDFMinerExtractor
 from pdf_rag_chatbot.data_pipeline.steps.pipeline_step import PipelineStep
 from pdf_rag_chatbot.data_pipeline.messages import (
     FileUploaded,
@@ -28,50 +18,51 @@ from pdf_rag_chatbot.data_pipeline.messages import (
 
 
 class Ingest(PipelineStep):
-    def __init__(self, db: DuckDBPyConnection):
+    def __init__(
+        self,
+        db: DuckDBPyConnection,
+        extractor: Optional[PDFExtractor] = None,
+        document_store: Optional[str] = None,
+    ):
+        """Initialize the ingest step.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            extractor (Optional[PDFExtractor], optional): Extracts the text of PDF files.
+                Defaults to None, which uses pdfminer with full layout analysis.
+            document_store (Optional[str], optional): A directory to keep document bodies
+                in, outside of the warehouse, from now on. Defaults to None, which uses
+                the directory the warehouse was given before, if any.
+        """
         super().__init__(
             "ingest",
             db=db,
             request_type=FileUploaded,
         )
+        self.extractor = extractor or PDFMinerExtractor()
+        self.document_store = document_store
 
     def __call__(self, req: FileUploaded) -> Optional[Document]:
         assert req.file_path.split(".")[-1].lower() in ["pdf", "txt", "text"], "Invalid file extension."
 
-        if req.file_path.endswith(".pdf"):
-            text = self._extract_text_from_pdf(req.file_path)
+        # A file with the same bytes was already ingested, so only this upload is recorded.
+        known_hash = known_document(self.db, req.content_hash)
+
+        if known_hash is not None:
+            text, document_hash = None, known_hash
         else:
-            with open(req.file_path, "r") as f:
-                text = f.read()
-        
-        document_hash = hashlib.sha256(text.encode()).hexdigest()
-
-        uploaded_file = UploadedFile(
-            file_uuid=str(uuid.uuid4()),
-            file_path=req.file_path,
-            document_hash=document_hash,
-            session_id=req.session_id,
-        )
+            if req.file_path.endswith(".pdf"):
+                text = self.extractor(req.file_path)
+            else:
+                with open(req.file_path, "r") as f:
+                    text = f.read()
 
-        self.db.execute(
-            """--sql
-                INSERT INTO uploaded_file (
-                    file_uuid,
-                    file_path,
-                    document_hash,
-                    session_id,
-                    uploaded_at
-                )
-                VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                uploaded_file.file_uuid,
-                uploaded_file.file_path,
-                uploaded_file.document_hash,
-                uploaded_file.session_id,
-                uploaded_file.uploaded_at,
-            ),
-        )
+            document_hash = document_key(text)
+
+        record_upload(self.db, req, document_hash)
+
+        if known_hash is not None:
+            return None
 
         # Check if the document has already been processed
         res = self.db.execute(
@@ -87,48 +78,79 @@ class Ingest(PipelineStep):
             text=text,
         )
 
-        self.db.execute(
-            """--sql
-                INSERT INTO document (
-                    document_hash,
-                    text,
-                    processed_at
-                )
-                VALUES (?, ?, ?)
-            """,
-            (
-                document.document_hash,
-                document.text,
-                document.processed_at,
-            ),
+        insert_documents(
+            self.db,
+            [(document.document_hash, document.text, document.processed_at)],
+            # Resolved per document, as workers swap in a connection for each job.
+            open_document_store(self.db, self.document_store),
         )
 
         return DocumentCreated(
             document=document
         )
 
-    def _extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from a PDF file.
 
-        Args:
-            file_path (str): The name of the PDF file.
-
-        Returns:
-            str: The extracted text.
-        """
-
-        output_string = StringIO()
-        with open(file_path, 'rb') as f:
-            parser = PDFParser(f)
-            doc = PDFDocument(parser)
-            rsrcmgr = PDFResourceManager()
-            device = PDFMinerTextConverter(
-                rsrcmgr,
-                output_string,
-                laparams=PDFMinerLAParams(),
+def known_document(db: DuckDBPyConnection, content_hash: Optional[str]) -> Optional[bytes]:
+    """Find the document of a file whose bytes were ingested before.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        content_hash (Optional[str]): The hash of the file's bytes.
+
+    Returns:
+        Optional[bytes]: The document's hash, or None if the bytes are new.
+    """
+    if content_hash is None:
+        return None
+
+    row = db.execute(
+        """--sql
+            SELECT document_hash FROM uploaded_file
+            WHERE
+                content_hash = ?
+                AND document_hash IN (SELECT document_hash FROM document)
+            LIMIT 1
+        """,
+        (content_hash,),
+    ).fetchone()
+
+    return row[0] if row is not None else None
+
+
+def record_upload(db: DuckDBPyConnection, req: FileUploaded, document_hash: bytes) -> UploadedFile:
+    """Record an upload of a file, whose text is the given document.
+
+    Returns:
+        UploadedFile: The recorded upload.
+    """
+    uploaded_file = UploadedFile(
+        file_uuid=str(uuid.uuid4()),
+        file_path=req.file_path,
+        document_hash=document_hash,
+        session_id=req.session_id,
+        content_hash=req.content_hash,
+    )
+
+    db.execute(
+        """--sql
+            INSERT INTO uploaded_file (
+                file_uuid,
+                file_path,
+                document_hash,
+                session_id,
+                uploaded_at,
+                content_hash
             )
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            for page in PDFPage.create_pages(doc):
-                interpreter.process_page(page)
-
-        return output_string.getvalue()
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            uploaded_file.file_uuid,
+            uploaded_file.file_path,
+            uploaded_file.document_hash,
+            uploaded_file.session_id,
+            uploaded_file.uploaded_at,
+            uploaded_file.content_hash,
+        ),
+    )
+
+    return uploaded_file
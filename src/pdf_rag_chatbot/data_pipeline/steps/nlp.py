@@ -1,234 +1,388 @@
 from datetime import datetime
-import hashlib
-from typing import List, Optional, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 from duckdb import DuckDBPyConnection
+import polars as pl
 import spacy
 
+from pdf_rag_chatbot.data_pipeline.chunkers import (
+    Chunker,
+    SentenceChunker,
+    SentenceSpan,
+)
+from pdf_rag_chatbot.data_pipeline.dedup import BoilerplateDetector
+from pdf_rag_chatbot.data_pipeline.steps.embed import DEFAULT_MODEL_NAME
 from pdf_rag_chatbot.data_pipeline.steps.pipeline_step import PipelineStep
 from pdf_rag_chatbot.data_pipeline.messages import (
     DocumentCreated,
     SentenceCreated,
     EntityCreated,
+    ChunkCreated,
 )
+from pdf_rag_chatbot.db.entity_index import index_entities
+from pdf_rag_chatbot.db.keys import text_key
+from pdf_rag_chatbot.db.settings import EMBEDDING_MODEL, get_setting
 from pdf_rag_chatbot.db.models import (
-    DocumentEntity,
-    DocumentSentence,
+    Chunk,
     Entity,
     Sentence,
 )
 
+# Column types of the batches registered with DuckDB, so empty batches insert too.
+SENTENCE_SCHEMA = {
+    "cased_sentence_hash": pl.Binary,
+    "uncased_sentence_hash": pl.Binary,
+    "text": pl.Utf8,
+    "index": pl.Int32,
+    "start_char": pl.Int32,
+    "end_char": pl.Int32,
+    "is_boilerplate": pl.Boolean,
+}
+
+ENTITY_SCHEMA = {
+    "cased_entity_hash": pl.Binary,
+    "uncased_entity_hash": pl.Binary,
+    "text": pl.Utf8,
+    "sentence_index": pl.Int32,
+    "start_char": pl.Int32,
+    "end_char": pl.Int32,
+    "label": pl.Utf8,
+}
+
+CHUNK_SCHEMA = {
+    "cased_chunk_hash": pl.Binary,
+    "uncased_chunk_hash": pl.Binary,
+    "text": pl.Utf8,
+    "chunker": pl.Utf8,
+    "index": pl.Int32,
+    "start_sentence_index": pl.Int32,
+    "end_sentence_index": pl.Int32,
+    "start_char": pl.Int32,
+    "end_char": pl.Int32,
+}
+
+
 class NLP(PipelineStep):
     def __init__(
         self,
         db: DuckDBPyConnection,
         spacy_model: str = "en_core_web_trf",
+        chunker: Optional[Chunker] = None,
+        boilerplate: Optional[BoilerplateDetector] = None,
     ):
+        """Initialize the NLP step.
+
+        A document's sentences, entities and chunks are gathered into column
+        batches, which DuckDB reads directly. Rows for texts the warehouse hasn't
+        seen before are added with a single anti-join per table.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            spacy_model (str, optional): The spaCy pipeline to use.
+            chunker (Optional[Chunker], optional): Groups sentences into the units that
+                are embedded and searched. Defaults to None, which uses every sentence.
+            boilerplate (Optional[BoilerplateDetector], optional): Flags repeated headers,
+                footers and disclaimers, which are kept for context but neither embedded
+                nor searched. Defaults to None, which keeps every sentence.
+        """
         super().__init__("nlp", request_type=DocumentCreated, db=db)
         self.nlp = spacy.load(spacy_model)
+        self.chunker = chunker or SentenceChunker()
+        self.boilerplate = boilerplate
 
-    def __call__(self, req: DocumentCreated) -> Optional[List[SentenceCreated | EntityCreated]]:
+    def __call__(self, req: DocumentCreated) -> Optional[List[SentenceCreated | EntityCreated | ChunkCreated]]:
         document_hash = req.document.document_hash
         doc = self.nlp(req.document.text)
+        processed_at = datetime.now()
 
-        document_entities: List[DocumentEntity] = []
-        document_sentences: List[DocumentSentence] = []
+        sentences: Dict[str, List[Any]] = {column: [] for column in SENTENCE_SCHEMA}
+        entities: Dict[str, List[Any]] = {column: [] for column in ENTITY_SCHEMA}
+        sentence_spans: List[SentenceSpan] = []
 
         for sent_idx, sent in enumerate(doc.sents):
-            ds = DocumentSentence(
-                document_hash=document_hash,
-                cased_sentence_hash=hashlib.md5(sent.text.encode()).hexdigest(),
-                uncased_sentence_hash=hashlib.md5(sent.text.lower().encode()).hexdigest(),
-                text=sent.text,
-                index=sent_idx,
-                start_char=sent.start_char,
-                end_char=sent.end_char,
-                processed_at=datetime.now(),
+            text = sent.text
+            sentences["cased_sentence_hash"].append(text_key(text))
+            sentences["uncased_sentence_hash"].append(text_key(text.lower()))
+            sentences["text"].append(text)
+            sentences["index"].append(sent_idx)
+            sentences["start_char"].append(sent.start_char)
+            sentences["end_char"].append(sent.end_char)
+            sentence_spans.append(SentenceSpan(sent.start_char, sent.end_char, len(sent)))
+
+            for ent in sent.ents:
+                text = ent.text
+                entities["cased_entity_hash"].append(text_key(text))
+                entities["uncased_entity_hash"].append(text_key(text.lower()))
+                entities["text"].append(text)
+                entities["sentence_index"].append(sent_idx)
+                entities["start_char"].append(ent.start_char)
+                entities["end_char"].append(ent.end_char)
+                entities["label"].append(ent.label_)
+
+        boilerplate = set()
+        if self.boilerplate is not None:
+            boilerplate = self.boilerplate(self.db, document_hash, sentences["text"])
+        sentences["is_boilerplate"] = [i in boilerplate for i in sentences["index"]]
+
+        sentence_batch = pl.DataFrame(sentences, schema=SENTENCE_SCHEMA)
+        entity_batch = pl.DataFrame(entities, schema=ENTITY_SCHEMA).filter(
+            ~pl.col("sentence_index").is_in(list(boilerplate))
+        )
+
+        # Sentences are only embedded when they are the retrieval unit.
+        embed_sentences = isinstance(self.chunker, SentenceChunker)
+
+        self.db.register("nlp_sentence_batch", sentence_batch)
+        self.db.register("nlp_entity_batch", entity_batch)
+        try:
+            self._insert_batches(document_hash, processed_at)
+            unembedded_sentences = []
+            if embed_sentences:
+                unembedded_sentences = self._unembedded(
+                    "nlp_sentence_batch",
+                    "cased_sentence_hash",
+                    ["uncased_sentence_hash", "text"],
+                    condition="NOT b.is_boilerplate",
+                )
+            unembedded_entities = self._unembedded(
+                "nlp_entity_batch",
+                "cased_entity_hash",
+                ["uncased_entity_hash", "text", "label"],
             )
+        finally:
+            self.db.unregister("nlp_sentence_batch")
+            self.db.unregister("nlp_entity_batch")
 
-            document_sentences.append(ds)
+        out_messages : List[SentenceCreated | EntityCreated | ChunkCreated] = []
 
-            for ent in sent.ents:
-                de = DocumentEntity(
-                    document_hash=document_hash,
-                    cased_entity_hash=hashlib.md5(ent.text.encode()).hexdigest(),
-                    uncased_entity_hash=hashlib.md5(ent.text.lower().encode()).hexdigest(),
-                    text=ent.text,
-                    sentence_index=sent_idx,
-                    start_char=ent.start_char,
-                    end_char=ent.end_char,
-                    label=ent.label_,
-                    processed_at=datetime.now(),
+        out_messages.extend(
+            SentenceCreated(sentence=Sentence(
+                cased_sentence_hash=cased_hash,
+                uncased_sentence_hash=uncased_hash,
+                text=text,
+                processed_at=processed_at,
+            ))
+            for cased_hash, uncased_hash, text in unembedded_sentences
+        )
+
+        out_messages.extend(
+            EntityCreated(entity=Entity(
+                cased_entity_hash=cased_hash,
+                uncased_entity_hash=uncased_hash,
+                text=text,
+                label=label,
+                processed_at=processed_at,
+            ))
+            for cased_hash, uncased_hash, text, label in unembedded_entities
+        )
+
+        if not embed_sentences:
+            out_messages.extend(
+                self._insert_chunks(
+                    req.document.text,
+                    document_hash,
+                    sentence_spans,
+                    sentences["is_boilerplate"],
+                    processed_at,
                 )
+            )
 
-                document_entities.append(de)
+        index_entities(self.db, [document_hash])
 
+        return out_messages
 
-        self.db.executemany(
+    def _insert_batches(self, document_hash: bytes, processed_at: datetime):
+        # Texts are only kept in the sentence and entity tables.
+        self.db.execute(
             """--sql
-            INSERT INTO document_sentence (
-                document_hash,
-                cased_sentence_hash,
-                uncased_sentence_hash,
-                text,
-                index,
-                start_char,
-                end_char,
-                processed_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO document_sentence BY NAME
+                SELECT
+                    ?::BLOB AS document_hash,
+                    * EXCLUDE (text),
+                    ?::TIMESTAMP AS processed_at
+                FROM nlp_sentence_batch
             """,
-            [
-                (
-                    d.document_hash,
-                    d.cased_sentence_hash,
-                    d.uncased_sentence_hash,
-                    d.text,
-                    d.index,
-                    d.start_char,
-                    d.end_char,
-                    d.processed_at,
-                )
-                for d in document_sentences
-            ],
+            (document_hash, processed_at),
         )
 
-        self.db.executemany(
+        self.db.execute(
             """--sql
-            INSERT INTO document_entity (
-                document_hash,
-                cased_entity_hash,
-                uncased_entity_hash,
-                text,
-                sentence_index,
-                start_char,
-                end_char,
-                label,
-                processed_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO document_entity BY NAME
+                SELECT
+                    ?::BLOB AS document_hash,
+                    * EXCLUDE (text),
+                    ?::TIMESTAMP AS processed_at
+                FROM nlp_entity_batch
             """,
-            [
-                (
-                    d.document_hash,
-                    d.cased_entity_hash,
-                    d.uncased_entity_hash,
-                    d.text,
-                    d.sentence_index,
-                    d.start_char,
-                    d.end_char,
-                    d.label,
-                    d.processed_at,
-                )
-                for d in document_entities
-            ],
+            (document_hash, processed_at),
         )
 
+        # Boilerplate is kept for the context of other sentences, but isn't embedded.
+        self.db.execute(
+            """--sql
+                INSERT INTO sentence (
+                    cased_sentence_hash,
+                    uncased_sentence_hash,
+                    text,
+                    processed_at
+                )
+                SELECT DISTINCT ON (b.cased_sentence_hash)
+                    b.cased_sentence_hash,
+                    b.uncased_sentence_hash,
+                    b.text,
+                    ?::TIMESTAMP
+                FROM nlp_sentence_batch b
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM sentence s
+                    WHERE s.cased_sentence_hash = b.cased_sentence_hash
+                )
+            """,
+            (processed_at,),
+        )
 
-        # Get all of the new sentences and entities that were added
-        # to the database that don't exist in the sentence or entity tables
-        new_objs = self.db.execute(
+        self.db.execute(
             """--sql
-                SELECT
-                    'sentence' AS obj_type,
-                    cased_sentence_hash AS text_hash
-                FROM document_sentence
-                WHERE document_hash = ?
-                AND cased_sentence_hash NOT IN (
-                    SELECT cased_sentence_hash FROM sentence
+                INSERT INTO entity (
+                    cased_entity_hash,
+                    uncased_entity_hash,
+                    text,
+                    label,
+                    processed_at
                 )
-                UNION ALL
-                SELECT
-                    'entity' AS obj_type,
-                    cased_entity_hash AS text_hash
-                FROM document_entity
-                WHERE document_hash = ?
-                AND cased_entity_hash NOT IN (
-                    SELECT cased_entity_hash FROM entity
+                SELECT DISTINCT ON (b.cased_entity_hash)
+                    b.cased_entity_hash,
+                    b.uncased_entity_hash,
+                    b.text,
+                    b.label,
+                    ?::TIMESTAMP
+                FROM nlp_entity_batch b
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM entity e
+                    WHERE e.cased_entity_hash = b.cased_entity_hash
                 )
             """,
-            (document_hash, document_hash),
+            (processed_at,),
+        )
+
+    def _unembedded(
+        self,
+        batch: str,
+        key: str,
+        columns: List[str],
+        condition: str = "TRUE",
+    ) -> List[Tuple[Any, ...]]:
+        # Not only new texts: a text can have a row but no embedding for the active
+        # model, e.g. a line first stored as boilerplate in another document, or
+        # rows merged from a bundle or a worker's scratch database.
+        model_name = get_setting(self.db, EMBEDDING_MODEL, DEFAULT_MODEL_NAME)
+        selected = ", ".join(f"b.{column}" for column in [key, *columns])
+        return self.db.execute(
+            f"""--sql
+                SELECT DISTINCT ON (b.{key}) {selected}
+                FROM {batch} b
+                WHERE
+                    {condition}
+                    AND NOT EXISTS (
+                        SELECT 1 FROM text_embedding te
+                        WHERE
+                            te.cased_text_hash = b.{key}
+                            AND te.model_name = ?
+                    )
+            """,
+            (model_name,),
         ).fetchall()
 
-        obj_map = {
-            "sentence": {},
-            "entity": {},
-        }
-
-        for obj_type, text_hash in new_objs:
-            obj_map[obj_type][text_hash] = True
-
-        out_messages : List[SentenceCreated | EntityCreated] = []
-        added_sentences : Dict[str, Sentence] = {}
-        added_entities : Dict[str, Entity] =  {}
-
-        for ds in document_sentences:
-            if ds.cased_sentence_hash in obj_map["sentence"]:
-                if ds.cased_sentence_hash not in added_sentences:
-                    sent = Sentence(
-                        cased_sentence_hash=ds.cased_sentence_hash,
-                        uncased_sentence_hash=ds.uncased_sentence_hash,
-                        text=ds.text,
-                        processed_at=ds.processed_at,
+    def _insert_chunks(
+        self,
+        text: str,
+        document_hash: bytes,
+        sentence_spans: List[SentenceSpan],
+        is_boilerplate: List[bool],
+        processed_at: datetime,
+    ) -> List[ChunkCreated]:
+        # Chunks never span boilerplate, so each run of other sentences is chunked on its own.
+        ranges = []
+        run_start = None
+        for i, flagged in enumerate(is_boilerplate + [True]):
+            if not flagged:
+                if run_start is None:
+                    run_start = i
+            elif run_start is not None:
+                ranges.extend(
+                    (run_start + start, run_start + end)
+                    for start, end in self.chunker(text, sentence_spans[run_start:i])
+                )
+                run_start = None
+
+        if not ranges:
+            return []
+
+        chunks: Dict[str, List[Any]] = {column: [] for column in CHUNK_SCHEMA}
+        for chunk_idx, (start, end) in enumerate(ranges):
+            start_char = sentence_spans[start].start_char
+            end_char = sentence_spans[end].end_char
+            chunk_text = text[start_char:end_char]
+
+            chunks["cased_chunk_hash"].append(text_key(chunk_text))
+            chunks["uncased_chunk_hash"].append(text_key(chunk_text.lower()))
+            chunks["text"].append(chunk_text)
+            chunks["chunker"].append(self.chunker.name)
+            chunks["index"].append(chunk_idx)
+            chunks["start_sentence_index"].append(start)
+            chunks["end_sentence_index"].append(end)
+            chunks["start_char"].append(start_char)
+            chunks["end_char"].append(end_char)
+
+        self.db.register("nlp_chunk_batch", pl.DataFrame(chunks, schema=CHUNK_SCHEMA))
+        try:
+            self.db.execute(
+                """--sql
+                    INSERT INTO document_chunk BY NAME
+                    SELECT
+                        ?::BLOB AS document_hash,
+                        * EXCLUDE (text),
+                        ?::TIMESTAMP AS processed_at
+                    FROM nlp_chunk_batch
+                """,
+                (document_hash, processed_at),
+            )
+
+            self.db.execute(
+                """--sql
+                    INSERT INTO chunk (
+                        cased_chunk_hash,
+                        uncased_chunk_hash,
+                        text,
+                        processed_at
                     )
-                    added_sentences[ds.cased_sentence_hash] = sent
-                    out_messages.append(SentenceCreated(sentence=sent))
-
-        for de in document_entities:
-            if de.cased_entity_hash in obj_map["entity"]:
-                if de.cased_entity_hash not in added_entities:
-                    ent = Entity(
-                        cased_entity_hash=de.cased_entity_hash,
-                        uncased_entity_hash=de.uncased_entity_hash,
-                        text=de.text,
-                        label=de.label,
-                        processed_at=de.processed_at,
+                    SELECT DISTINCT ON (b.cased_chunk_hash)
+                        b.cased_chunk_hash,
+                        b.uncased_chunk_hash,
+                        b.text,
+                        ?::TIMESTAMP
+                    FROM nlp_chunk_batch b
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM chunk c
+                        WHERE c.cased_chunk_hash = b.cased_chunk_hash
                     )
-                    added_entities[de.cased_entity_hash] = ent
-                    out_messages.append(EntityCreated(entity=ent))
-
-        self.db.executemany(
-            """--sql
-            INSERT INTO sentence (
-                cased_sentence_hash,
-                uncased_sentence_hash,
-                text,
-                processed_at
+                """,
+                (processed_at,),
             )
-            VALUES (?, ?, ?, ?)
-            """,
-            [
-                (
-                    s.cased_sentence_hash,
-                    s.uncased_sentence_hash,
-                    s.text,
-                    s.processed_at,
-                )
-                for s in added_sentences.values()
-            ],
-        )
 
-        self.db.executemany(
-            """--sql
-            INSERT INTO entity (
-                cased_entity_hash,
-                uncased_entity_hash,
-                text,
-                label,
-                processed_at
+            unembedded_chunks = self._unembedded(
+                "nlp_chunk_batch",
+                "cased_chunk_hash",
+                ["uncased_chunk_hash", "text"],
             )
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            [
-                (
-                    e.cased_entity_hash,
-                    e.uncased_entity_hash,
-                    e.text,
-                    e.label,
-                    e.processed_at,
-                )
-                for e in added_entities.values()
-            ],
-        )
+        finally:
+            self.db.unregister("nlp_chunk_batch")
 
-        return out_messages
\ No newline at end of file
+        return [
+            ChunkCreated(chunk=Chunk(
+                cased_chunk_hash=cased_hash,
+                uncased_chunk_hash=uncased_hash,
+                text=chunk_text,
+                processed_at=processed_at,
+            ))
+            for cased_hash, uncased_hash, chunk_text in unembedded_chunks
+        ]
@@ -1,6 +1,6 @@
 import asyncio
 import traceback
-from typing import Union, Any, List, Union, Type
+from typing import Dict, Union, Any, List, Union, Type
 
 from duckdb import DuckDBPyConnection
 
@@ -8,6 +8,7 @@ from pdf_rag_chatbot.data_pipeline.messages import (
     DeadLetterMessage,
     Message,
 )
+from pdf_rag_chatbot.data_pipeline.retry import RetryPolicy
 
 class PipelineStep:
     def __init__(
@@ -19,16 +20,39 @@ class PipelineStep:
         self.name = name
         self.request_type = request_type
         self.db = db
+        self.retry_policy = RetryPolicy()
+        self._attempts: Dict[str, int] = {}
 
     def __call__(self, request: Any) -> Union[Message, List[Message], None]:
         """Process a request and return the result."""
         raise NotImplementedError
 
-    def _raise_for_request_type(self, request: Any):
+    def call_many(self, requests: List[Any]) -> List[Message]:
+        """Process a batch of requests and return all of their results.
+
+        Steps that can process a batch more efficiently than one request at a
+        time override this.
+        """
+        results = []
+        for request in requests:
+            result = self(request)
+            if result is None:
+                continue
+            elif isinstance(result, list):
+                results.extend(result)
+            else:
+                results.append(result)
+
+        return results
+
+    def accepts(self, request: Any) -> bool:
+        """Return True if the step can process the request."""
         if isinstance(self.request_type, list):
-            if not any(isinstance(request, t) for t in self.request_type):
-                raise ValueError("Invalid request type.")
-        elif not isinstance(request, self.request_type):
+            return any(isinstance(request, t) for t in self.request_type)
+        return isinstance(request, self.request_type)
+
+    def _raise_for_request_type(self, request: Any):
+        if not self.accepts(request):
             raise ValueError("Invalid request type.")
 
     async def run(
@@ -45,6 +69,7 @@ class PipelineStep:
                 self._raise_for_request_type(req)
 
                 result = self(req)
+                self._attempts.pop(req.message_id, None)
 
                 if result is None:
                     continue
@@ -57,11 +82,23 @@ class PipelineStep:
             except asyncio.CancelledError:
                 break
             except Exception as e:
+                attempt = self._attempts.pop(req.message_id, 0) + 1
+
+                if self.retry_policy.should_retry(e, attempt):
+                    self._attempts[req.message_id] = attempt
+                    asyncio.get_running_loop().call_later(
+                        self.retry_policy.backoff(attempt),
+                        input_queue.put_nowait,
+                        req,
+                    )
+                    continue
+
                 await deadletter_queue.put(
                     DeadLetterMessage(
                         step=self.name,
                         error=str(e),
                         traceback=traceback.format_exc(),
                         request=req,
+                        attempts=attempt,
                     )
                 )
\ No newline at end of file
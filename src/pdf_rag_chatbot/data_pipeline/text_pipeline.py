@@ -1,31 +1,121 @@
+import time
 import asyncio
-from typing import Callable
+import inspect
+import traceback
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Optional
 
 from duckdb import DuckDBPyConnection
+from loguru import logger
 
+from pdf_rag_chatbot.db.settings import EMBEDDING_MODEL, get_setting
+from pdf_rag_chatbot.data_pipeline.dead_letters import DeadLetterStore
 from pdf_rag_chatbot.data_pipeline.messages import (
     DeadLetterMessage,
     FileUploaded,
+    Message,
 )
+from pdf_rag_chatbot.data_pipeline.retry import RetryPolicy
 from pdf_rag_chatbot.data_pipeline.steps import (
     Ingest,
     NLP,
     Embed,
+    DEFAULT_MODEL_NAME,
 )
+from pdf_rag_chatbot.data_pipeline.steps.pipeline_step import PipelineStep
 
 DeadLetterHandler = Callable[[DeadLetterMessage], None]
 
+
+class StepFailed(Exception):
+    def __init__(self, step: str, error: Exception):
+        super().__init__(f"{step} failed: {error}")
+        self.step = step
+        self.error = error
+        self.traceback = traceback.format_exc()
+
+
 class TextPipeline:
     def __init__(
         self,
-        db: DuckDBPyConnection,
+        db: Optional[DuckDBPyConnection],
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+        embedding_model: Optional[str] = None,
+        embed_options: Optional[Dict[str, Any]] = None,
+        nlp_options: Optional[Dict[str, Any]] = None,
+        ingest_options: Optional[Dict[str, Any]] = None,
+        lock: Optional[ContextManager] = None,
     ):
+        """Initialize the pipeline.
+
+        Args:
+            db (Optional[DuckDBPyConnection]): The DuckDB connection.
+            retry_policies (Optional[Dict[str, RetryPolicy]], optional): Retry policies
+                keyed by step name. Steps without one use the default policy. Defaults to None.
+            embedding_model (Optional[str], optional): The embedding model to use.
+                Defaults to the warehouse's active embedding model.
+            embed_options (Optional[Dict[str, Any]], optional): Options passed to the
+                embedding step, such as its inference backend. Defaults to None.
+            nlp_options (Optional[Dict[str, Any]], optional): Options passed to the NLP
+                step, such as its chunker. Defaults to None.
+            ingest_options (Optional[Dict[str, Any]], optional): Options passed to the
+                ingest step, such as its PDF extractor. Defaults to None.
+            lock (Optional[ContextManager], optional): Held while an attempt uses the
+                connection, and released while waiting to retry, for connections shared
+                between threads. Defaults to None.
+        """
         self.db = db
+        self.lock = lock or nullcontext()
+        self.embed_options = embed_options or {}
+        self.dead_letters = DeadLetterStore(db)
+        self.deadletter_handlers: List[DeadLetterHandler] = []
 
-        self.ingest = Ingest(db)
-        self.nlp = NLP(db)
-        self.embed = Embed(db)
+        if embedding_model is None and db is not None:
+            embedding_model = get_setting(db, EMBEDDING_MODEL)
 
+        self.ingest = Ingest(db, **(ingest_options or {}))
+        self.nlp = NLP(db, **(nlp_options or {}))
+        self.embed = Embed(
+            db,
+            model_name=embedding_model or DEFAULT_MODEL_NAME,
+            **self.embed_options,
+        )
+
+        for step in self.steps:
+            if retry_policies and step.name in retry_policies:
+                step.retry_policy = retry_policies[step.name]
+
+    @property
+    def steps(self) -> List[PipelineStep]:
+        return [self.ingest, self.nlp, self.embed]
+
+    def set_connection(self, db: DuckDBPyConnection):
+        """Point the pipeline and all of its steps at a new database connection.
+
+        Ingest workers only hold the warehouse while they process a job, so the
+        models are loaded once and the connection is swapped in per job.
+        """
+        self.db = db
+        self.dead_letters.db = db
+        for step in self.steps:
+            step.db = db
+
+    def sync_embedding_model(self):
+        """Switch to the warehouse's active embedding model if it has changed.
+
+        The active model changes once a re-embedding job has embedded every text
+        with a new model, so long-running pipelines follow it between files.
+        """
+        model_name = get_setting(self.db, EMBEDDING_MODEL, DEFAULT_MODEL_NAME)
+        if model_name == self.embed.model_name:
+            return
+
+        logger.info(f"Switching embedding model from {self.embed.model_name} to {model_name}.")
+        embed = Embed(self.db, model_name=model_name, **self.embed_options)
+        embed.retry_policy = self.embed.retry_policy
+        embed.embedding_source = self.embed.embedding_source
+        self.embed.close()
+        self.embed = embed
 
     def __call__(self, req: FileUploaded):
         """Process a file and return the extracted information.
@@ -36,15 +126,94 @@ class TextPipeline:
         Returns:
             dict: The extracted information.
         """
+        self._run_with_retries(req)
 
-        res = self.ingest(req)
-        if res is None:
-            return
-        
-        res = self.nlp(res)
+    def replay(self, dead_letter: DeadLetterMessage):
+        """Re-run the request held by a dead letter.
+
+        The request resumes at the step that accepts it, and a repeated failure
+        updates the existing dead letter rather than adding a new one.
+        """
+        self._run_with_retries(dead_letter.request, dead_letter)
+        self.dead_letters.mark_replayed(dead_letter.message_id)
+
+    def _run_with_retries(
+        self,
+        req: Message,
+        dead_letter: Optional[DeadLetterMessage] = None,
+    ):
+        with self.lock:
+            self.sync_embedding_model()
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            with self.lock:
+                e = self._attempt(req)
+            if e is None:
+                return
+
+            policy = self._step(e.step).retry_policy
+            if policy.should_retry(e.error, attempt):
+                delay = policy.backoff(attempt)
+                logger.warning(
+                    f"{e.step} failed on attempt {attempt}, retrying in {delay:.1f}s: {e.error}"
+                )
+                time.sleep(delay)
+                continue
+
+            with self.lock:
+                self.dead_letters.put(
+                    DeadLetterMessage(
+                        message_id=dead_letter.message_id if dead_letter else req.message_id,
+                        step=e.step,
+                        error=str(e.error),
+                        traceback=e.traceback,
+                        request=req,
+                        attempts=attempt + (dead_letter.attempts if dead_letter else 0),
+                    )
+                )
+            raise e.error
+
+    def _attempt(self, req: Message) -> Optional[StepFailed]:
+        # A request is processed in a single transaction so that a failed
+        # attempt leaves nothing half-processed behind and can be retried.
+        self.db.begin()
+        try:
+            self._process(req)
+        except StepFailed as e:
+            self.db.rollback()
+            return e
+        except BaseException:
+            self.db.rollback()
+            raise
+
+        self.db.commit()
+        return None
+
+    def _process(self, req: Message):
+        """Run a request and everything it produces through the steps that accept them.
+
+        Results are passed on a step at a time, so that e.g. every sentence and
+        entity of a document is embedded in one batch.
+        """
+        pending = [req]
+
+        while pending:
+            step = next(s for s in self.steps if s.accepts(pending[0]))
+            batch = [r for r in pending if step.accepts(r)]
+            pending = [r for r in pending if not step.accepts(r)]
+
+            try:
+                res = step.call_many(batch)
+            except Exception as e:
+                raise StepFailed(step.name, e) from e
 
-        for r in res:
-            self.embed(r)
+            pending.extend(res)
+
+    def _step(self, name: str) -> PipelineStep:
+        return next(s for s in self.steps if s.name == name)
 
     async def start(self):
         """Start the pipeline."""
@@ -65,13 +234,32 @@ class TextPipeline:
         await self.input_queue.put(req)
 
     async def add_deadletter_handler(self, handler: DeadLetterHandler):
-        """Add a deadletter handler to the pipeline."""
-        async def _handler():
-            while not self.shutdown_event.is_set():
-                msg = await self.deadletter_queue.get()
-                await handler(msg)
+        """Add a deadletter handler to the pipeline.
 
-        return asyncio.create_task(_handler())
+        Dead letters are persisted to the warehouse before they are passed to handlers.
+        """
+        self.deadletter_handlers.append(handler)
+
+    async def _handle_deadletters(
+        self,
+        deadletter_queue: asyncio.Queue,
+        shutdown_event: asyncio.Event,
+    ):
+        while not shutdown_event.is_set():
+            try:
+                msg = await deadletter_queue.get()
+            except asyncio.CancelledError:
+                break
+
+            try:
+                self.dead_letters.put(msg)
+            except Exception as e:
+                logger.exception(e)
+
+            for handler in self.deadletter_handlers:
+                res = handler(msg)
+                if inspect.isawaitable(res):
+                    await res
 
     async def run(
         self,
@@ -94,4 +282,8 @@ class TextPipeline:
             self.embed.run(nlp_result_queue, input_queue, deadletter_queue, shutdown_event)
         )
 
-        await asyncio.gather(ingest_task, nlp_task, embed_task)
+        deadletter_task = asyncio.create_task(
+            self._handle_deadletters(deadletter_queue, shutdown_event)
+        )
+
+        await asyncio.gather(ingest_task, nlp_task, embed_task, deadletter_task)
@@ -1 +1,27 @@
-from pdf_rag_chatbot.db.setup_database import setup_database
\ No newline at end of file
+from pdf_rag_chatbot.db.setup_database import setup_database
+from pdf_rag_chatbot.db.connection import connect, warehouse
+from pdf_rag_chatbot.db.maintenance import (
+    touch_session,
+    expire_sessions,
+    collect_garbage,
+    compact_database,
+)
+from pdf_rag_chatbot.db.settings import (
+    EMBEDDING_MODEL,
+    DOCUMENT_STORE,
+    get_setting,
+    set_setting,
+)
+from pdf_rag_chatbot.db.bundle import export_bundle, import_bundle
+from pdf_rag_chatbot.db.document_store import (
+    DocumentStore,
+    open_document_store,
+    document_text,
+)
+from pdf_rag_chatbot.db.entity_index import index_entities
+from pdf_rag_chatbot.db.keys import (
+    HashKey,
+    text_key,
+    document_key,
+    parse_key,
+)
@@ -0,0 +1,408 @@
+import os
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from duckdb import DuckDBPyConnection
+from loguru import logger
+
+from pdf_rag_chatbot.db.document_store import (
+    compress_text,
+    decompress_text,
+    insert_documents,
+    open_document_store,
+)
+from pdf_rag_chatbot.db.entity_index import index_entities
+from pdf_rag_chatbot.db.keys import binary_keys
+
+
+# Bumped whenever the exported tables change shape.
+BUNDLE_FORMAT = 4
+
+# Bundles before this format have hex string keys.
+_BINARY_KEYS_FORMAT = 3
+
+# Bundles before this format repeat the text of sentences, entities and embeddings,
+# and keep document bodies uncompressed.
+_TEXT_ONCE_FORMAT = 4
+
+# The tables whose text older bundles repeat.
+_REPEATED_TEXT_TABLES = ["document_sentence", "document_entity", "text_embedding"]
+
+# The tables in a bundle, in the order they are imported.
+BUNDLE_TABLES = [
+    "document",
+    "document_sentence",
+    "document_entity",
+    "document_chunk",
+    "sentence",
+    "entity",
+    "chunk",
+    "text_embedding",
+    "uploaded_file",
+]
+
+# The rows of each table that belong to the documents in `bundle_document`.
+_EXPORT_QUERIES = {
+    # Bodies kept in a document store are shipped in the bundle.
+    "document": """
+        SELECT d.* REPLACE (COALESCE(d.body, b.body) AS body)
+        FROM document d
+        LEFT JOIN bundle_document_body b USING (document_hash)
+        WHERE d.document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "document_sentence": """
+        SELECT * FROM document_sentence
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "document_entity": """
+        SELECT * FROM document_entity
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "document_chunk": """
+        SELECT * FROM document_chunk
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "chunk": """
+        SELECT * FROM chunk
+        WHERE cased_chunk_hash IN (
+            SELECT cased_chunk_hash FROM document_chunk
+            WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+        )
+    """,
+    "sentence": """
+        SELECT * FROM sentence
+        WHERE cased_sentence_hash IN (
+            SELECT cased_sentence_hash FROM document_sentence
+            WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+        )
+    """,
+    "entity": """
+        SELECT * FROM entity
+        WHERE cased_entity_hash IN (
+            SELECT cased_entity_hash FROM document_entity
+            WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+        )
+    """,
+    "text_embedding": """
+        SELECT * FROM text_embedding
+        WHERE
+            model_name IN (SELECT model_name FROM bundle_model)
+            AND cased_text_hash IN (
+                SELECT cased_sentence_hash FROM document_sentence
+                WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+                UNION
+                SELECT cased_entity_hash FROM document_entity
+                WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+                UNION
+                SELECT cased_chunk_hash FROM document_chunk
+                WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+            )
+    """,
+    # Only which files a document came from, sessions stay with the warehouse.
+    "uploaded_file": """
+        SELECT DISTINCT file_path, document_hash FROM uploaded_file
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+}
+
+# Rows already in the warehouse are skipped on import. Rows of documents
+# that are already in the warehouse are skipped as a whole.
+_IMPORT_QUERIES = {
+    "document": """
+        INSERT INTO document BY NAME
+        SELECT * FROM {source}
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "document_sentence": """
+        INSERT INTO document_sentence BY NAME
+        SELECT * FROM {source}
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "document_entity": """
+        INSERT INTO document_entity BY NAME
+        SELECT * FROM {source}
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "document_chunk": """
+        INSERT INTO document_chunk BY NAME
+        SELECT * FROM {source}
+        WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+    """,
+    "chunk": """
+        INSERT INTO chunk BY NAME
+        SELECT b.* FROM {source} b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM chunk c WHERE c.cased_chunk_hash = b.cased_chunk_hash
+        )
+    """,
+    "sentence": """
+        INSERT INTO sentence BY NAME
+        SELECT b.* FROM {source} b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM sentence s WHERE s.cased_sentence_hash = b.cased_sentence_hash
+        )
+    """,
+    "entity": """
+        INSERT INTO entity BY NAME
+        SELECT b.* FROM {source} b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM entity e WHERE e.cased_entity_hash = b.cased_entity_hash
+        )
+    """,
+    "text_embedding": """
+        INSERT INTO text_embedding BY NAME
+        SELECT b.* FROM {source} b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM text_embedding te
+            WHERE
+                te.cased_text_hash = b.cased_text_hash
+                AND te.model_name = b.model_name
+        )
+    """,
+    "uploaded_file": """
+        INSERT INTO uploaded_file (file_uuid, file_path, document_hash, session_id)
+        SELECT uuid()::STRING, b.file_path, b.document_hash, NULL
+        FROM {source} b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM uploaded_file uf
+            WHERE
+                uf.file_path = b.file_path
+                AND uf.document_hash = b.document_hash
+                AND uf.session_id IS NULL
+        )
+    """,
+}
+
+
+# Boilerplate sentences were only kept with the documents they appear in.
+_BOILERPLATE_SENTENCE_QUERY = """
+    INSERT INTO sentence (cased_sentence_hash, uncased_sentence_hash, text, processed_at)
+    SELECT DISTINCT ON (b.cased_sentence_hash)
+        b.cased_sentence_hash,
+        b.uncased_sentence_hash,
+        b.text,
+        b.processed_at
+    FROM {source} b
+    WHERE NOT EXISTS (
+        SELECT 1 FROM sentence s WHERE s.cased_sentence_hash = b.cased_sentence_hash
+    )
+"""
+
+
+def _quote(path: str) -> str:
+    return path.replace("'", "''")
+
+
+def _keyed_source(table: str, path: str, bundle_format: int) -> str:
+    source = f"read_parquet('{_quote(path)}')"
+    if bundle_format >= _BINARY_KEYS_FORMAT:
+        return source
+    return f"(SELECT * {binary_keys(table)} FROM {source})"
+
+
+def _source(table: str, path: str, bundle_format: int) -> str:
+    source = _keyed_source(table, path, bundle_format)
+    if bundle_format >= _TEXT_ONCE_FORMAT or table not in _REPEATED_TEXT_TABLES:
+        return source
+    return f"(SELECT * EXCLUDE (text) FROM {source})"
+
+
+def _fill_document_bodies(db: DuckDBPyConnection):
+    store = open_document_store(db)
+    if store is None:
+        return
+
+    missing = db.execute(
+        """--sql
+            SELECT document_hash FROM document
+            WHERE
+                body IS NULL
+                AND document_hash IN (SELECT document_hash FROM bundle_document)
+        """
+    ).fetchall()
+
+    rows = []
+    for document_hash, in missing:
+        text = store.get(document_hash)
+        if text is not None:
+            rows.append((document_hash, compress_text(text)))
+    if rows:
+        db.executemany("INSERT INTO bundle_document_body VALUES (?, ?)", rows)
+
+
+def _import_documents(db: DuckDBPyConnection, source: str, bundle_format: int) -> int:
+    store = open_document_store(db)
+
+    # Compressed bodies are copied as they are, unless they are kept in a document store.
+    if store is None and bundle_format >= _TEXT_ONCE_FORMAT:
+        return db.execute(_IMPORT_QUERIES["document"].format(source=source)).fetchone()[0]
+
+    column = "body" if bundle_format >= _TEXT_ONCE_FORMAT else "text"
+    rows = db.execute(
+        f"""--sql
+            SELECT document_hash, {column}, processed_at FROM {source}
+            WHERE document_hash IN (SELECT document_hash FROM bundle_document)
+        """
+    ).fetchall()
+    if bundle_format >= _TEXT_ONCE_FORMAT:
+        rows = [(h, decompress_text(body), processed_at) for h, body, processed_at in rows]
+
+    insert_documents(db, rows, store)
+    return len(rows)
+
+
+def export_bundle(
+    db: DuckDBPyConnection,
+    path: str,
+    document_hashes: Optional[List[bytes]] = None,
+    model_names: Optional[List[str]] = None,
+) -> Dict[str, int]:
+    """Export preprocessed documents to a directory of zstd-compressed Parquet files.
+
+    A bundle holds everything needed to search the documents: their sentences,
+    entities and embeddings, and the paths of the files they came from. Document
+    bodies kept in an external document store are included in the bundle.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        path (str): The directory to write the bundle to.
+        document_hashes (Optional[List[bytes]], optional): The documents to export.
+            Defaults to None, which exports every document.
+        model_names (Optional[List[str]], optional): The embedding models to export
+            vectors for. Defaults to None, which exports every model.
+
+    Returns:
+        Dict[str, int]: The number of rows exported from each table.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    db.execute("CREATE OR REPLACE TEMP TABLE bundle_document (document_hash BLOB)")
+    db.execute("CREATE OR REPLACE TEMP TABLE bundle_model (model_name STRING)")
+    db.execute("CREATE OR REPLACE TEMP TABLE bundle_document_body (document_hash BLOB, body BLOB)")
+    try:
+        if document_hashes is None:
+            db.execute("INSERT INTO bundle_document SELECT document_hash FROM document")
+        else:
+            db.execute(
+                "INSERT INTO bundle_document SELECT UNNEST(?::BLOB[])",
+                (document_hashes,),
+            )
+
+        if model_names is None:
+            db.execute("INSERT INTO bundle_model SELECT DISTINCT model_name FROM text_embedding")
+        else:
+            db.execute("INSERT INTO bundle_model SELECT UNNEST(?::STRING[])", (model_names,))
+
+        _fill_document_bodies(db)
+
+        counts = {}
+        for table in BUNDLE_TABLES:
+            file_path = _quote(os.path.join(path, f"{table}.parquet"))
+            db.execute(
+                f"COPY ({_EXPORT_QUERIES[table]}) TO '{file_path}' "
+                "(FORMAT PARQUET, COMPRESSION ZSTD)"
+            )
+            counts[table] = db.execute(
+                f"SELECT COUNT(*) FROM read_parquet('{file_path}')"
+            ).fetchone()[0]
+
+        models = [m for m, in db.execute("SELECT model_name FROM bundle_model").fetchall()]
+    finally:
+        db.execute("DROP TABLE IF EXISTS bundle_document")
+        db.execute("DROP TABLE IF EXISTS bundle_model")
+        db.execute("DROP TABLE IF EXISTS bundle_document_body")
+
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(
+            {
+                "format": BUNDLE_FORMAT,
+                "created_at": datetime.now().isoformat(),
+                "models": models,
+                "counts": counts,
+            },
+            f,
+            indent=2,
+        )
+
+    logger.info(f"Exported {counts['document']} documents to {path}.")
+    return counts
+
+
+def import_bundle(db: DuckDBPyConnection, path: str) -> Dict[str, int]:
+    """Import a bundle written by `export_bundle`.
+
+    The bundle is loaded in one transaction. Documents, sentences, entities and
+    embeddings that are already in the warehouse are skipped, and imported
+    files are searchable from every session.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        path (str): The bundle directory.
+
+    Returns:
+        Dict[str, int]: The number of rows imported into each table.
+    """
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    if manifest.get("format", 0) > BUNDLE_FORMAT:
+        raise ValueError(
+            f"Bundle {path} has format {manifest.get('format')}, "
+            f"this version reads formats up to {BUNDLE_FORMAT}."
+        )
+
+    bundle_format = manifest.get("format", 0)
+
+    counts = {}
+    db.begin()
+    try:
+        document_source = _source("document", os.path.join(path, "document.parquet"), bundle_format)
+        db.execute(
+            f"""--sql
+                CREATE OR REPLACE TEMP TABLE bundle_document AS
+                SELECT b.document_hash FROM {document_source} b
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM document d WHERE d.document_hash = b.document_hash
+                )
+            """
+        )
+
+        for table in BUNDLE_TABLES:
+            file_path = os.path.join(path, f"{table}.parquet")
+            if not os.path.exists(file_path):
+                # Bundles from before the table existed.
+                counts[table] = 0
+                continue
+
+            if table == "document":
+                counts[table] = _import_documents(
+                    db, _keyed_source(table, file_path, bundle_format), bundle_format
+                )
+                continue
+
+            counts[table] = db.execute(
+                _IMPORT_QUERIES[table].format(source=_source(table, file_path, bundle_format))
+            ).fetchone()[0]
+
+            if table == "sentence" and bundle_format < _TEXT_ONCE_FORMAT:
+                sentence_source = _keyed_source(
+                    "document_sentence",
+                    os.path.join(path, "document_sentence.parquet"),
+                    bundle_format,
+                )
+                counts[table] += db.execute(
+                    _BOILERPLATE_SENTENCE_QUERY.format(source=sentence_source)
+                ).fetchone()[0]
+
+        # The entity index is rebuilt rather than shipped.
+        index_entities(db, [h for h, in db.execute("SELECT document_hash FROM bundle_document").fetchall()])
+
+        db.execute("DROP TABLE bundle_document")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Imported {counts['document']} new documents from {path}.")
+    return counts
@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import duckdb
+from duckdb import DuckDBPyConnection
+from loguru import logger
+
+
+def connect(
+    database: str,
+    read_only: bool = False,
+    timeout: float = 60.0,
+    poll_interval: float = 0.25,
+) -> DuckDBPyConnection:
+    """Connect to a DuckDB database, waiting for other processes to release it.
+
+    DuckDB allows a single read-write process per database file, so the chat app
+    and ingest workers take turns holding the warehouse. This retries while the
+    file lock is held by another process.
+
+    Args:
+        database (str): The path to the DuckDB database file.
+        read_only (bool, optional): Open the database read only. Defaults to False.
+        timeout (float, optional): Seconds to wait for the lock. Defaults to 60.0.
+        poll_interval (float, optional): Initial seconds between attempts. Defaults to 0.25.
+
+    Raises:
+        duckdb.IOException: If the lock could not be acquired before the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    wait = poll_interval
+
+    while True:
+        try:
+            return duckdb.connect(database, read_only=read_only)
+        except duckdb.IOException as e:
+            if "lock" not in str(e).lower() or time.monotonic() >= deadline:
+                raise
+
+            logger.debug(f"Waiting for lock on {database}: {e}")
+            time.sleep(wait)
+            wait = min(wait * 2, 2.0)
+
+
+@contextmanager
+def warehouse(
+    database: str,
+    read_only: bool = False,
+    timeout: float = 60.0,
+) -> Iterator[DuckDBPyConnection]:
+    """Open a short-lived connection to the warehouse and close it on exit."""
+    db = connect(database, read_only=read_only, timeout=timeout)
+    try:
+        yield db
+    finally:
+        db.close()
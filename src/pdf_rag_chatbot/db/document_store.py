@@ -0,0 +1,157 @@
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from duckdb import DuckDBPyConnection
+
+from pdf_rag_chatbot.db.settings import DOCUMENT_STORE, get_setting, set_setting
+
+
+def compress_text(text: str) -> bytes:
+    """Compress a document body for storage."""
+    return zlib.compress(text.encode(), 6)
+
+
+def decompress_text(body: bytes) -> str:
+    """Decompress a document body written by `compress_text`."""
+    return zlib.decompress(body).decode()
+
+
+class DocumentStore:
+    def __init__(self, path: str):
+        """A directory of compressed document bodies, kept outside of the warehouse.
+
+        Search never reads document bodies, so they can live on cheaper storage
+        than the warehouse. Each body is a zlib-compressed file named after its
+        document hash, written to a temporary file and renamed into place, so
+        readers in other processes never see a partial write.
+
+        Args:
+            path (str): The store directory.
+        """
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def _path(self, document_hash: bytes) -> str:
+        name = document_hash.hex()
+        return os.path.join(self.path, name[:2], f"{name}.zz")
+
+    def put(self, document_hash: bytes, text: str):
+        path = self._path(document_hash)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compress_text(text))
+        os.replace(tmp_path, path)
+
+    def get(self, document_hash: bytes) -> Optional[str]:
+        try:
+            with open(self._path(document_hash), "rb") as f:
+                return decompress_text(f.read())
+        except FileNotFoundError:
+            return None
+
+    def prune(self, db: DuckDBPyConnection, min_age: float = 3600.0) -> int:
+        """Delete the bodies of documents that are no longer in the warehouse.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            min_age (float, optional): Bodies written less than this many seconds ago are
+                kept, as their documents may still be being ingested. Defaults to 3600.0.
+
+        Returns:
+            int: The number of bodies deleted.
+        """
+        known = {h.hex() for h, in db.execute("SELECT document_hash FROM document").fetchall()}
+        cutoff = time.time() - min_age
+
+        deleted = 0
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.split(".")[0] in known or os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                deleted += 1
+
+        return deleted
+
+
+def open_document_store(db: DuckDBPyConnection, path: Optional[str] = None) -> Optional[DocumentStore]:
+    """Open the warehouse's external document store, if it has one.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        path (Optional[str], optional): Keep document bodies in this directory from now on.
+            Defaults to None, which uses the directory the warehouse was given before.
+
+    Returns:
+        Optional[DocumentStore]: The store, or None if bodies are kept in the warehouse.
+    """
+    if path is not None:
+        set_setting(db, DOCUMENT_STORE, os.path.abspath(path))
+    else:
+        path = get_setting(db, DOCUMENT_STORE)
+
+    return DocumentStore(path) if path is not None else None
+
+
+def insert_documents(
+    db: DuckDBPyConnection,
+    documents: List[Tuple[bytes, str, datetime]],
+    store: Optional[DocumentStore] = None,
+):
+    """Insert documents with their bodies compressed, or kept in an external store.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        documents (List[Tuple[bytes, str, datetime]]): The hash, text and processing
+            time of each document.
+        store (Optional[DocumentStore], optional): Where bodies are kept. Defaults to
+            None, which keeps them in the warehouse.
+    """
+    rows = []
+    for document_hash, text, processed_at in documents:
+        if store is not None:
+            store.put(document_hash, text)
+            body = None
+        else:
+            body = compress_text(text)
+        rows.append((document_hash, body, processed_at))
+
+    db.executemany(
+        """--sql
+            INSERT INTO document (
+                document_hash,
+                body,
+                processed_at
+            )
+            VALUES (?, ?, ?)
+        """,
+        rows,
+    )
+
+
+def document_text(db: DuckDBPyConnection, document_hash: bytes) -> Optional[str]:
+    """Read the text of a document, wherever its body is kept.
+
+    Returns:
+        Optional[str]: The text, or None if the document isn't in the warehouse.
+    """
+    row = db.execute(
+        "SELECT body FROM document WHERE document_hash = ?",
+        (document_hash,),
+    ).fetchone()
+
+    if row is None:
+        return None
+    if row[0] is not None:
+        return decompress_text(row[0])
+
+    store = open_document_store(db)
+    return store.get(document_hash) if store is not None else None
@@ -0,0 +1,45 @@
+from typing import List, Optional
+
+from duckdb import DuckDBPyConnection
+
+
+def index_entities(db: DuckDBPyConnection, document_hashes: Optional[List[bytes]] = None) -> int:
+    """Add documents' entities to `entity_index`, the retrieval units each entity appears in.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        document_hashes (Optional[List[bytes]], optional): The documents to index, which
+            must not be indexed yet. Defaults to None, which indexes every document
+            that isn't.
+
+    Returns:
+        int: The number of index rows added.
+    """
+    if document_hashes is None:
+        condition = "de.document_hash NOT IN (SELECT document_hash FROM entity_index)"
+        params = ()
+    else:
+        condition = "de.document_hash IN (SELECT UNNEST(?::BLOB[]))"
+        params = (document_hashes,)
+
+    return db.execute(
+        f"""--sql
+            INSERT INTO entity_index (
+                cased_entity_hash,
+                uncased_entity_hash,
+                document_hash,
+                cased_text_hash
+            )
+            SELECT DISTINCT
+                de.cased_entity_hash,
+                de.uncased_entity_hash,
+                de.document_hash,
+                ru.cased_text_hash
+            FROM document_entity de
+            JOIN retrieval_unit ru
+                ON de.document_hash = ru.document_hash
+                AND de.sentence_index BETWEEN ru.start_sentence_index AND ru.end_sentence_index
+            WHERE {condition}
+        """,
+        params,
+    ).fetchone()[0]
@@ -0,0 +1,61 @@
+import hashlib
+from typing import Annotated, Dict, List
+
+from pydantic import BeforeValidator, PlainSerializer
+
+
+# Every key in the warehouse is a 16-byte digest, stored as a BLOB.
+HASH_KEY_SIZE = 16
+
+# The key columns of each table, which were hex strings before keys were binary.
+KEY_COLUMNS: Dict[str, List[str]] = {
+    "uploaded_file": ["document_hash"],
+    "document": ["document_hash"],
+    "sentence": ["cased_sentence_hash", "uncased_sentence_hash"],
+    "entity": ["cased_entity_hash", "uncased_entity_hash"],
+    "document_sentence": ["document_hash", "cased_sentence_hash", "uncased_sentence_hash"],
+    "document_entity": ["document_hash", "cased_entity_hash", "uncased_entity_hash"],
+    "text_embedding": ["cased_text_hash", "uncased_text_hash"],
+    "chunk": ["cased_chunk_hash", "uncased_chunk_hash"],
+    "document_chunk": ["document_hash", "cased_chunk_hash", "uncased_chunk_hash"],
+    "minhash_band": ["band_key", "document_hash"],
+    "source_file": ["document_hash"],
+}
+
+
+def text_key(text: str) -> bytes:
+    """The key of a sentence, entity or chunk: the md5 digest of its text."""
+    return hashlib.md5(text.encode()).digest()
+
+
+def document_key(text: str) -> bytes:
+    """The key of a document: the first 16 bytes of the sha256 digest of its text."""
+    return hashlib.sha256(text.encode()).digest()[:HASH_KEY_SIZE]
+
+
+def parse_key(value: str | bytes) -> bytes:
+    """Parse a key from its hex form, as shown to users and stored before keys were binary.
+
+    Hex sha256 document hashes are truncated to the key size, so they resolve to
+    the same key as the document's text.
+    """
+    if isinstance(value, str):
+        return bytes.fromhex(value)[:HASH_KEY_SIZE]
+    return value
+
+
+def binary_keys(table: str) -> str:
+    """A `SELECT * REPLACE (...)` clause that converts a table's hex keys to binary ones."""
+    columns = ", ".join(
+        f"unhex(left({column}, {2 * HASH_KEY_SIZE})) AS {column}"
+        for column in KEY_COLUMNS[table]
+    )
+    return f"REPLACE ({columns})"
+
+
+# A key that is hex in JSON, so messages can be serialized.
+HashKey = Annotated[
+    bytes,
+    BeforeValidator(parse_key),
+    PlainSerializer(lambda key: key.hex(), return_type=str, when_used="json"),
+]
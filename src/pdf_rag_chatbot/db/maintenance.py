@@ -0,0 +1,180 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from duckdb import DuckDBPyConnection
+from loguru import logger
+
+from pdf_rag_chatbot.db.connection import connect
+from pdf_rag_chatbot.db.document_store import open_document_store
+
+
+def touch_session(db: DuckDBPyConnection, session_id: str):
+    """Record activity in a chat session, keeping its documents alive."""
+    db.execute(
+        """--sql
+            INSERT INTO chat_session (session_id, created_at, last_seen_at)
+            VALUES ($session_id, $now, $now)
+            ON CONFLICT (session_id) DO UPDATE SET last_seen_at = $now
+        """,
+        {"session_id": session_id, "now": datetime.now()},
+    )
+
+
+def expire_sessions(db: DuckDBPyConnection, ttl: timedelta) -> int:
+    """Remove uploads from sessions that have been inactive for longer than `ttl`.
+
+    A session's last activity is the later of its last chat turn and its last
+    upload, so uploads from before sessions were tracked expire as well.
+
+    Args:
+        db (DuckDBPyConnection): The DuckDB connection.
+        ttl (timedelta): How long a session is kept after its last activity.
+
+    Returns:
+        int: The number of sessions expired.
+    """
+    cutoff = datetime.now() - ttl
+
+    expired = db.execute(
+        """--sql
+            SELECT session_id
+            FROM (
+                SELECT session_id, uploaded_at AS seen_at
+                FROM uploaded_file
+                WHERE session_id IS NOT NULL
+                UNION ALL
+                SELECT session_id, last_seen_at AS seen_at
+                FROM chat_session
+            )
+            GROUP BY session_id
+            HAVING MAX(seen_at) < ?
+        """,
+        (cutoff,),
+    ).fetchall()
+    expired = [session_id for session_id, in expired]
+
+    if not expired:
+        return 0
+
+    db.execute(
+        "CREATE OR REPLACE TEMP TABLE expired_session AS SELECT UNNEST(?::STRING[]) AS session_id",
+        (expired,),
+    )
+    db.execute("DELETE FROM uploaded_file WHERE session_id IN (SELECT session_id FROM expired_session)")
+    db.execute("DELETE FROM chat_session WHERE session_id IN (SELECT session_id FROM expired_session)")
+    db.execute("DROP TABLE expired_session")
+
+    logger.info(f"Expired {len(expired)} sessions inactive since {cutoff}.")
+    return len(expired)
+
+
+def collect_garbage(db: DuckDBPyConnection) -> Dict[str, int]:
+    """Delete documents, sentences, entities, chunks and embeddings that nothing refers to.
+
+    Documents are kept while any upload, from a live session or outside of a
+    session, refers to them. Sentences, entities, chunks and embeddings are kept while
+    any remaining document refers to them. Bodies of deleted documents are
+    removed from the external document store, if the warehouse has one.
+
+    Returns:
+        Dict[str, int]: The number of rows deleted from each table.
+    """
+    # Each statement commits on its own: DuckDB doesn't allow deleting a row
+    # in the same transaction as the rows whose foreign keys refer to it.
+    statements = [
+        (
+            "document_chunk",
+            "document_hash NOT IN (SELECT document_hash FROM uploaded_file)",
+        ),
+        (
+            "minhash_band",
+            "document_hash NOT IN (SELECT document_hash FROM uploaded_file)",
+        ),
+        (
+            "entity_index",
+            "document_hash NOT IN (SELECT document_hash FROM uploaded_file)",
+        ),
+        (
+            "document_entity",
+            "document_hash NOT IN (SELECT document_hash FROM uploaded_file)",
+        ),
+        (
+            "document_sentence",
+            "document_hash NOT IN (SELECT document_hash FROM uploaded_file)",
+        ),
+        (
+            "document",
+            "document_hash NOT IN (SELECT document_hash FROM uploaded_file)",
+        ),
+        (
+            "sentence",
+            "cased_sentence_hash NOT IN (SELECT cased_sentence_hash FROM document_sentence)",
+        ),
+        (
+            "entity",
+            "cased_entity_hash NOT IN (SELECT cased_entity_hash FROM document_entity)",
+        ),
+        (
+            "chunk",
+            "cased_chunk_hash NOT IN (SELECT cased_chunk_hash FROM document_chunk)",
+        ),
+        (
+            "text_embedding",
+            """cased_text_hash NOT IN (
+                SELECT cased_sentence_hash FROM sentence
+                UNION ALL
+                SELECT cased_entity_hash FROM entity
+                UNION ALL
+                SELECT cased_chunk_hash FROM chunk
+            )""",
+        ),
+    ]
+
+    deleted = {}
+    for table, condition in statements:
+        deleted[table] = db.execute(f"DELETE FROM {table} WHERE {condition}").fetchone()[0]
+
+    store = open_document_store(db)
+    if store is not None:
+        deleted["document_store"] = store.prune(db)
+
+    logger.info(f"Collected garbage: {deleted}")
+    return deleted
+
+
+def compact_database(database: str) -> Tuple[int, int]:
+    """Rewrite the warehouse to reclaim the space left behind by deleted rows.
+
+    DuckDB reuses freed blocks but never shrinks its file, so the database is
+    copied into a fresh file which then replaces the original. This needs
+    exclusive access to the warehouse.
+
+    Args:
+        database (str): The path to the DuckDB database file.
+
+    Returns:
+        Tuple[int, int]: The size of the file in bytes before and after compaction.
+    """
+    compacted = f"{database}.compact"
+    if os.path.exists(compacted):
+        os.remove(compacted)
+
+    db = connect(database)
+    try:
+        db.execute("CHECKPOINT")
+        size_before = os.path.getsize(database)
+
+        name = db.execute("SELECT current_database()").fetchone()[0]
+        path = compacted.replace("'", "''")
+        db.execute(f"ATTACH '{path}' AS compacted")
+        db.execute(f"COPY FROM DATABASE \"{name}\" TO compacted")
+        db.execute("DETACH compacted")
+    finally:
+        db.close()
+
+    os.replace(compacted, database)
+    size_after = os.path.getsize(database)
+
+    logger.info(f"Compacted {database} from {size_before} to {size_after} bytes.")
+    return size_before, size_after
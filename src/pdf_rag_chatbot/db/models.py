@@ -1,49 +1,72 @@
 from typing import Optional, List
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from pdf_rag_chatbot.db.keys import HashKey
 
 class UploadedFile(BaseModel):
 	file_uuid: str
 	file_path: str
-	document_hash: str
+	document_hash: HashKey
 	session_id: Optional[str] = None
-	uploaded_at: datetime = datetime.now()
+	uploaded_at: datetime = Field(default_factory=datetime.now)
+	content_hash: Optional[str] = None
 
 class Document(BaseModel):
-	document_hash: str
+	document_hash: HashKey
 	text: str
-	processed_at: datetime = datetime.now()
+	processed_at: datetime = Field(default_factory=datetime.now)
 
 class Sentence(BaseModel):
-	cased_sentence_hash: str
-	uncased_sentence_hash: str
+	cased_sentence_hash: HashKey
+	uncased_sentence_hash: HashKey
 	text: str
-	processed_at: datetime = datetime.now()
+	processed_at: datetime = Field(default_factory=datetime.now)
 
 class Entity(BaseModel):
-	cased_entity_hash: str
-	uncased_entity_hash: str
+	cased_entity_hash: HashKey
+	uncased_entity_hash: HashKey
 	text: str
 	label: str
-	processed_at: datetime = datetime.now()
+	processed_at: datetime = Field(default_factory=datetime.now)
 
 class DocumentSentence(BaseModel):
-	document_hash: str
-	cased_sentence_hash: str
-	uncased_sentence_hash: str
+	document_hash: HashKey
+	cased_sentence_hash: HashKey
+	uncased_sentence_hash: HashKey
 	text: str
 	index: int
 	start_char: int
 	end_char: int
-	processed_at: datetime = datetime.now()
+	processed_at: datetime = Field(default_factory=datetime.now)
+	is_boilerplate: bool = False
 
 class DocumentEntity(BaseModel):
-	document_hash: str
-	cased_entity_hash: str
-	uncased_entity_hash: str
+	document_hash: HashKey
+	cased_entity_hash: HashKey
+	uncased_entity_hash: HashKey
 	text: str
 	sentence_index: int
 	start_char: int
 	end_char: int
 	label: str
-	processed_at: datetime = datetime.now()
\ No newline at end of file
+	processed_at: datetime = Field(default_factory=datetime.now)
+
+class Chunk(BaseModel):
+	cased_chunk_hash: HashKey
+	uncased_chunk_hash: HashKey
+	text: str
+	processed_at: datetime = Field(default_factory=datetime.now)
+
+class DocumentChunk(BaseModel):
+	document_hash: HashKey
+	cased_chunk_hash: HashKey
+	uncased_chunk_hash: HashKey
+	text: str
+	chunker: str
+	index: int
+	start_sentence_index: int
+	end_sentence_index: int
+	start_char: int
+	end_char: int
+	processed_at: datetime = Field(default_factory=datetime.now)
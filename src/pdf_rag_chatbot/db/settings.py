@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import Optional
+
+from duckdb import DuckDBPyConnection
+
+
+# The embedding model used for search and for embedding newly ingested text.
+EMBEDDING_MODEL = "embedding_model"
+
+# The directory document bodies are kept in, when they aren't kept in the warehouse.
+DOCUMENT_STORE = "document_store"
+
+
+def get_setting(db: DuckDBPyConnection, key: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a warehouse-wide setting."""
+    row = db.execute(
+        "SELECT value FROM warehouse_setting WHERE key = ?",
+        (key,),
+    ).fetchone()
+
+    return row[0] if row is not None else default
+
+
+def set_setting(db: DuckDBPyConnection, key: str, value: str):
+    """Write a warehouse-wide setting."""
+    db.execute(
+        """--sql
+            INSERT INTO warehouse_setting (key, value, updated_at)
+            VALUES ($key, $value, $now)
+            ON CONFLICT (key) DO UPDATE SET value = $value, updated_at = $now
+        """,
+        {"key": key, "value": value, "now": datetime.now()},
+    )
@@ -1,4 +1,11 @@
+from typing import List
+
 from duckdb import DuckDBPyConnection
+from loguru import logger
+
+from pdf_rag_chatbot.db.document_store import insert_documents, open_document_store
+from pdf_rag_chatbot.db.entity_index import index_entities
+from pdf_rag_chatbot.db.keys import KEY_COLUMNS, binary_keys
 
 def setup_database(db: DuckDBPyConnection):
     """Initialize the database.
@@ -31,6 +38,15 @@ def setup_database(db: DuckDBPyConnection):
                          ╲└────────────────┘╱                
                                                              
 
+    Hashes are stored as 16-byte binary keys: the md5 digest of a text, or the
+    first 16 bytes of the sha256 digest of a document. Warehouses that stored
+    them as hex strings are migrated in place.
+
+    Text is stored once. Sentences and entities are kept in the Sentence and
+    Entity tables, which the tables of their occurrences and embeddings refer to
+    by hash, and document bodies are compressed. Warehouses that repeated the
+    text in every table are migrated in place.
+
     Uploaded File: Represents a file uploaded by the user.
     - `file_uuid`: A unique identifier for the file.
     - `file_path`: The path to the file.
@@ -39,13 +55,16 @@ def setup_database(db: DuckDBPyConnection):
                     or NULL if the file was processed outside
                     of a user session.
     - `uploaded_at`: The timestamp of when the file was uploaded.
+    - `content_hash`: The sha256 hash of the file's bytes, if known.
 
     Document: Represents a unique document.
 
     - `document_hash`: The sha256 hash of the document.
+    - `body`: The zlib-compressed text of the document, or NULL if it is kept in
+              the external document store.
     - `processed_at`: The timestamp of when the document was processed.
 
-    Sentence: Represents a unique sentence.
+    Sentence: Represents a unique sentence, boilerplate included.
 
     - `cased_sentence_hash`: The md5 hash of the cased sentence.
     - `uncased_sentence_hash`: The md5 hash of the uncased sentence.
@@ -69,6 +88,8 @@ def setup_database(db: DuckDBPyConnection):
     - `start_char`: The starting character of the sentence in the document.
     - `end_char`: The ending character of the sentence in the document.
     - `processed_at`: The timestamp of when the sentence was processed.
+    - `is_boilerplate`: Whether the sentence is repeated page furniture, such as a
+                        header or footer, which is kept for context but not searched.
 
     Document Entity: Represents an entity in a document.
     
@@ -79,50 +100,280 @@ def setup_database(db: DuckDBPyConnection):
     - `end_char`: The ending character of the entity in the document.
     - `timestamp`: The timestamp of when the entity was processed.
 
+    Chunk: Represents a unique chunk of consecutive sentences, the retrieval
+    unit of documents that weren't processed with the sentence chunker.
+
+    - `cased_chunk_hash`: The md5 hash of the cased chunk.
+    - `uncased_chunk_hash`: The md5 hash of the uncased chunk.
+    - `text`: The text of the chunk.
+    - `processed_at`: The timestamp of when the chunk was processed.
+
+    Document Chunk: Represents a chunk in a document.
+
+    - `document_hash`: The sha256 hash of the document.
+    - `cased_chunk_hash`: The md5 hash of the cased chunk.
+    - `uncased_chunk_hash`: The md5 hash of the uncased chunk.
+    - `chunker`: The chunker that produced the chunk.
+    - `index`: The index of the chunk in the document.
+    - `start_sentence_index`: The index of the chunk's first sentence.
+    - `end_sentence_index`: The index of the chunk's last sentence.
+    - `start_char`: The starting character of the chunk in the document.
+    - `end_char`: The ending character of the chunk in the document.
+    - `processed_at`: The timestamp of when the chunk was processed.
+
+    Retrieval Unit: A view of what search ranks in each document: its chunks, or
+    its sentences other than boilerplate if it has no chunks, with the range of
+    sentences they cover.
+
+    MinHash Band: Represents an LSH band of a short sentence's MinHash signature,
+    used to find boilerplate repeated across documents.
+
+    - `band_key`: The hash of the band.
+    - `document_hash`: The sha256 hash of the document.
+    - `sentence_index`: The index of the sentence in the document.
+
+    Entity Index: Maps each entity to the retrieval units it appears in, so
+    entity matches are ranked without joining through the documents.
+
+    - `cased_entity_hash`: The md5 hash of the cased entity.
+    - `uncased_entity_hash`: The md5 hash of the uncased entity, for matches that
+                             ignore case.
+    - `document_hash`: The sha256 hash of the document.
+    - `cased_text_hash`: The md5 hash of the cased retrieval unit.
+
+    Chat Session: Represents a chat session that uploaded files or asked questions.
+
+    - `session_id`: The session ID.
+    - `created_at`: The timestamp of when the session was first seen.
+    - `last_seen_at`: The timestamp of the last activity in the session.
+
+    Warehouse Setting: Represents a warehouse-wide setting, such as the active
+    embedding model.
+
+    - `key`: The name of the setting.
+    - `value`: The value of the setting.
+    - `updated_at`: The timestamp of when the setting was last changed.
+
+    Dead Letter: Represents a request that failed every retry in the text pipeline.
+
+    - `dead_letter_id`: A unique identifier for the dead letter.
+    - `step`: The name of the pipeline step that failed.
+    - `error`: The error message.
+    - `traceback`: The traceback of the error.
+    - `request_type`: The message type of the failed request.
+    - `request`: The failed request, serialized as JSON.
+    - `attempts`: The number of times the request was attempted.
+    - `status`: `pending`, or `replayed` once the request was successfully replayed.
+    - `created_at`: The timestamp of the last failure.
+    - `replayed_at`: The timestamp of when the request was replayed.
+
+    Source File: Represents a file preprocessed from a directory in incremental
+    mode, used to skip files that haven't changed since.
+
+    - `file_path`: The absolute path to the file.
+    - `size`: The size of the file in bytes when it was ingested.
+    - `mtime_ns`: The modification time of the file when it was ingested.
+    - `content_hash`: The sha256 hash of the file's bytes.
+    - `file_uuid`: The upload the file was ingested as.
+    - `document_hash`: The sha256 hash of the document.
+    - `synced_at`: The timestamp of when the file was last checked.
+
+    Trace Span: Represents a timed stage of a chat turn, when tracing is on.
+
+    - `trace_id`: The chat turn the span belongs to.
+    - `span_id`: A unique identifier for the span.
+    - `parent_id`: The enclosing span, or NULL for the turn itself.
+    - `name`: The stage, such as `parse`, `search` or `respond`.
+    - `started_at`: The timestamp of when the stage started.
+    - `duration_ms`: How long the stage took in milliseconds.
+    - `attributes`: Counts such as rows, candidates and tokens, as a JSON object.
+    - `error`: The error the stage failed with, if any.
+
     Args:
         db (DuckDBPyConnection): The DuckDB connection.
 
     Raises:
         Exception: If the database connection fails.
     """
+    hex_keys = _has_hex_keys(db)
+    if hex_keys or _has_inline_text(db):
+        _migrate_tables(db, hex_keys)
+    else:
+        _create_schema(db)
+
+    # Warehouses from before the entity index, or just migrated, are indexed once.
+    needs_index = db.execute(
+        "SELECT NOT EXISTS (FROM entity_index) AND EXISTS (FROM document_entity)"
+    ).fetchone()[0]
+    if needs_index:
+        logger.info(f"Indexed {index_entities(db)} entity occurrences.")
+
+
+def _has_hex_keys(db: DuckDBPyConnection) -> bool:
+    row = db.execute(
+        """--sql
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'document' AND column_name = 'document_hash'
+        """
+    ).fetchone()
+    return row is not None and row[0] == "VARCHAR"
+
+
+def _has_inline_text(db: DuckDBPyConnection) -> bool:
+    # Warehouses from before text was stored once kept it in these tables too.
+    return db.execute(
+        """--sql
+            SELECT EXISTS (
+                FROM information_schema.columns
+                WHERE
+                    table_name IN ('document', 'document_sentence', 'document_entity', 'text_embedding')
+                    AND column_name = 'text'
+            )
+        """
+    ).fetchone()[0]
+
+
+def _columns(db: DuckDBPyConnection, table: str) -> List[str]:
+    return [
+        column for column, in db.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = ?",
+            (table,),
+        ).fetchall()
+    ]
+
+
+def _migrate_tables(db: DuckDBPyConnection, hex_keys: bool):
+    # Tables are copied, dropped, recreated and refilled, because DuckDB can't
+    # change the type of a key column or drop a column of a referenced table in place.
+    existing = {
+        table for table, in db.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_type = 'BASE TABLE'"
+        ).fetchall()
+    }
+    tables = [table for table in KEY_COLUMNS if table in existing]
+
+    logger.info(f"Migrating {len(tables)} tables to binary keys and text stored once.")
+
+    db.begin()
+    try:
+        for table in tables:
+            keys = binary_keys(table) if hex_keys else ""
+            db.execute(f"CREATE TABLE old_{table} AS SELECT * {keys} FROM {table}")
+
+        db.execute("DROP VIEW IF EXISTS retrieval_unit")
+        # Tables that reference a document go first.
+        for table in sorted(tables, key=lambda t: t.startswith("document_"), reverse=True):
+            db.execute(f"DROP TABLE {table}")
+
+        _create_schema(db)
+
+        for table in tables:
+            _refill(db, table)
 
+        for table in tables:
+            db.execute(f"DROP TABLE old_{table}")
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info("Migrated the warehouse, compact it to reclaim the space of the old tables.")
+
+
+def _refill(db: DuckDBPyConnection, table: str):
+    old_columns = _columns(db, f"old_{table}")
+
+    if table == "document" and "text" in old_columns:
+        _compress_documents(db)
+        return
+
+    columns = ", ".join(f'"{c}"' for c in _columns(db, table) if c in old_columns)
+    db.execute(f"INSERT INTO {table} BY NAME SELECT {columns} FROM old_{table}")
+
+    # Boilerplate sentences were only kept with the documents they appear in.
+    if table == "sentence" and "text" in _columns(db, "old_document_sentence"):
+        db.execute(
+            """--sql
+                INSERT INTO sentence (
+                    cased_sentence_hash,
+                    uncased_sentence_hash,
+                    text,
+                    processed_at
+                )
+                SELECT DISTINCT ON (ds.cased_sentence_hash)
+                    ds.cased_sentence_hash,
+                    ds.uncased_sentence_hash,
+                    ds.text,
+                    ds.processed_at
+                FROM old_document_sentence ds
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM sentence s
+                    WHERE s.cased_sentence_hash = ds.cased_sentence_hash
+                )
+            """
+        )
+
+
+def _compress_documents(db: DuckDBPyConnection, batch_size: int = 1000):
+    store = open_document_store(db)
+    last_hash = b""
+
+    while True:
+        rows = db.execute(
+            """--sql
+                SELECT document_hash, text, processed_at
+                FROM old_document
+                WHERE document_hash > ?
+                ORDER BY document_hash
+                LIMIT ?
+            """,
+            (last_hash, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+
+        insert_documents(db, rows, store)
+        last_hash = rows[-1][0]
+
+
+def _create_schema(db: DuckDBPyConnection):
     db.execute(
         """--sql
             CREATE TABLE IF NOT EXISTS uploaded_file (
                 file_uuid STRING PRIMARY KEY,
                 file_path STRING NOT NULL,
-                document_hash STRING NOT NULL,
+                document_hash BLOB NOT NULL,
                 session_id STRING,
                 uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
 
             CREATE TABLE IF NOT EXISTS document (
-                document_hash STRING PRIMARY KEY,
-                text STRING NOT NULL,
+                document_hash BLOB PRIMARY KEY,
+                body BLOB,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
 
             CREATE TABLE IF NOT EXISTS sentence (
-                cased_sentence_hash STRING PRIMARY KEY,
-                uncased_sentence_hash STRING NOT NULL,
+                cased_sentence_hash BLOB PRIMARY KEY,
+                uncased_sentence_hash BLOB NOT NULL,
                 text STRING NOT NULL,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
 
             CREATE TABLE IF NOT EXISTS entity (
-                cased_entity_hash STRING PRIMARY KEY,
-                uncased_entity_hash STRING NOT NULL,
+                cased_entity_hash BLOB PRIMARY KEY,
+                uncased_entity_hash BLOB NOT NULL,
                 text STRING NOT NULL,
                 label STRING NOT NULL,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
 
             CREATE TABLE IF NOT EXISTS document_sentence (
-                document_hash STRING NOT NULL,
-                cased_sentence_hash STRING NOT NULL,
-                uncased_sentence_hash STRING NOT NULL,
+                document_hash BLOB NOT NULL,
+                cased_sentence_hash BLOB NOT NULL,
+                uncased_sentence_hash BLOB NOT NULL,
                 index INTEGER NOT NULL,
-                text STRING NOT NULL,
                 start_char INTEGER NOT NULL,
                 end_char INTEGER NOT NULL,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -130,10 +381,9 @@ def setup_database(db: DuckDBPyConnection):
             );
 
             CREATE TABLE IF NOT EXISTS document_entity (
-                document_hash STRING NOT NULL,
-                cased_entity_hash STRING NOT NULL,
-                uncased_entity_hash STRING NOT NULL,
-                text STRING NOT NULL,
+                document_hash BLOB NOT NULL,
+                cased_entity_hash BLOB NOT NULL,
+                uncased_entity_hash BLOB NOT NULL,
                 sentence_index INTEGER NOT NULL,
                 start_char INTEGER NOT NULL,
                 end_char INTEGER NOT NULL,
@@ -143,14 +393,121 @@ def setup_database(db: DuckDBPyConnection):
             );
 
             CREATE TABLE IF NOT EXISTS text_embedding (
-                cased_text_hash STRING NOT NULL,
-                uncased_text_hash STRING NOT NULL,
+                cased_text_hash BLOB NOT NULL,
+                uncased_text_hash BLOB NOT NULL,
                 model_name STRING NOT NULL,
-                text STRING NOT NULL,
                 embedding FLOAT[] NOT NULL,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (cased_text_hash, model_name),
             );
+
+            CREATE TABLE IF NOT EXISTS chunk (
+                cased_chunk_hash BLOB PRIMARY KEY,
+                uncased_chunk_hash BLOB NOT NULL,
+                text STRING NOT NULL,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS document_chunk (
+                document_hash BLOB NOT NULL,
+                cased_chunk_hash BLOB NOT NULL,
+                uncased_chunk_hash BLOB NOT NULL,
+                chunker STRING NOT NULL,
+                index INTEGER NOT NULL,
+                start_sentence_index INTEGER NOT NULL,
+                end_sentence_index INTEGER NOT NULL,
+                start_char INTEGER NOT NULL,
+                end_char INTEGER NOT NULL,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (document_hash) REFERENCES document(document_hash)
+            );
+
+            ALTER TABLE document_sentence ADD COLUMN IF NOT EXISTS is_boilerplate BOOLEAN DEFAULT FALSE;
+
+            CREATE TABLE IF NOT EXISTS minhash_band (
+                band_key BLOB NOT NULL,
+                document_hash BLOB NOT NULL,
+                sentence_index INTEGER NOT NULL
+            );
+
+            CREATE OR REPLACE VIEW retrieval_unit AS
+            SELECT
+                ds.document_hash,
+                ds.cased_sentence_hash AS cased_text_hash,
+                ds.uncased_sentence_hash AS uncased_text_hash,
+                s.text,
+                ds."index" AS start_sentence_index,
+                ds."index" AS end_sentence_index
+            FROM document_sentence ds
+            JOIN sentence s USING (cased_sentence_hash)
+            WHERE
+                ds.document_hash NOT IN (SELECT document_hash FROM document_chunk)
+                AND NOT ds.is_boilerplate
+            UNION ALL
+            SELECT
+                dc.document_hash,
+                dc.cased_chunk_hash AS cased_text_hash,
+                dc.uncased_chunk_hash AS uncased_text_hash,
+                c.text,
+                dc.start_sentence_index,
+                dc.end_sentence_index
+            FROM document_chunk dc
+            JOIN chunk c USING (cased_chunk_hash);
+
+            CREATE TABLE IF NOT EXISTS entity_index (
+                cased_entity_hash BLOB NOT NULL,
+                uncased_entity_hash BLOB NOT NULL,
+                document_hash BLOB NOT NULL,
+                cased_text_hash BLOB NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS chat_session (
+                session_id STRING PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS warehouse_setting (
+                key STRING PRIMARY KEY,
+                value STRING NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS dead_letter (
+                dead_letter_id STRING PRIMARY KEY,
+                step STRING NOT NULL,
+                error STRING NOT NULL,
+                traceback STRING NOT NULL,
+                request_type STRING NOT NULL,
+                request STRING NOT NULL,
+                attempts INTEGER NOT NULL,
+                status STRING NOT NULL DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                replayed_at TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS source_file (
+                file_path STRING PRIMARY KEY,
+                size BIGINT NOT NULL,
+                mtime_ns BIGINT NOT NULL,
+                content_hash STRING NOT NULL,
+                file_uuid STRING NOT NULL,
+                document_hash BLOB NOT NULL,
+                synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS trace_span (
+                trace_id STRING NOT NULL,
+                span_id STRING NOT NULL,
+                parent_id STRING,
+                name STRING NOT NULL,
+                started_at TIMESTAMP NOT NULL,
+                duration_ms DOUBLE NOT NULL,
+                attributes JSON,
+                error STRING
+            );
+
+            ALTER TABLE uploaded_file ADD COLUMN IF NOT EXISTS content_hash STRING;
         """
     )
 
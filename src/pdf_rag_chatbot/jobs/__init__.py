@@ -0,0 +1,7 @@
+from pdf_rag_chatbot.jobs.job_queue import (
+    IngestJob,
+    JobQueue,
+    JobStatus,
+    default_job_queue_path,
+)
+from pdf_rag_chatbot.jobs.worker import Worker
@@ -0,0 +1,318 @@
+import os
+import time
+import uuid
+import sqlite3
+from enum import Enum
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from pdf_rag_chatbot.data_pipeline.messages import FileUploaded
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestJob(BaseModel):
+    job_id: str
+    file_path: str
+    session_id: Optional[str] = None
+    content_hash: Optional[str] = None
+    status: JobStatus = JobStatus.PENDING
+    worker_id: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: float
+    available_at: float
+    claimed_at: Optional[float] = None
+    lease_expires_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def to_request(self) -> FileUploaded:
+        return FileUploaded(
+            message_id=self.job_id,
+            file_path=self.file_path,
+            session_id=self.session_id,
+            content_hash=self.content_hash,
+        )
+
+
+def default_job_queue_path(database: str) -> str:
+    """Return the sidecar job queue path for a warehouse, e.g. `warehouse.jobs.sqlite`."""
+    root, _ = os.path.splitext(database)
+    return f"{root}.jobs.sqlite"
+
+
+class JobQueue:
+    """A durable ingest job queue stored in a SQLite sidecar file.
+
+    The queue lives next to the warehouse rather than inside it because DuckDB
+    only allows one read-write process per file, while SQLite lets the chat app
+    and any number of workers enqueue and claim jobs concurrently. Claimed jobs
+    hold a lease; a job whose worker dies is handed out again once its lease
+    expires, until `max_attempts` is reached. Jobs for the same file contents
+    are handed out one at a time, so the file is only extracted once.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 3,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """--sql
+                    CREATE TABLE IF NOT EXISTS ingest_job (
+                        job_id TEXT PRIMARY KEY,
+                        file_path TEXT NOT NULL,
+                        session_id TEXT,
+                        status TEXT NOT NULL,
+                        worker_id TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        created_at REAL NOT NULL,
+                        available_at REAL NOT NULL,
+                        claimed_at REAL,
+                        lease_expires_at REAL,
+                        finished_at REAL
+                    )
+                """
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(ingest_job)")}
+            if "content_hash" not in columns:
+                conn.execute("ALTER TABLE ingest_job ADD COLUMN content_hash TEXT")
+            conn.execute(
+                """--sql
+                    CREATE INDEX IF NOT EXISTS ingest_job_status_idx
+                    ON ingest_job (status, available_at)
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation keeps the queue safe to use from
+        # several threads and processes at once.
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, req: FileUploaded) -> IngestJob:
+        """Add a file to the queue.
+
+        Args:
+            req (FileUploaded): The upload to process. Its `message_id` becomes the job id.
+
+        Returns:
+            IngestJob: The queued job.
+        """
+        now = time.time()
+        job = IngestJob(
+            job_id=req.message_id,
+            file_path=os.path.abspath(req.file_path),
+            session_id=req.session_id,
+            content_hash=req.content_hash,
+            created_at=now,
+            available_at=now,
+        )
+
+        with self._connect() as conn:
+            conn.execute(
+                """--sql
+                    INSERT INTO ingest_job (
+                        job_id,
+                        file_path,
+                        session_id,
+                        content_hash,
+                        status,
+                        created_at,
+                        available_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job.job_id,
+                    job.file_path,
+                    job.session_id,
+                    job.content_hash,
+                    job.status.value,
+                    job.created_at,
+                    job.available_at,
+                ),
+            )
+
+        return job
+
+    def claim(self, worker_id: str, limit: int = 1) -> List[IngestJob]:
+        """Claim up to `limit` jobs for a worker.
+
+        Pending jobs are claimed in order of creation, along with running jobs
+        whose lease has expired because their worker stopped heartbeating. A job
+        waits while another job for the same file contents is running, and then
+        only links the already ingested document to its session.
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs abandoned by a dead worker too many times are given up on.
+                conn.execute(
+                    """--sql
+                        UPDATE ingest_job
+                        SET
+                            status = ?,
+                            error = 'Lease expired after the maximum number of attempts.',
+                            finished_at = ?
+                        WHERE
+                            status = ?
+                            AND lease_expires_at < ?
+                            AND attempts >= ?
+                    """,
+                    (JobStatus.FAILED.value, now, JobStatus.RUNNING.value, now, self.max_attempts),
+                )
+
+                rows = conn.execute(
+                    """--sql
+                        SELECT job_id
+                        FROM (
+                            SELECT
+                                job_id,
+                                created_at,
+                                ROW_NUMBER() OVER (
+                                    PARTITION BY COALESCE(content_hash, job_id)
+                                    ORDER BY created_at
+                                ) AS content_rank
+                            FROM ingest_job j
+                            WHERE
+                                (
+                                    (status = ? AND available_at <= ?)
+                                    OR (status = ? AND lease_expires_at < ?)
+                                )
+                                AND NOT EXISTS (
+                                    SELECT 1 FROM ingest_job r
+                                    WHERE
+                                        r.content_hash = j.content_hash
+                                        AND r.job_id != j.job_id
+                                        AND r.status = ?
+                                        AND r.lease_expires_at >= ?
+                                )
+                        )
+                        WHERE content_rank = 1
+                        ORDER BY created_at
+                        LIMIT ?
+                    """,
+                    (
+                        JobStatus.PENDING.value,
+                        now,
+                        JobStatus.RUNNING.value,
+                        now,
+                        JobStatus.RUNNING.value,
+                        now,
+                        limit,
+                    ),
+                ).fetchall()
+                job_ids = [row["job_id"] for row in rows]
+
+                conn.executemany(
+                    """--sql
+                        UPDATE ingest_job
+                        SET
+                            status = ?,
+                            worker_id = ?,
+                            attempts = attempts + 1,
+                            claimed_at = ?,
+                            lease_expires_at = ?
+                        WHERE job_id = ?
+                    """,
+                    [
+                        (JobStatus.RUNNING.value, worker_id, now, now + self.lease_seconds, job_id)
+                        for job_id in job_ids
+                    ],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return self.get_jobs(job_ids)
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease on a running job. Returns False if the job was lost."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                """--sql
+                    UPDATE ingest_job
+                    SET lease_expires_at = ?
+                    WHERE job_id = ? AND worker_id = ? AND status = ?
+                """,
+                (time.time() + self.lease_seconds, job_id, worker_id, JobStatus.RUNNING.value),
+            )
+            return cur.rowcount > 0
+
+    def complete(self, job_id: str, worker_id: str):
+        """Mark a job as completed."""
+        self._finish(job_id, worker_id, JobStatus.COMPLETED, None)
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """Mark a job as failed."""
+        self._finish(job_id, worker_id, JobStatus.FAILED, error)
+
+    def _finish(self, job_id: str, worker_id: str, status: JobStatus, error: Optional[str]):
+        with self._connect() as conn:
+            conn.execute(
+                """--sql
+                    UPDATE ingest_job
+                    SET
+                        status = ?,
+                        error = ?,
+                        finished_at = ?,
+                        lease_expires_at = NULL
+                    WHERE job_id = ? AND worker_id = ?
+                """,
+                (status.value, error, time.time(), job_id, worker_id),
+            )
+
+    def get_jobs(self, job_ids: List[str]) -> List[IngestJob]:
+        """Fetch jobs by id, in the order given."""
+        if not job_ids:
+            return []
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM ingest_job WHERE job_id IN ({', '.join('?' for _ in job_ids)})",
+                job_ids,
+            ).fetchall()
+
+        jobs = {row["job_id"]: IngestJob(**dict(row)) for row in rows}
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    def counts(self) -> dict:
+        """Return the number of jobs in each status."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM ingest_job GROUP BY status"
+            ).fetchall()
+
+        return {row["status"]: row["n"] for row in rows}
+
+
+def new_worker_id() -> str:
+    return f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
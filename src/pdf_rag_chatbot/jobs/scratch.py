@@ -0,0 +1,266 @@
+from typing import Dict, List, Optional, Tuple
+
+from duckdb import DuckDBPyConnection
+
+from pdf_rag_chatbot.data_pipeline.dedup import BoilerplateDetector
+from pdf_rag_chatbot.db.entity_index import index_entities
+from pdf_rag_chatbot.db.settings import DOCUMENT_STORE
+
+
+# Rows a job's pipeline reads from the warehouse, copied into its scratch database.
+_SEED_QUERIES: List[Tuple[str, str]] = [
+    ("warehouse_setting", "SELECT * FROM warehouse_setting"),
+    # An earlier upload of the same bytes, which lets ingest skip extraction.
+    (
+        "uploaded_file",
+        """--sql
+            SELECT * FROM uploaded_file
+            WHERE
+                content_hash = $content_hash
+                AND document_hash IN (SELECT document_hash FROM document)
+            LIMIT 1
+        """,
+    ),
+    (
+        "document",
+        """--sql
+            SELECT document_hash, processed_at FROM document
+            WHERE document_hash IN (
+                SELECT document_hash FROM uploaded_file WHERE content_hash = $content_hash
+            )
+        """,
+    ),
+]
+
+# Rows of the scratch database that the warehouse doesn't have yet, in the
+# order they are merged. Rows of documents the warehouse already has are skipped.
+_MERGE_QUERIES: List[Tuple[str, str]] = [
+    (
+        "document",
+        """--sql
+            INSERT INTO document BY NAME
+            SELECT * FROM scratch.document
+            WHERE document_hash IN (SELECT document_hash FROM merge_document)
+        """,
+    ),
+    (
+        "document_sentence",
+        """--sql
+            INSERT INTO document_sentence BY NAME
+            SELECT * FROM scratch.document_sentence
+            WHERE document_hash IN (SELECT document_hash FROM merge_document)
+        """,
+    ),
+    (
+        "document_entity",
+        """--sql
+            INSERT INTO document_entity BY NAME
+            SELECT * FROM scratch.document_entity
+            WHERE document_hash IN (SELECT document_hash FROM merge_document)
+        """,
+    ),
+    (
+        "document_chunk",
+        """--sql
+            INSERT INTO document_chunk BY NAME
+            SELECT * FROM scratch.document_chunk
+            WHERE document_hash IN (SELECT document_hash FROM merge_document)
+        """,
+    ),
+    (
+        "minhash_band",
+        """--sql
+            INSERT INTO minhash_band BY NAME
+            SELECT * FROM scratch.minhash_band
+            WHERE document_hash IN (SELECT document_hash FROM merge_document)
+        """,
+    ),
+    (
+        "sentence",
+        """--sql
+            INSERT INTO sentence BY NAME
+            SELECT b.* FROM scratch.sentence b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM sentence s WHERE s.cased_sentence_hash = b.cased_sentence_hash
+            )
+        """,
+    ),
+    (
+        "entity",
+        """--sql
+            INSERT INTO entity BY NAME
+            SELECT b.* FROM scratch.entity b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM entity e WHERE e.cased_entity_hash = b.cased_entity_hash
+            )
+        """,
+    ),
+    (
+        "chunk",
+        """--sql
+            INSERT INTO chunk BY NAME
+            SELECT b.* FROM scratch.chunk b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM chunk c WHERE c.cased_chunk_hash = b.cased_chunk_hash
+            )
+        """,
+    ),
+    (
+        "text_embedding",
+        """--sql
+            INSERT INTO text_embedding BY NAME
+            SELECT b.* FROM scratch.text_embedding b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM text_embedding te
+                WHERE
+                    te.cased_text_hash = b.cased_text_hash
+                    AND te.model_name = b.model_name
+            )
+        """,
+    ),
+    (
+        "uploaded_file",
+        """--sql
+            INSERT INTO uploaded_file BY NAME
+            SELECT b.* FROM scratch.uploaded_file b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM uploaded_file uf WHERE uf.file_uuid = b.file_uuid
+            )
+        """,
+    ),
+]
+
+_DEAD_LETTER_QUERY = "INSERT OR REPLACE INTO dead_letter BY NAME SELECT * FROM scratch.dead_letter"
+
+# A document store given to the job's ingest step is remembered by the warehouse.
+_DOCUMENT_STORE_QUERY = f"""--sql
+    INSERT OR REPLACE INTO warehouse_setting BY NAME
+    SELECT * FROM scratch.warehouse_setting WHERE key = '{DOCUMENT_STORE}'
+"""
+
+
+def seed_scratch(
+    db: DuckDBPyConnection,
+    scratch: DuckDBPyConnection,
+    content_hash: Optional[str] = None,
+):
+    """Copy the rows a job reads from the warehouse into its scratch database.
+
+    Embeddings and LSH bands are looked up per document instead, once its texts
+    are known, with `stored_embeddings` and `stored_minhash_bands`.
+
+    Args:
+        db (DuckDBPyConnection): The warehouse.
+        scratch (DuckDBPyConnection): The job's scratch database, with the warehouse schema.
+        content_hash (Optional[str], optional): The hash of the file's bytes, to find an
+            earlier upload of them. Defaults to None.
+    """
+    for table, query in _SEED_QUERIES:
+        if "$content_hash" in query:
+            rows = db.execute(query, {"content_hash": content_hash}).pl()
+        else:
+            rows = db.execute(query).pl()
+
+        scratch.register("seed_rows", rows)
+        try:
+            scratch.execute(f"INSERT INTO {table} BY NAME SELECT * FROM seed_rows")
+        finally:
+            scratch.unregister("seed_rows")
+
+
+def stored_embeddings(
+    db: DuckDBPyConnection,
+    cased_text_hashes: List[bytes],
+    model_name: str,
+) -> Dict[bytes, List[float]]:
+    """Look up the warehouse's embeddings of texts, so a job doesn't embed them again.
+
+    Returns:
+        Dict[bytes, List[float]]: The embeddings found, by cased text hash.
+    """
+    rows = db.execute(
+        """--sql
+            SELECT cased_text_hash, embedding
+            FROM text_embedding
+            WHERE
+                cased_text_hash IN (SELECT UNNEST(?::BLOB[]))
+                AND model_name = ?
+        """,
+        (cased_text_hashes, model_name),
+    ).fetchall()
+    return dict(rows)
+
+
+def stored_minhash_bands(db: DuckDBPyConnection, band_keys: List[bytes]) -> List[Tuple[bytes, bytes, int]]:
+    """Look up the warehouse's LSH bands that a job's document shares.
+
+    Returns:
+        List[Tuple[bytes, bytes, int]]: The band key, document hash and sentence index of each band.
+    """
+    return db.execute(
+        """--sql
+            SELECT band_key, document_hash, sentence_index
+            FROM minhash_band
+            WHERE band_key IN (SELECT UNNEST(?::BLOB[]))
+        """,
+        (band_keys,),
+    ).fetchall()
+
+
+def merge_scratch(
+    db: DuckDBPyConnection,
+    scratch_path: str,
+    failed: bool = False,
+    boilerplate: Optional[BoilerplateDetector] = None,
+) -> Dict[str, int]:
+    """Merge a job's scratch database into the warehouse in one short transaction.
+
+    Args:
+        db (DuckDBPyConnection): The warehouse.
+        scratch_path (str): The scratch database file, which must be closed.
+        failed (bool, optional): The job failed, so only its dead letters are merged.
+            Defaults to False.
+        boilerplate (Optional[BoilerplateDetector], optional): Flags lines of earlier
+            documents that became boilerplate with the merged ones. Defaults to None.
+
+    Returns:
+        Dict[str, int]: The number of rows merged into each table.
+    """
+    path = scratch_path.replace("'", "''")
+    db.execute(f"ATTACH '{path}' AS scratch (READ_ONLY)")
+
+    counts = {}
+    db.begin()
+    try:
+        counts["dead_letter"] = db.execute(_DEAD_LETTER_QUERY).fetchone()[0]
+
+        if not failed:
+            db.execute(
+                """--sql
+                    CREATE OR REPLACE TEMP TABLE merge_document AS
+                    SELECT s.document_hash FROM scratch.document s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM document d WHERE d.document_hash = s.document_hash
+                    )
+                """
+            )
+            for table, query in _MERGE_QUERIES:
+                counts[table] = db.execute(query).fetchone()[0]
+            db.execute(_DOCUMENT_STORE_QUERY)
+
+            document_hashes = [h for h, in db.execute("SELECT document_hash FROM merge_document").fetchall()]
+            index_entities(db, document_hashes)
+            if boilerplate is not None:
+                for document_hash in document_hashes:
+                    boilerplate.flag_earlier_documents(db, document_hash)
+
+            db.execute("DROP TABLE merge_document")
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.execute("DETACH scratch")
+
+    return counts
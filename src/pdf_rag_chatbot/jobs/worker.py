@@ -0,0 +1,160 @@
+import os
+import time
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from pdf_rag_chatbot.db import connect, setup_database, warehouse
+from pdf_rag_chatbot.data_pipeline import TextPipeline
+from pdf_rag_chatbot.jobs.job_queue import IngestJob, JobQueue, new_worker_id
+from pdf_rag_chatbot.jobs.scratch import (
+    merge_scratch,
+    seed_scratch,
+    stored_embeddings,
+    stored_minhash_bands,
+)
+
+
+class Worker:
+    def __init__(
+        self,
+        database: str,
+        job_queue: JobQueue,
+        worker_id: Optional[str] = None,
+        batch_size: int = 1,
+        poll_interval: float = 1.0,
+        pipeline: Optional[TextPipeline] = None,
+    ):
+        """Initialize an ingest worker.
+
+        Args:
+            database (str): The path to the DuckDB database file.
+            job_queue (JobQueue): The queue to claim jobs from.
+            worker_id (Optional[str], optional): A unique name for this worker. Defaults to a generated id.
+            batch_size (int, optional): The number of jobs to claim at a time. Defaults to 1.
+            poll_interval (float, optional): Seconds to sleep when the queue is empty. Defaults to 1.0.
+            pipeline (Optional[TextPipeline], optional): The pipeline to run jobs through.
+                Defaults to a new pipeline, which loads the NLP and embedding models.
+        """
+        self.database = database
+        self.job_queue = job_queue
+        self.worker_id = worker_id or new_worker_id()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        with warehouse(database) as db:
+            setup_database(db)
+
+        self.pipeline = pipeline or TextPipeline(None)
+        self.pipeline.embed.embedding_source = self._stored_embeddings
+        if self.pipeline.nlp.boilerplate is not None:
+            self.pipeline.nlp.boilerplate.band_source = self._stored_minhash_bands
+        self.stop_event = threading.Event()
+
+    def run(self, max_jobs: Optional[int] = None, exit_when_idle: bool = False):
+        """Claim and process jobs until stopped.
+
+        Args:
+            max_jobs (Optional[int], optional): Stop after processing this many jobs. Defaults to None.
+            exit_when_idle (bool, optional): Stop once the queue is empty. Defaults to False.
+        """
+        logger.info(f"Worker {self.worker_id} started.")
+        processed = 0
+
+        while not self.stop_event.is_set():
+            limit = self.batch_size
+            if max_jobs is not None:
+                limit = min(limit, max_jobs - processed)
+                if limit <= 0:
+                    break
+
+            jobs = self.job_queue.claim(self.worker_id, limit=limit)
+
+            if not jobs:
+                if exit_when_idle:
+                    break
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            for job in jobs:
+                self.process(job)
+                processed += 1
+
+        logger.info(f"Worker {self.worker_id} stopped after {processed} jobs.")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def process(self, job: IngestJob):
+        """Run a claimed job through the pipeline and record its outcome."""
+        logger.info(f"Processing job {job.job_id}: {job.file_path} (attempt {job.attempts})")
+        started_at = time.monotonic()
+
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            args=(job.job_id, heartbeat_stop),
+            daemon=True,
+        )
+        heartbeat.start()
+
+        try:
+            self._run(job)
+        except Exception as e:
+            logger.exception(e)
+            self.job_queue.fail(job.job_id, self.worker_id, str(e))
+        else:
+            self.job_queue.complete(job.job_id, self.worker_id)
+            logger.info(f"Completed job {job.job_id} in {time.monotonic() - started_at:.2f}s")
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+
+    def _run(self, job: IngestJob):
+        # Extraction, NLP and embedding write to a scratch database of their own.
+        # The warehouse is only held to copy in what the job reads, to look up
+        # the embeddings and LSH bands of the document's texts, and to merge the
+        # results, so workers run in parallel and searches rarely wait.
+        boilerplate = self.pipeline.nlp.boilerplate
+
+        with tempfile.TemporaryDirectory(prefix="pdf-rag-job-") as scratch_dir:
+            scratch_path = os.path.join(scratch_dir, "job.duckdb")
+            error: Optional[Exception] = None
+
+            scratch = connect(scratch_path)
+            try:
+                setup_database(scratch)
+                with warehouse(self.database) as db:
+                    seed_scratch(db, scratch, job.content_hash)
+
+                self.pipeline.set_connection(scratch)
+                try:
+                    self.pipeline(job.to_request())
+                except Exception as e:
+                    error = e
+            finally:
+                self.pipeline.set_connection(None)
+                scratch.close()
+
+            with warehouse(self.database) as db:
+                merge_scratch(db, scratch_path, failed=error is not None, boilerplate=boilerplate)
+
+        if error is not None:
+            raise error
+
+    def _stored_embeddings(self, cased_text_hashes: List[bytes], model_name: str) -> Dict[bytes, List[float]]:
+        with warehouse(self.database, read_only=True) as db:
+            return stored_embeddings(db, cased_text_hashes, model_name)
+
+    def _stored_minhash_bands(self, band_keys: List[bytes]) -> List[Tuple[bytes, bytes, int]]:
+        with warehouse(self.database, read_only=True) as db:
+            return stored_minhash_bands(db, band_keys)
+
+    def _heartbeat(self, job_id: str, stop_event: threading.Event):
+        interval = self.job_queue.lease_seconds / 3
+        while not stop_event.wait(interval):
+            if not self.job_queue.heartbeat(job_id, self.worker_id):
+                logger.warning(f"Lost the lease on job {job_id}.")
+                return
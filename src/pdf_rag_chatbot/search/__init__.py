@@ -0,0 +1,7 @@
+from pdf_rag_chatbot.search.exact import (
+    ExactSearch,
+    embedding_blocks,
+    normalize,
+    top_k,
+)
+from pdf_rag_chatbot.search.sql import SQLSearch
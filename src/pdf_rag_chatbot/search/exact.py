@@ -0,0 +1,162 @@
+from typing import Any, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from duckdb import DuckDBPyConnection
+
+from pdf_rag_chatbot.tracing import current_span
+
+
+# A block of the corpus: the keys of its rows and their embeddings.
+Block = Tuple[List[Any], np.ndarray]
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length, so dot products are cosine similarities."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """The indices of the `k` highest scores, highest first.
+
+    Only the top `k` are sorted, the rest are just partitioned away.
+    """
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def embedding_blocks(
+    db: DuckDBPyConnection,
+    query: str,
+    params: Any = None,
+    block_size: int = 16384,
+) -> Iterator[Block]:
+    """Stream `(key, embedding)` rows of a query in blocks of `block_size` rows.
+
+    The query's first column is the key, its second the embedding. Rows are
+    fetched as Arrow batches, so the corpus is never held in memory at once.
+    """
+    reader = db.execute(query, params).fetch_record_batch(block_size)
+    for batch in reader:
+        if batch.num_rows == 0:
+            continue
+        keys = batch.column(0).to_pylist()
+        lists = batch.column(1)
+        values = lists.flatten().to_numpy(zero_copy_only=False)
+        yield keys, values.reshape(batch.num_rows, -1)
+
+
+class ExactSearch:
+    def __init__(self, k: int = 100, block_size: int = 16384):
+        """Exact cosine search that scores the corpus a block at a time.
+
+        A text's score is its highest similarity to any of the queries. Each block
+        is scored against every query at once, and only the running top `k` are
+        kept between blocks, so peak memory is bounded by the block size rather
+        than by the size of the corpus.
+
+        Args:
+            k (int, optional): The number of results. Defaults to 100.
+            block_size (int, optional): Corpus rows scored at a time. Defaults to 16384.
+        """
+        self.k = k
+        self.block_size = block_size
+
+    def search(self, queries: np.ndarray, blocks: Iterable[Block]) -> Tuple[List[Any], np.ndarray]:
+        """Find the `k` texts most similar to any of the queries.
+
+        Args:
+            queries (np.ndarray): The query embeddings, one row per query.
+            blocks (Iterable[Block]): The corpus, in blocks of keys and embeddings.
+
+        Returns:
+            Tuple[List[Any], np.ndarray]: The keys of the results and their scores,
+                highest first.
+        """
+        return self.search_many([queries], blocks)[0]
+
+    def search_many(
+        self,
+        query_groups: List[np.ndarray],
+        blocks: Iterable[Block],
+    ) -> List[Tuple[List[Any], np.ndarray]]:
+        """Run several searches in a single pass over the corpus.
+
+        Every group's queries are scored against a block in one matrix product,
+        and each group keeps its own running top `k`.
+
+        Args:
+            query_groups (List[np.ndarray]): The query embeddings of each search.
+            blocks (Iterable[Block]): The corpus, in blocks of keys and embeddings.
+
+        Returns:
+            List[Tuple[List[Any], np.ndarray]]: The keys and scores of each search's
+                results, highest first.
+        """
+        groups = [normalize(np.atleast_2d(queries)) for queries in query_groups]
+        bounds = np.cumsum([0] + [len(group) for group in groups])
+        queries = np.vstack(groups)
+
+        best_keys: List[List[Any]] = [[] for _ in groups]
+        best_scores = [np.empty(0, dtype=np.float32) for _ in groups]
+
+        span = current_span()
+        for keys, embeddings in blocks:
+            span.add(rows=len(keys), blocks=1)
+            all_scores = normalize(embeddings) @ queries.T
+
+            for g in range(len(groups)):
+                if bounds[g] == bounds[g + 1]:
+                    continue
+                scores = all_scores[:, bounds[g]:bounds[g + 1]].max(axis=1)
+
+                # Only rows that can still make the top k are merged.
+                if len(best_scores[g]) == self.k:
+                    candidates = np.flatnonzero(scores > best_scores[g][-1])
+                    if len(candidates) == 0:
+                        continue
+                else:
+                    candidates = np.arange(len(scores))
+
+                merged_scores = np.concatenate([best_scores[g], scores[candidates]])
+                merged_keys = best_keys[g] + [keys[i] for i in candidates]
+
+                order = top_k(merged_scores, self.k)
+                best_scores[g] = merged_scores[order]
+                best_keys[g] = [merged_keys[i] for i in order]
+
+        span.add(candidates=sum(len(keys) for keys in best_keys))
+        return list(zip(best_keys, best_scores))
+
+    def search_array(self, queries: np.ndarray, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Search an in-memory corpus, returning row indices instead of keys."""
+        blocks = (
+            (range(start, min(start + self.block_size, len(embeddings))), embeddings[start:start + self.block_size])
+            for start in range(0, len(embeddings), self.block_size)
+        )
+        indices, scores = self.search(queries, blocks)
+        return np.asarray(indices, dtype=np.int64), scores
+
+    def search_warehouse(
+        self,
+        db: DuckDBPyConnection,
+        queries: np.ndarray,
+        query: str,
+        params: Any = None,
+    ) -> Tuple[List[Any], np.ndarray]:
+        """Search the `(key, embedding)` rows of a warehouse query."""
+        return self.search(queries, embedding_blocks(db, query, params, self.block_size))
+
+    def search_warehouse_many(
+        self,
+        db: DuckDBPyConnection,
+        query_groups: List[np.ndarray],
+        query: str,
+        params: Any = None,
+    ) -> List[Tuple[List[Any], np.ndarray]]:
+        """Run several searches in a single pass over the rows of a warehouse query."""
+        return self.search_many(query_groups, embedding_blocks(db, query, params, self.block_size))
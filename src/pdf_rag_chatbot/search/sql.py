@@ -0,0 +1,196 @@
+from typing import List, Tuple
+
+import numpy as np
+import polars as pl
+from duckdb import DuckDBPyConnection
+
+
+_SEARCH_QUERY = """--sql
+    WITH
+    visible_document AS (
+        SELECT DISTINCT document_hash
+        FROM uploaded_file
+        WHERE
+            session_id = $session_id
+            OR session_id IS NULL
+    ),
+    term AS (
+        SELECT UNNEST($terms::FLOAT[{dim}][]) AS vector
+    ),
+    unit_score AS (
+        SELECT
+            te.cased_text_hash,
+            MAX(array_cosine_similarity(te.embedding::FLOAT[{dim}], term.vector)) AS score
+        FROM text_embedding te, term
+        WHERE
+            te.model_name = $model_name
+            AND te.cased_text_hash IN (
+                SELECT cased_text_hash FROM retrieval_unit
+                WHERE document_hash IN (FROM visible_document)
+            )
+        GROUP BY te.cased_text_hash
+        ORDER BY score DESC
+        LIMIT $k
+    ),
+    entity_term AS (
+        SELECT UNNEST($entity_terms::FLOAT[{dim}][]) AS vector
+    ),
+    entity_score AS (
+        SELECT
+            te.cased_text_hash AS cased_entity_hash,
+            MAX(array_cosine_similarity(te.embedding::FLOAT[{dim}], entity_term.vector)) AS score
+        FROM text_embedding te, entity_term
+        WHERE
+            te.model_name = $model_name
+            AND te.cased_text_hash IN (
+                SELECT cased_entity_hash FROM entity_index
+                WHERE document_hash IN (FROM visible_document)
+            )
+        GROUP BY te.cased_text_hash
+        ORDER BY score DESC
+        LIMIT $k
+    ),
+    entity_unit_score AS (
+        SELECT
+            cased_text_hash,
+            MAX(score) AS score
+        FROM (
+            SELECT ei.cased_text_hash, es.score
+            FROM entity_score es
+            JOIN entity_index ei USING (cased_entity_hash)
+            WHERE ei.document_hash IN (FROM visible_document)
+            UNION ALL
+            -- Entities that match a term exactly, ignoring case.
+            SELECT ei.cased_text_hash, 1.0 AS score
+            FROM (SELECT UNNEST($exact_entities::BLOB[]) AS uncased_entity_hash)
+            JOIN entity_index ei USING (uncased_entity_hash)
+            WHERE ei.document_hash IN (FROM visible_document)
+        )
+        GROUP BY cased_text_hash
+    ),
+    fused AS (
+        SELECT
+            cased_text_hash,
+            CASE
+                WHEN $has_terms AND $has_entities THEN
+                    (1 - $entity_importance) * COALESCE(u.score, 0)
+                    + $entity_importance * COALESCE(e.score, 0)
+                ELSE COALESCE(u.score, e.score)
+            END AS score
+        FROM unit_score u
+        FULL OUTER JOIN entity_unit_score e USING (cased_text_hash)
+        ORDER BY score DESC
+        LIMIT $limit
+    )
+    SELECT DISTINCT
+        ru.text AS sentence_text,
+        f.score AS relevancy_score,
+        (
+            SELECT
+                STRING_AGG(s.text, ' ' ORDER BY ds_inner."index") AS text
+            FROM document_sentence ds_inner
+            JOIN sentence s USING (cased_sentence_hash)
+            WHERE
+                ds_inner.document_hash = ru.document_hash
+                AND ds_inner."index" BETWEEN ru.start_sentence_index - $ctx_size AND ru.end_sentence_index + $ctx_size
+        ) AS surrounding_context
+    FROM retrieval_unit ru
+    JOIN fused f USING (cased_text_hash)
+    WHERE ru.document_hash IN (FROM visible_document)
+    ORDER BY relevancy_score DESC
+"""
+
+
+_TOP_K_QUERY = """--sql
+    SELECT
+        te.cased_text_hash,
+        MAX(array_cosine_similarity(te.embedding::FLOAT[{dim}], term.vector)) AS score
+    FROM text_embedding te, (SELECT UNNEST($terms::FLOAT[{dim}][]) AS vector) term
+    WHERE te.model_name = $model_name
+    GROUP BY te.cased_text_hash
+    ORDER BY score DESC
+    LIMIT $k
+"""
+
+
+class SQLSearch:
+    def __init__(self, k: int = 100, limit: int = 50):
+        """Search that scores, filters, fuses and joins context in a single DuckDB query.
+
+        Query vectors are passed as parameters and compared with the stored
+        embeddings with `array_cosine_similarity`, so vectors never leave DuckDB
+        and scoring runs in its parallel scan.
+
+        Args:
+            k (int, optional): Candidates kept from each of the term and entity
+                searches. Defaults to 100.
+            limit (int, optional): The number of results. Defaults to 50.
+        """
+        self.k = k
+        self.limit = limit
+
+    def search(
+        self,
+        db: DuckDBPyConnection,
+        session_id: str,
+        model_name: str,
+        term_embeddings: np.ndarray,
+        entity_embeddings: np.ndarray,
+        exact_entities: List[bytes],
+        entity_importance: float = 0.6,
+        context_size: int = 3,
+    ) -> pl.DataFrame:
+        """Find the retrieval units most similar to the search terms.
+
+        Args:
+            db (DuckDBPyConnection): The DuckDB connection.
+            session_id (str): The session, whose uploads are searched along with
+                preprocessed documents.
+            model_name (str): The embedding model of the query vectors.
+            term_embeddings (np.ndarray): The embeddings of keywords and phrases.
+            entity_embeddings (np.ndarray): The embeddings of entity terms.
+            exact_entities (List[bytes]): The uncased hashes of entity terms.
+            entity_importance (float, optional): The weight of entity matches when
+                there are both kinds of terms. Defaults to 0.6.
+            context_size (int, optional): Sentences of context around each result.
+                Defaults to 3.
+
+        Returns:
+            pl.DataFrame: The results' text, score and surrounding context.
+        """
+        dim = max(np.shape(term_embeddings)[-1], np.shape(entity_embeddings)[-1])
+
+        return db.execute(
+            _SEARCH_QUERY.format(dim=int(dim)),
+            {
+                "session_id": session_id,
+                "model_name": model_name,
+                "terms": np.asarray(term_embeddings, dtype=np.float32).tolist(),
+                "entity_terms": np.asarray(entity_embeddings, dtype=np.float32).tolist(),
+                "exact_entities": exact_entities,
+                "has_terms": len(term_embeddings) > 0,
+                "has_entities": len(entity_embeddings) > 0,
+                "entity_importance": entity_importance,
+                "k": self.k,
+                "limit": self.limit,
+                "ctx_size": context_size,
+            },
+        ).pl()
+
+    def search_embeddings(
+        self,
+        db: DuckDBPyConnection,
+        model_name: str,
+        queries: np.ndarray,
+    ) -> Tuple[List[bytes], np.ndarray]:
+        """Score every embedding of a model, without filtering or fusion.
+
+        Returns:
+            Tuple[List[bytes], np.ndarray]: The `k` best text hashes and their scores.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        rows = db.execute(
+            _TOP_K_QUERY.format(dim=queries.shape[1]),
+            {"terms": queries.tolist(), "model_name": model_name, "k": self.k},
+        ).fetchall()
+        return [key for key, _ in rows], np.array([score for _, score in rows], dtype=np.float32)
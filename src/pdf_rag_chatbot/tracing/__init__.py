@@ -0,0 +1,14 @@
+from pdf_rag_chatbot.tracing.sinks import (
+    TraceSink,
+    JSONLTraceSink,
+    DuckDBTraceSink,
+    default_trace_path,
+)
+from pdf_rag_chatbot.tracing.spans import (
+    NULL_SPAN,
+    Span,
+    Tracer,
+    current_span,
+    span,
+)
+from pdf_rag_chatbot.tracing.usage import record_llm_usage, token_usage
@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import Optional
+
+import polars as pl
+from duckdb import DuckDBPyConnection
+
+
+def load_jsonl_traces(db: DuckDBPyConnection, path: str):
+    """Expose a JSONL trace file as a `trace_span` view, to report on it like the table."""
+    db.execute(
+        f"""--sql
+            CREATE OR REPLACE TEMP VIEW trace_span AS
+            SELECT * FROM read_json(
+                '{path.replace("'", "''")}',
+                format = 'newline_delimited',
+                columns = {{
+                    trace_id: 'STRING',
+                    span_id: 'STRING',
+                    parent_id: 'STRING',
+                    name: 'STRING',
+                    started_at: 'TIMESTAMP',
+                    duration_ms: 'DOUBLE',
+                    attributes: 'JSON',
+                    error: 'STRING'
+                }}
+            )
+        """
+    )
+
+
+def stage_breakdown(db: DuckDBPyConnection, since: Optional[datetime] = None) -> pl.DataFrame:
+    """Latency percentiles and totals of each kind of span, slowest first."""
+    return db.execute(
+        """--sql
+            SELECT
+                name,
+                COUNT(*) AS spans,
+                COUNT(error) AS errors,
+                quantile_cont(duration_ms, 0.5) AS p50_ms,
+                quantile_cont(duration_ms, 0.95) AS p95_ms,
+                quantile_cont(duration_ms, 0.99) AS p99_ms,
+                MAX(duration_ms) AS max_ms,
+                SUM((attributes->>'prompt_tokens')::BIGINT) AS prompt_tokens,
+                SUM((attributes->>'completion_tokens')::BIGINT) AS completion_tokens
+            FROM trace_span
+            WHERE started_at >= COALESCE(?, '-infinity'::TIMESTAMP)
+            GROUP BY name
+            ORDER BY p95_ms DESC
+        """,
+        (since,),
+    ).pl()
+
+
+def slowest_turns(db: DuckDBPyConnection, limit: int = 10, since: Optional[datetime] = None) -> pl.DataFrame:
+    """The slowest chat turns, with the time spent in each of their stages."""
+    return db.execute(
+        """--sql
+            SELECT
+                t.trace_id,
+                t.started_at,
+                t.duration_ms,
+                SUM(c.duration_ms) FILTER (WHERE c.name = 'upload') AS upload_ms,
+                SUM(c.duration_ms) FILTER (WHERE c.name = 'parse') AS parse_ms,
+                SUM(c.duration_ms) FILTER (WHERE c.name = 'search') AS search_ms,
+                SUM(c.duration_ms) FILTER (WHERE c.name = 'respond') AS respond_ms,
+                SUM((c.attributes->>'prompt_tokens')::BIGINT) AS prompt_tokens,
+                SUM((c.attributes->>'completion_tokens')::BIGINT) AS completion_tokens,
+                t.error
+            FROM trace_span t
+            LEFT JOIN trace_span c
+                ON c.trace_id = t.trace_id
+                AND c.parent_id = t.span_id
+            WHERE
+                t.parent_id IS NULL
+                AND t.started_at >= COALESCE(?, '-infinity'::TIMESTAMP)
+            GROUP BY t.trace_id, t.started_at, t.duration_ms, t.error
+            ORDER BY t.duration_ms DESC
+            LIMIT ?
+        """,
+        (since, limit),
+    ).pl()
+
+
+def purge_traces(db: DuckDBPyConnection, older_than: datetime) -> int:
+    """Delete spans of traces that started before a time, returning the number deleted."""
+    return db.execute(
+        """--sql
+            DELETE FROM trace_span
+            WHERE trace_id IN (
+                SELECT trace_id FROM trace_span
+                WHERE parent_id IS NULL AND started_at < ?
+            )
+        """,
+        (older_than,),
+    ).fetchone()[0]
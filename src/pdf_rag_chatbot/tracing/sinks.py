@@ -0,0 +1,69 @@
+import os
+from typing import Any, Dict, List
+
+import orjson
+
+from pdf_rag_chatbot.db.connection import warehouse
+
+
+class TraceSink:
+    """Where finished spans are written."""
+
+    def write(self, records: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+
+class JSONLTraceSink(TraceSink):
+    def __init__(self, path: str):
+        """Append spans to a JSONL file, one object per span."""
+        self.path = path
+
+    def write(self, records: List[Dict[str, Any]]):
+        with open(self.path, "ab") as f:
+            f.write(b"".join(orjson.dumps(record) + b"\n" for record in records))
+
+
+class DuckDBTraceSink(TraceSink):
+    def __init__(self, database: str):
+        """Insert spans into the warehouse's `trace_span` table.
+
+        The warehouse is opened for each write, so the sink doesn't hold it
+        while ingest workers wait for it.
+        """
+        self.database = database
+
+    def write(self, records: List[Dict[str, Any]]):
+        with warehouse(self.database) as db:
+            db.executemany(
+                """--sql
+                    INSERT INTO trace_span (
+                        trace_id,
+                        span_id,
+                        parent_id,
+                        name,
+                        started_at,
+                        duration_ms,
+                        attributes,
+                        error
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?::JSON, ?)
+                """,
+                [
+                    (
+                        r["trace_id"],
+                        r["span_id"],
+                        r["parent_id"],
+                        r["name"],
+                        r["started_at"],
+                        r["duration_ms"],
+                        orjson.dumps(r["attributes"]).decode(),
+                        r["error"],
+                    )
+                    for r in records
+                ],
+            )
+
+
+def default_trace_path(database: str) -> str:
+    """The JSONL trace file next to a warehouse."""
+    return f"{os.path.splitext(database)[0]}.traces.jsonl"
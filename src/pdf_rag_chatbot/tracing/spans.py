@@ -0,0 +1,171 @@
+import time
+import uuid
+import queue
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from pdf_rag_chatbot.tracing.sinks import TraceSink
+
+
+class Span:
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        """A timed stage of a chat turn.
+
+        Spans are written to the tracer's sink when they end, with their
+        attributes, such as row, candidate and token counts.
+        """
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._ended = False
+
+    def set(self, **attributes: Any):
+        """Set attributes of the span."""
+        self.attributes.update(attributes)
+
+    def add(self, **counts: float):
+        """Add to counting attributes of the span, such as tokens over several LLM calls."""
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def open(self, name: str, **attributes: Any) -> "Span":
+        """Start a child span, which must be ended with `end`."""
+        return Span(self.tracer, name, self.trace_id, self.span_id, attributes)
+
+    @contextmanager
+    def child(self, name: str, **attributes: Any) -> Iterator["Span"]:
+        """Time a block as a child span, which is the current span within the block.
+
+        The block must not yield to other contexts, as a generator's `yield` may.
+        Use `open` for stages that span a `yield`.
+        """
+        span = self.open(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def end(self, error: Optional[str] = None):
+        if self._ended:
+            return
+        self._ended = True
+        self.error = error or self.error
+        self.tracer._record({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": 1000 * (time.perf_counter() - self._start),
+            "attributes": self.attributes,
+            "error": self.error,
+        })
+
+
+class _NullSpan:
+    """Stands in for a span when tracing is off."""
+
+    def set(self, **attributes: Any):
+        pass
+
+    def add(self, **counts: float):
+        pass
+
+    def open(self, name: str, **attributes: Any) -> "_NullSpan":
+        return self
+
+    def child(self, name: str, **attributes: Any) -> ContextManager["_NullSpan"]:
+        return nullcontext(self)
+
+    def end(self, error: Optional[str] = None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | _NullSpan:
+    """The innermost span of the current context, or a no-op span outside of one."""
+    return _current_span.get() or NULL_SPAN
+
+
+def span(name: str, **attributes: Any) -> ContextManager[Span | _NullSpan]:
+    """Time a block as a child of the current span. Does nothing outside of a span."""
+    return current_span().child(name, **attributes)
+
+
+class Tracer:
+    def __init__(self, sink: TraceSink, flush_interval: float = 5.0, max_batch: int = 1000):
+        """Record spans to a sink from a background thread, off the request path.
+
+        Args:
+            sink (TraceSink): Where spans are written.
+            flush_interval (float, optional): Seconds between writes. Defaults to 5.0.
+            max_batch (int, optional): Spans written at a time. Defaults to 1000.
+        """
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def start(self, name: str, **attributes: Any) -> Span:
+        """Start the root span of a new trace, which must be ended with `end`."""
+        return Span(self, name, uuid.uuid4().hex, attributes=attributes)
+
+    def close(self):
+        """Write the remaining spans and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _record(self, record: Dict[str, Any]):
+        self._queue.put(record)
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            records: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(records) < self.max_batch:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                records.append(record)
+
+            if not records:
+                continue
+            try:
+                self.sink.write(records)
+            except Exception as e:
+                logger.warning(f"Dropped {len(records)} trace spans: {e}")
@@ -0,0 +1,31 @@
+from typing import Any, Tuple
+
+from pdf_rag_chatbot.tracing.spans import current_span
+
+
+def token_usage(message: Any) -> Tuple[int, int]:
+    """The prompt and completion tokens of a chat model's reply, or zeros if it doesn't say.
+
+    Newer LangChain models report `usage_metadata`, older OpenAI wrappers report
+    `token_usage` and Ollama reports eval counts in the response metadata.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    metadata = getattr(message, "response_metadata", None) or {}
+    if "token_usage" in metadata:
+        usage = metadata["token_usage"] or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    return metadata.get("prompt_eval_count", 0), metadata.get("eval_count", 0)
+
+
+def record_llm_usage(message: Any):
+    """Add an LLM call and its tokens to the current span."""
+    prompt_tokens, completion_tokens = token_usage(message)
+    current_span().add(
+        llm_calls=1,
+        prompt_tokens=prompt_tokens or 0,
+        completion_tokens=completion_tokens or 0,
+    )